@@ -0,0 +1,60 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.bulk_load import STRATEGIES, bulk_insert
+from src.load_data import create_warehouse_engine
+
+
+# Fact-shaped frame with the same column types as fact_order_items
+def make_fact_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(5, 500, rows).round(2)
+    freight = rng.uniform(0, 50, rows).round(2)
+    return pd.DataFrame({
+        'order_id': pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, rows)], dtype='string'),
+        'order_item_id': pd.Series(rng.integers(1, 5, rows), dtype='Int64'),
+        'product_id': pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, rows)], dtype='string'),
+        'seller_id': pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, rows)], dtype='string'),
+        'customer_id': pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, rows)], dtype='string'),
+        'purchase_date_id': rng.integers(20160101, 20181231, rows),
+        'delivery_date_id': rng.integers(20160101, 20181231, rows),
+        'price': price,
+        'freight_value': freight,
+        'total_price': price + freight,
+        'profit_margin': price - freight,
+        'delivery_time': rng.integers(0, 60, rows),
+        'payment_installments': pd.Series(rng.integers(1, 10, rows), dtype='Int64')
+    })
+
+
+# Reports rows/sec per strategy and chunk size against a local SQLite database
+def bench_bulk_load(rows, chunksizes):
+    df = make_fact_frame(rows)
+    print(f"{'strategy':<20}{'chunksize':>10}{'seconds':>10}{'rows/s':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for strategy in STRATEGIES:
+            for chunksize in chunksizes:
+                engine = create_warehouse_engine(f"sqlite:///{Path(tmp_dir) / f'{strategy}_{chunksize}.db'}")
+                start = time.perf_counter()
+                bulk_insert(df, 'fact_order_items', engine, strategy=strategy, chunksize=chunksize,
+                            if_exists='replace')
+                elapsed = time.perf_counter() - start
+                engine.dispose()
+                print(f"{strategy:<20}{chunksize:>10}{elapsed:>10.2f}{rows / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--chunksizes', type=int, nargs='+', default=[100, 1_000, 50_000])
+    args = parser.parse_args()
+    bench_bulk_load(args.rows, args.chunksizes)
@@ -0,0 +1,86 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from generate_olist import generate
+
+MAIN = ROOT / 'src' / 'main.py'
+HEAVY_MODULES = ['pandas', 'pyarrow', 'pandera', 'sqlalchemy', 'duckdb']
+
+
+def _import_times(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | name", nested imports indented under their parent
+    total_us, modules = 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules.add(name.strip())
+        if not name.startswith('  '):
+            total_us += int(cumulative)
+    return total_us / 1e6, [module for module in HEAVY_MODULES if module in modules]
+
+
+def time_command(command, cwd, repeat):
+    # Each run in a fresh interpreter, so every import is a cold one
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-X', 'importtime', *command], cwd=cwd, capture_output=True,
+                                   text=True)
+        wall_s = time.perf_counter() - start
+        if completed.returncode:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{completed.stderr[-3000:]}")
+        runs.append((wall_s, *_import_times(completed.stderr)))
+    return {
+        'wall_s': statistics.median(run[0] for run in runs),
+        'import_s': statistics.median(run[1] for run in runs),
+        'heavy_modules': runs[-1][2]
+    }
+
+
+# Times each subcommand against a warm stage cache: one full run first, then every subcommand in a fresh process.
+# The baseline is what main.py imported before it had subcommands, whatever it was asked to do.
+def bench_cli(scale, seed, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        generate(work_dir / 'data' / 'raw', scale, seed)
+        (work_dir / 'src').mkdir()
+        connection = ['--connection', f"sqlite:///{work_dir / 'warehouse.db'}"]
+        subprocess.run([sys.executable, str(MAIN), 'run', *connection], cwd=work_dir / 'src', check=True,
+                       capture_output=True)
+
+        commands = {
+            'baseline imports': ['-c', f"import sys; sys.path.insert(0, {str(ROOT)!r}); "
+                                       f"import src.etl_processing, src.load_data"],
+            '--help': [str(MAIN), '--help'],
+            'extract': [str(MAIN), 'extract'],
+            'extract --datasets customers': [str(MAIN), 'extract', '--datasets', 'customers'],
+            'transform': [str(MAIN), 'transform'],
+            'windows': [str(MAIN), 'windows'],
+            'load': [str(MAIN), 'load', *connection],
+            'run': [str(MAIN), 'run', *connection]
+        }
+        results = {name: time_command(command, work_dir / 'src', repeat) for name, command in commands.items()}
+
+    print(f"\nscale {scale}x, warm stage cache, median of {repeat} fresh processes")
+    print(f"{'command':<32}{'wall_s':>9}{'import_s':>10}  heavy modules imported")
+    for name, result in results.items():
+        print(f"{name:<32}{result['wall_s']:>9.2f}{result['import_s']:>10.2f}  {', '.join(result['heavy_modules'])}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    bench_cli(args.scale, args.seed, args.repeat)
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench_window_functions import make_frames
+
+# DuckDB spills into a scratch directory for the benchmark rather than ../data/tmp
+os.environ.setdefault('OLIST_DUCKDB_TEMP_DIR', str(Path(tempfile.gettempdir()) / 'olist_duckdb'))
+
+from src import duckdb_engine
+from src.etl_processing import ROLLING_WINDOWS, create_window_functions, enrich_order_items
+
+
+# Payments shaped like the processed payments output: one to three rows per order, some orders unpaid
+def make_payments(orders, seed=0):
+    rng = np.random.default_rng(seed)
+    order_keys = orders['order_key'].to_numpy()
+    paid = order_keys[rng.random(len(order_keys)) > 0.02]
+    order_key = np.repeat(paid, rng.integers(1, 4, len(paid)))
+    return pd.DataFrame({
+        'order_key': order_key,
+        'payment_installments': pd.array(rng.integers(1, 11, len(order_key)), dtype='Int64')
+    })
+
+
+def _timed(func, args, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Columns rounded to 2 decimals after the window is computed
+ROUNDED = ['percent_of_total', 'category_mean', *(f'rolling_avg_{window_size}d' for window_size in ROLLING_WINDOWS)]
+
+
+# Equal up to float summation order: DuckDB accumulates windowed sums and means in its own order, so a
+# value that lands on a rounding boundary can round to the neighbouring hundredth
+def assert_parity(actual, expected):
+    actual, expected = actual.reset_index(drop=True), expected.reset_index(drop=True)
+    rounded = [col for col in ROUNDED if col in expected.columns]
+    pd.testing.assert_frame_equal(actual.drop(columns=rounded), expected.drop(columns=rounded),
+                                  check_exact=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(actual[rounded], expected[rounded], check_exact=False, rtol=0, atol=0.0100001)
+
+
+# Times each transform on both engines and checks that they produce the same frames
+def bench_duckdb(scale, repeat):
+    orders, items, customers, products = make_frames(scale)
+    payments = make_payments(orders)
+    print(f"scale {scale}x: {len(items):,} order items, {len(orders):,} orders, {len(payments):,} payments")
+
+    cases = {
+        'enrich_order_items': (enrich_order_items, duckdb_engine.enrich_order_items, (items, orders, payments)),
+        'create_window_functions': (
+            lambda *frames: create_window_functions(*frames),
+            lambda *frames: duckdb_engine.create_window_functions(*frames, ROLLING_WINDOWS),
+            (orders, items, customers, products)
+        )
+    }
+    print(f"{'transform':<28}{'pandas_s':>10}{'duckdb_s':>10}{'ratio':>8}")
+    for name, (pandas_func, duckdb_func, args) in cases.items():
+        pandas_time, expected = _timed(pandas_func, args, repeat)
+        duckdb_time, actual = _timed(duckdb_func, args, repeat)
+        if isinstance(expected, dict):
+            for output in expected:
+                assert_parity(actual[output], expected[output])
+        else:
+            assert_parity(actual, expected)
+        print(f"{name:<28}{pandas_time:>10.2f}{duckdb_time:>10.2f}{pandas_time / duckdb_time:>8.2f}")
+    print("outputs equal")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    bench_duckdb(args.scale, args.repeat)
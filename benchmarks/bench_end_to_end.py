@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from generate_olist import generate
+
+
+def _peak_rss_mb(who):
+    import resource
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+# One scale factor in a fresh process: generate the files, run the ETL stages of the outputs (default: all) and,
+# if they include the fact table and the dimensions, load a SQLite warehouse. The src modules resolve ../data
+# and ../logs against the working directory, so they are imported only after changing into the scratch tree.
+def run_scale(scale, seed, workers, outputs=None):
+    import resource
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        start = time.perf_counter()
+        raw_rows = generate(work_dir / 'data' / 'raw', scale, seed)
+        generate_s = time.perf_counter() - start
+
+        (work_dir / 'src').mkdir()
+        os.chdir(work_dir / 'src')
+        from src import instrumentation
+        from src.etl_processing import run_etl, setup_logging
+        from src.load_data import load_to_sql_server
+
+        logger = setup_logging()
+        start = time.perf_counter()
+        processed_dfs = run_etl(logger, max_workers=workers, force=True, use_cache=False, outputs=outputs)
+        etl_s = time.perf_counter() - start
+        processed_mb = sum(df.memory_usage(deep=True).sum() for df in processed_dfs.values()) / 1024 ** 2
+        start = time.perf_counter()
+        load_stats = None
+        if outputs is None or {'fact', 'dimensions'} <= set(outputs):
+            load_stats = load_to_sql_server(processed_dfs, f"sqlite:///{work_dir / 'warehouse.db'}", logger)
+        load_s = time.perf_counter() - start
+        os.chdir(ROOT)
+
+        steps = [
+            {key: record.get(key) for key in ('step', 'kind', 'rows_in', 'rows_out', 'wall_s', 'peak_rss_delta_mb')}
+            for record in instrumentation.records()
+            if record['kind'] == 'stage' or (record['stage'] is None and record['kind'] in ('transform', 'load'))
+        ]
+        return {
+            'scale': scale,
+            'outputs': outputs or 'all',
+            'raw_rows': sum(raw_rows.values()),
+            'generate_s': round(generate_s, 2),
+            'etl_s': round(etl_s, 2),
+            'load_s': round(load_s, 2),
+            'loaded_rows': sum(stats['inserted'] for stats in (load_stats or {}).values()),
+            'processed_mb': round(processed_mb, 1),
+            'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+            'worker_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'steps': steps
+        }
+
+
+def _rate(rows, seconds):
+    return f"{rows / seconds:,.0f}" if rows and seconds else '-'
+
+
+def print_result(result):
+    print(f"\nscale {result['scale']}x, outputs {result['outputs']}: {result['raw_rows']:,} raw rows "
+          f"(generated in {result['generate_s']}s)")
+    print(f"{'step':<44}{'rows':>12}{'seconds':>10}{'rows/s':>14}{'rss_delta_mb':>14}")
+    for step in result['steps']:
+        rows = step['rows_out'] or step['rows_in'] or 0
+        print(f"{step['step']:<44}{rows:>12,}{step['wall_s']:>10.2f}{_rate(rows, step['wall_s']):>14}"
+              f"{step['peak_rss_delta_mb'] if step['peak_rss_delta_mb'] is not None else '-':>14}")
+    print(f"etl {result['etl_s']}s ({_rate(result['raw_rows'], result['etl_s'])} raw rows/s), "
+          f"load {result['load_s']}s ({_rate(result['loaded_rows'], result['load_s'])} rows/s), "
+          f"peak RSS {result['peak_rss_mb']} MB main / {result['worker_peak_rss_mb']} MB largest worker, "
+          f"processed frames {result['processed_mb']} MB")
+
+
+# Runs each scale factor in its own process, so peak RSS figures don't carry over between scales
+def bench_end_to_end(scales, seed, workers, output=None, outputs=None):
+    results = []
+    for scale in scales:
+        command = [sys.executable, __file__, '--run-scale', str(scale), '--seed', str(seed)]
+        if workers:
+            command += ['--workers', str(workers)]
+        if outputs:
+            command += ['--outputs', *outputs]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode:
+            raise RuntimeError(f"Scale {scale} failed:\n{completed.stderr[-3000:]}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print_result(result)
+        results.append(result)
+
+    print(f"\n{'scale':>8}{'raw_rows':>14}{'etl_s':>10}{'load_s':>10}{'rows/s':>14}{'peak_mb':>10}{'worker_mb':>11}")
+    for result in results:
+        total_s = result['etl_s'] + result['load_s']
+        print(f"{result['scale']:>8}{result['raw_rows']:>14,}{result['etl_s']:>10.2f}{result['load_s']:>10.2f}"
+              f"{_rate(result['raw_rows'], total_s):>14}{result['peak_rss_mb']:>10}{result['worker_peak_rss_mb']:>11}")
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.1, 1])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', type=Path, default=None, help="Write the results as JSON to this file")
+    parser.add_argument('--outputs', nargs='+', default=None,
+                        help="ETL outputs to build (see OUTPUT_COLUMNS in src/etl_processing.py; default: all)")
+    parser.add_argument('--run-scale', type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_scale is not None:
+        print(json.dumps(run_scale(args.run_scale, args.seed, args.workers, args.outputs)))
+    else:
+        bench_end_to_end(args.scales, args.seed, args.workers, args.output, args.outputs)
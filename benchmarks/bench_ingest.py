@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT / 'src')
+
+from src.etl_processing import INPUT_DIR
+from src.ingest import read_csv
+from src.models.data_schemas import SCHEMAS
+
+
+# The read ingestion replaced: pandas' C parser with the string dtypes, then a second to_datetime pass
+# over the same columns in the process_* functions
+def read_csv_pandas(path, schema):
+    dtype = {col: 'string' if dtype == 'category' else dtype for col, dtype in schema.get('dtype', {}).items()}
+    parse_dates = schema.get('parse_dates')
+    df = pd.read_csv(path, dtype=dtype, parse_dates=parse_dates)
+    for col in parse_dates or []:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+READERS = {
+    'pandas': read_csv_pandas,
+    'pyarrow': read_csv
+}
+
+
+def _best(func, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Read time and in-memory frame size per raw file and reader
+def bench_ingest(repeat):
+    print(f"{'dataset':<42}{'reader':<10}{'read_s':>10}{'frame_mb':>10}")
+    for filename, schema in SCHEMAS.items():
+        path = INPUT_DIR / filename
+        if not path.exists():
+            continue
+        for name, reader in READERS.items():
+            seconds, df = _best(lambda: reader(path, schema), repeat)
+            frame_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+            print(f"{filename:<42}{name:<10}{seconds:>10.4f}{frame_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    bench_ingest(args.repeat)
@@ -0,0 +1,97 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from generate_olist import generate
+
+# Parameter sets each report is served with
+PARAMS = [
+    {},
+    {'state': 'SP'},
+    {'start_date': '2017-01-01', 'end_date': '2017-12-31'},
+    {'start_date': '2018-01-01', 'state': 'RJ'}
+]
+
+
+def _timed(func, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def assert_same_report(actual, expected):
+    # Summary and fact-table answers agree up to float summation order
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+# Loads a SQLite warehouse from synthetic data, then times each report cold (fact table), from its summary
+# table and from the result cache, and checks that a new load invalidates the cached results
+def bench_reports(scale, seed, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        generate(work_dir / 'data' / 'raw', scale, seed)
+        (work_dir / 'src').mkdir()
+        os.chdir(work_dir / 'src')
+        from src.etl_processing import run_etl, setup_logging
+        from src.load_data import load_to_sql_server
+        from src.reports import REPORTS, ReportService
+
+        logger = setup_logging()
+        logger.setLevel(logging.WARNING)
+        connection_string = f"sqlite:///{work_dir / 'warehouse.db'}"
+        processed_dfs = run_etl(logger, force=True, use_cache=False)
+        load_to_sql_server(processed_dfs, connection_string, logger)
+
+        service = ReportService(connection_string, logger=logger)
+        print(f"scale {scale}x: {len(processed_dfs['olist_order_items_dataset.csv']):,} fact rows")
+        print(f"{'report':<18}{'params':<56}{'source':<9}{'fact_s':>9}{'first_s':>9}{'cached_s':>10}{'rows':>7}")
+        for name in REPORTS:
+            for params in PARAMS:
+                fact_s, expected = _timed(lambda: service.run(name, summary=False, **params), 1)
+                first_s, actual = _timed(lambda: service.run(name, **params), 1)
+                cached_s, cached = _timed(lambda: service.run(name, **params), repeat)
+                assert_same_report(actual, expected)
+                assert_same_report(cached, actual)
+                source = 'summary' if set(params) <= set(REPORTS[name]['summary_filters']) else 'fact'
+                print(f"{name:<18}{str(params):<56}{source:<9}{fact_s:>9.4f}{first_s:>9.4f}{cached_s:>10.5f}"
+                      f"{len(actual):>7}")
+        print(f"cache: {service.cache.hits} hits, {service.cache.misses} misses, "
+              f"{len(service.cache.entries)} entries, {service.cache.size / 1024:.0f} KB")
+
+        # A second load bumps the load version, so the next call misses and sees the new data
+        misses = service.cache.misses
+        order_items = processed_dfs['olist_order_items_dataset.csv']
+        order_items['price'] *= 2
+        order_items['total_price'] = order_items['price'] + order_items['freight_value']
+        before = service.run('category_sales')
+        load_to_sql_server(processed_dfs, connection_string, logger)
+        after = service.run('category_sales')
+        assert service.cache.misses == misses + 1, "the reload did not invalidate the cached report"
+        assert not np.allclose(before['total_sales'], after['total_sales'])
+        assert_same_report(after, service.run('category_sales', summary=False))
+        service.close()
+        os.chdir(ROOT)
+        print("summary and fact results equal; reload invalidated the cache")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+    bench_reports(args.scale, args.seed, args.repeat)
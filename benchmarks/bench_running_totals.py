@@ -0,0 +1,88 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench_window_functions import make_frames
+from src.enrichment import attach_order_columns
+from src.running_totals import CustomerSalesState, customer_items, customer_sales, read_customer_sales
+from src.storage import frame_path, write_frame
+
+# make_frames spreads the purchases over two years
+DAYS = 730
+
+
+def _by_purchase(orders, items):
+    # order_key in purchase order, like the keys the registry hands out as new orders arrive
+    rank = np.empty(len(orders), dtype=np.int64)
+    rank[np.argsort(orders['order_purchase_timestamp'].to_numpy(), kind='stable')] = np.arange(1, len(orders) + 1)
+    orders['order_key'] = rank
+    items['order_key'] = rank[items['order_key'].to_numpy() - 1]
+    return orders, attach_order_columns(items, orders)
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def _write(outputs, output_dir):
+    for name, df in outputs.items():
+        write_frame(df, frame_path(output_dir, f"window_{name}"))
+
+
+# Brings the customer_sales state up to the orders of all but the last N days, then times the refresh for those days
+# against a full recompute of every item (each including the writes of the outputs) and checks that the outputs
+# read back agree exactly. The state's delta is merged back when it grows past COMPACT_FRACTION, and deltas above
+# REBUILD_FRACTION of the history fall back to the full recompute.
+def bench_running_totals(scale, delta_days):
+    orders, items, customers, _ = make_frames(scale)
+    orders, items = _by_purchase(orders, items)
+    print(f"scale {scale}x: {len(items):,} order items, {len(orders):,} orders")
+    print(f"{'delta':<10}{'new items':>11}{'changed rows':>14}{'full_s':>9}{'incremental_s':>15}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        full_dir = Path(tmp_dir) / 'full'
+        full_dir.mkdir()
+        full_path = frame_path(full_dir, 'window_customer_sales')
+        full_s, _ = _timed(lambda: write_frame(customer_sales(customer_items(items, customers)), full_path))
+        expected = pd.read_parquet(full_path)
+
+        for days in delta_days:
+            output_dir = Path(tmp_dir) / f"output_{days}"
+            output_dir.mkdir()
+            state_dir = Path(tmp_dir) / f"state_{days}"
+            cutoff = len(orders) - len(orders) * days // DAYS
+            history = items[items['order_key'] <= cutoff]
+            state = CustomerSalesState(state_dir, output_dir)
+            _write(state.refresh(history, customers), output_dir)
+            state.save()
+
+            def refresh():
+                state = CustomerSalesState(state_dir, output_dir)
+                outputs = state.refresh(items, customers)
+                _write(outputs, output_dir)
+                state.save()
+                return outputs['customer_sales_changes']
+
+            incremental_s, changes = _timed(refresh)
+            pd.testing.assert_frame_equal(read_customer_sales(output_dir), expected, check_exact=True)
+            print(f"{f'{days} days':<10}{len(items) - len(history):>11,}{len(changes):>14,}{full_s:>9.2f}"
+                  f"{incremental_s:>15.2f}")
+    print("outputs identical")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--days', type=int, nargs='+', default=[1, 7, 30])
+    args = parser.parse_args()
+    bench_running_totals(args.scale, args.days)
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT / 'src')
+
+from src.etl_processing import INPUT_DIR, PROCESSORS, read_dataset
+from src.models.data_schemas import SCHEMAS
+from src.storage import EXTENSIONS, frame_path, read_frame, write_frame
+
+REPEATS = 3
+
+
+# Compares write time, read time and file size of each output format on the processed datasets
+def bench_storage():
+    frames = {}
+    for filename, process in PROCESSORS.items():
+        if (INPUT_DIR / filename).exists():
+            frames[filename] = process(read_dataset(filename))
+
+    print(f"{'dataset':<42}{'format':<10}{'write_s':>10}{'read_s':>10}{'size_kb':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for filename, df in frames.items():
+            # CSV has to be re-parsed with the SCHEMAS types to get comparable frames back
+            schema = SCHEMAS[filename]
+            for fmt in EXTENSIONS:
+                path = frame_path(tmp_dir, filename, fmt)
+
+                start = time.perf_counter()
+                for _ in range(REPEATS):
+                    write_frame(df, path, fmt)
+                write_s = (time.perf_counter() - start) / REPEATS
+
+                start = time.perf_counter()
+                for _ in range(REPEATS):
+                    read_frame(path, fmt=fmt, dtype=schema.get('dtype'), parse_dates=schema.get('parse_dates'))
+                read_s = (time.perf_counter() - start) / REPEATS
+
+                size_kb = path.stat().st_size / 1024
+                print(f"{filename:<42}{fmt:<10}{write_s:>10.4f}{read_s:>10.4f}{size_kb:>12.1f}")
+
+
+if __name__ == "__main__":
+    bench_storage()
@@ -0,0 +1,115 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src import quarantine, validation
+from src.chunked import concat_chunks
+from src.models.olist_model import OlistGeolocationModel, OlistOrderItemsModel, OlistOrderReviewsModel
+from src.quarantine import REASON_COLUMN
+from src.validation import VALIDATION_LEVELS, compile_model, validate
+
+
+def _hex_ids(count, rng, unique=False):
+    values = np.arange(count) * 7919 + 10 ** 12 if unique else rng.integers(0, 2 ** 62, count)
+    return pd.Series([f"{i:032x}" for i in values], dtype='string')
+
+
+# Frames with the dtypes the process_* functions hand to validation
+def make_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 700 * 86_400, rows), unit='s')
+    return {
+        OlistGeolocationModel: pd.DataFrame({
+            'geolocation_zip_code_prefix': pd.Series(rng.integers(1000, 99_999, rows), dtype='Int64'),
+            'geolocation_lat': rng.uniform(-33, 5, rows),
+            'geolocation_lng': rng.uniform(-73, -35, rows),
+            'geolocation_city': pd.Series(rng.choice(['sao paulo', 'rio de janeiro', 'curitiba'], rows),
+                                          dtype='string'),
+            'geolocation_state': pd.Series(rng.choice(['SP', 'RJ', 'PR'], rows), dtype='category')
+        }),
+        OlistOrderItemsModel: pd.DataFrame({
+            'order_id': _hex_ids(rows, rng),
+            'order_item_id': pd.Series(rng.integers(1, 5, rows), dtype='Int64'),
+            'product_id': _hex_ids(rows, rng),
+            'seller_id': _hex_ids(rows, rng),
+            'shipping_limit_date': timestamps,
+            'price': rng.uniform(5, 500, rows).round(2),
+            'freight_value': rng.uniform(0, 50, rows).round(2)
+        }),
+        OlistOrderReviewsModel: pd.DataFrame({
+            'review_id': _hex_ids(rows, rng, unique=True),
+            'order_id': _hex_ids(rows, rng),
+            'review_score': pd.Series(rng.integers(1, 6, rows), dtype='Int64'),
+            'review_comment_title': pd.Series(['no title'] * rows, dtype='string'),
+            'review_comment_message': pd.Series(['no comment'] * rows, dtype='string'),
+            'review_creation_date': timestamps,
+            'review_answer_timestamp': timestamps
+        })
+    }
+
+
+def _seconds(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+# Seconds per model for pandera, each compiled level, and a repeat call answered from the validation cache
+def bench_validation(rows):
+    frames = make_frames(rows)
+    columns = ['pandera', *VALIDATION_LEVELS, 'cached']
+    print(f"{rows:,} rows per model")
+    print(f"{'model':<26}" + ''.join(f"{column:>10}" for column in columns))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        validation.VALIDATION_CACHE_DIR = Path(tmp_dir)
+        for model, df in frames.items():
+            compile_model(model)
+            timings = [_seconds(lambda: model.validate(df))]
+            timings += [_seconds(lambda: validate(model, df, level=level, use_cache=False))
+                        for level in VALIDATION_LEVELS]
+            validate(model, df, level='full', use_cache=True)
+            timings.append(_seconds(lambda: validate(model, df, level='full', use_cache=True)))
+            print(f"{model.__name__:<26}" + ''.join(f"{seconds:>10.3f}" for seconds in timings))
+
+
+# Breaks a few review rows and checks that quarantine mode sets exactly those aside, with their reasons
+def check_quarantine(rows):
+    df = make_frames(rows)[OlistOrderReviewsModel]
+    df.loc[[1, 5], 'review_score'] = 9
+    df.loc[5, 'review_creation_date'] = pd.NaT
+    df.loc[7, 'review_id'] = df.loc[3, 'review_id']
+    try:
+        validate(OlistOrderReviewsModel, df, use_cache=False, failures='raise')
+        raise AssertionError("the broken rows passed validation")
+    except validation.pa.errors.SchemaError:
+        pass
+
+    quarantine.reset()
+    seconds = _seconds(lambda: validate(OlistOrderReviewsModel, df, use_cache=False, failures='quarantine'))
+    clean = validate(OlistOrderReviewsModel, df, use_cache=False, failures='quarantine')
+    rejected = concat_chunks(quarantine._quarantined)
+    quarantine.reset()
+    assert rejected['review_id'].tolist() == df.loc[[1, 5, 7, 1, 5, 7], 'review_id'].tolist()
+    reasons = rejected[REASON_COLUMN].tolist()[:3]
+    assert reasons[0].startswith('review_score failed less_than_or_equal_to'), reasons
+    assert sorted(reasons[1].split('; ')) == ['review_creation_date is null', reasons[0]], reasons
+    assert reasons[2] == 'review_id is a duplicate', reasons
+    assert len(clean) == rows - 3
+    validate(OlistOrderReviewsModel, clean, use_cache=False, failures='raise')
+    print(f"quarantined {len(rejected) // 2} of {rows:,} rows in {seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    bench_validation(args.rows)
+    check_quarantine(args.rows)
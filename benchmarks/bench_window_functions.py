@@ -0,0 +1,150 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.etl_processing import create_window_functions
+
+# Row counts of the public Olist dataset; --scale multiplies them
+OLIST_ORDERS = 99_441
+OLIST_ITEMS = 112_650
+OLIST_PRODUCTS = 32_951
+CATEGORIES = 73
+
+
+def _hex_ids(count, rng):
+    return pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, count)], dtype='string')
+
+
+# Frames shaped like the processed orders / order items / customers / products outputs
+def make_frames(scale, seed=0):
+    rng = np.random.default_rng(seed)
+    n_orders = int(OLIST_ORDERS * scale)
+    n_items = int(OLIST_ITEMS * scale)
+    n_products = int(OLIST_PRODUCTS * min(scale, 3))
+    n_unique = int(n_orders * 0.96)
+
+    purchase = pd.Timestamp('2016-09-01') + pd.to_timedelta(rng.integers(0, 2 * 365 * 86_400, n_orders), unit='s')
+    delivered = purchase + pd.to_timedelta(rng.integers(-86_400, 40 * 86_400, n_orders), unit='s')
+    delivered = delivered.where(rng.random(n_orders) > 0.03)
+    order_ids = _hex_ids(n_orders, rng)
+    customer_ids = _hex_ids(n_orders, rng)
+    orders = pd.DataFrame({
+        'order_key': np.arange(1, n_orders + 1),
+        'order_id': order_ids,
+        'customer_key': np.arange(1, n_orders + 1),
+        'customer_id': customer_ids,
+        'order_purchase_timestamp': purchase,
+        'order_delivered_customer_date': delivered
+    })
+    customers = pd.DataFrame({
+        'customer_key': np.arange(1, n_orders + 1),
+        'customer_id': customer_ids,
+        'customer_unique_key': rng.integers(1, n_unique + 1, n_orders)
+    })
+    customers['customer_unique_id'] = _hex_ids(n_unique, rng).to_numpy()[customers['customer_unique_key'] - 1]
+    products = pd.DataFrame({
+        'product_key': np.arange(1, n_products + 1),
+        'product_id': _hex_ids(n_products, rng),
+        'product_category_name': pd.Series([f"category_{i}" for i in rng.integers(0, CATEGORIES, n_products)],
+                                           dtype='string')
+    })
+    order_keys = rng.integers(1, n_orders + 1, n_items)
+    product_keys = rng.integers(1, n_products + 1, n_items)
+    items = pd.DataFrame({
+        'order_key': order_keys,
+        'order_id': order_ids.to_numpy()[order_keys - 1],
+        'product_key': product_keys,
+        'product_id': products['product_id'].to_numpy()[product_keys - 1],
+        'shipping_limit_date': purchase[order_keys - 1] + pd.Timedelta(days=3),
+        'price': rng.uniform(5, 500, n_items).round(2)
+    })
+    return orders, items, customers, products
+
+
+# The groupby/transform(lambda) implementation create_window_functions replaced, joining on the ids as it did,
+# kept for parity checks
+def reference_window_functions(orders_df, order_items_df, customers_df, products_df):
+    results = {}
+    customer_orders = (
+        order_items_df
+        .merge(orders_df[['order_id', 'customer_id']], on='order_id')
+        .merge(customers_df[['customer_id', 'customer_unique_id']], on='customer_id')
+        .sort_values(['customer_unique_id', 'shipping_limit_date'])
+    )
+    customer_orders['cumulative_sales'] = customer_orders.groupby('customer_unique_id')['price'].cumsum()
+    customer_orders['total_customer_sales'] = customer_orders.groupby('customer_unique_id')['price'].transform('sum')
+    customer_orders['percent_of_total'] = (
+            customer_orders['cumulative_sales'] / customer_orders['total_customer_sales'] * 100).round(2)
+    customer_orders['price_rank'] = customer_orders.groupby('customer_unique_id')['price'].rank(method='dense',
+                                                                                                ascending=False)
+    results['customer_sales'] = customer_orders[[
+        'customer_unique_id', 'order_id', 'price',
+        'cumulative_sales', 'total_customer_sales', 'percent_of_total', 'price_rank'
+    ]]
+
+    orders_with_delivery = orders_df.dropna(subset=['order_delivered_customer_date', 'order_purchase_timestamp']).copy()
+    orders_with_delivery['delivery_time_days'] = (
+            (orders_with_delivery['order_delivered_customer_date'] - orders_with_delivery['order_purchase_timestamp'])
+            .dt.total_seconds() / (60 * 60 * 24)
+    )
+    valid_orders = orders_with_delivery[orders_with_delivery['delivery_time_days'] > 0]
+    category_delivery = (
+        order_items_df[['order_id', 'product_id']]
+        .merge(products_df[['product_id', 'product_category_name']], on='product_id')
+        .merge(valid_orders[['order_id', 'delivery_time_days']], on='order_id')
+    )
+    category_delivery = category_delivery.sort_values(['product_category_name', 'delivery_time_days'])
+    for window_size in [3, 7, 14]:
+        column_name = f'rolling_avg_{window_size}d'
+        category_delivery[column_name] = (
+            category_delivery
+            .groupby('product_category_name')['delivery_time_days']
+            .transform(lambda x: x.rolling(window=window_size, min_periods=1).mean().round(2))
+        )
+    category_delivery['category_mean'] = (
+        category_delivery
+        .groupby('product_category_name')['delivery_time_days']
+        .transform('mean')
+        .round(2)
+    )
+    results['category_delivery_time'] = category_delivery
+    return results
+
+
+def _timed(func, frames, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*frames)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_window_functions(scale, repeat):
+    frames = make_frames(scale)
+    print(f"scale {scale}x: {len(frames[1]):,} order items, {len(frames[0]):,} orders")
+
+    reference_time, expected = _timed(reference_window_functions, frames, repeat)
+    engine_time, actual = _timed(create_window_functions, frames, repeat)
+    for name in expected:
+        pd.testing.assert_frame_equal(actual[name], expected[name], check_exact=True)
+
+    print(f"{'implementation':<20}{'seconds':>10}")
+    print(f"{'groupby/lambda':<20}{reference_time:>10.2f}")
+    print(f"{'window engine':<20}{engine_time:>10.2f}")
+    print(f"speedup {reference_time / engine_time:.1f}x, outputs identical")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    bench_window_functions(args.scale, args.repeat)
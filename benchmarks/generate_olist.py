@@ -0,0 +1,294 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.models.data_schemas import TIMESTAMP_FORMAT
+
+# Row counts of the public Olist dataset; every file but the category translation scales with --scale
+OLIST_ROWS = {
+    'customers': 99_441,
+    'geolocation': 1_000_163,
+    'products': 32_951,
+    'sellers': 3_095
+}
+ITEMS_PER_ORDER = [1, 2, 3, 4]
+ITEMS_PER_ORDER_P = [0.90, 0.07, 0.02, 0.01]
+
+ORDER_STATUSES = ['delivered', 'shipped', 'canceled', 'unavailable', 'invoiced', 'processing', 'created',
+                  'approved']
+ORDER_STATUSES_P = [0.970, 0.011, 0.006, 0.006, 0.003, 0.003, 0.0005, 0.0005]
+PAYMENT_TYPES = ['credit_card', 'boleto', 'voucher', 'debit_card', 'not_defined']
+PAYMENT_TYPES_P = [0.739, 0.190, 0.055, 0.0159, 0.0001]
+
+# Leading CEP digit -> states of that postal region, with a rough centre (lat, lng) for the coordinates
+CEP_REGIONS = {
+    0: (['SP'], (-23.5, -46.6)),
+    1: (['SP'], (-22.5, -47.5)),
+    2: (['RJ', 'ES'], (-22.0, -42.5)),
+    3: (['MG'], (-19.5, -44.5)),
+    4: (['BA', 'SE'], (-12.5, -39.5)),
+    5: (['PE', 'AL', 'PB', 'RN'], (-8.0, -36.0)),
+    6: (['CE', 'PI', 'MA', 'PA', 'AP', 'AM', 'RR', 'AC'], (-4.0, -45.0)),
+    7: (['DF', 'GO', 'TO', 'MT', 'MS', 'RO'], (-15.5, -50.0)),
+    8: (['PR', 'SC'], (-26.0, -50.0)),
+    9: (['RS'], (-30.0, -52.0))
+}
+CITY_NAMES = ['sao paulo', 'campinas', 'rio de janeiro', 'belo horizonte', 'salvador', 'recife', 'fortaleza',
+              'brasilia', 'curitiba', 'porto alegre', 'santos', 'niteroi', 'uberlandia', 'londrina', 'joinville',
+              'goiania', 'natal', 'maceio', 'manaus', 'belem']
+REVIEW_TITLES = ['recomendo', 'otimo produto', 'muito bom', 'nao recebi', 'produto com defeito']
+REVIEW_MESSAGES = ['chegou antes do prazo', 'produto de qualidade, recomendo', 'ainda nao recebi o produto',
+                   'veio diferente do anunciado', 'entrega rapida e bem embalado']
+
+TRANSLATION_FILE = ROOT / 'data' / 'raw' / 'product_category_name_translation.csv'
+PURCHASE_START = pd.Timestamp('2016-09-04')
+PURCHASE_DAYS = 773
+
+
+def _count(name, scale):
+    return max(1, int(round(OLIST_ROWS[name] * scale)))
+
+
+def hex_ids(count, salt):
+    # Distinct 32-character hex ids: odd multipliers are bijections on 64-bit integers, so each index maps
+    # to its own id; the salt keeps different kinds of ids apart
+    index = np.arange(count, dtype=np.uint64) + np.uint64(salt)
+    with np.errstate(over='ignore'):
+        high = index * np.uint64(0x9E3779B97F4A7C15)
+        low = high * np.uint64(0xBF58476D1CE4E5B9) + np.uint64(salt)
+    return np.array([f"{h:016x}{l:016x}" for h, l in zip(high.tolist(), low.tolist())], dtype=object)
+
+
+def _seconds(rng, count, low_days, high_days):
+    return pd.to_timedelta(rng.integers(int(low_days * 86_400), int(high_days * 86_400), count), unit='s')
+
+
+def category_names():
+    if TRANSLATION_FILE.exists():
+        return pd.read_csv(TRANSLATION_FILE, encoding='utf-8-sig')
+    names = [f"categoria_{i}" for i in range(71)]
+    return pd.DataFrame({'product_category_name': names,
+                         'product_category_name_english': [f"category_{i}" for i in range(71)]})
+
+
+def make_zip_prefixes(rng, scale):
+    # Prefix universe shared by geolocation, customers and sellers, each with a fixed state, city and centre
+    count = min(90_000, max(50, int(19_000 * min(scale, 4))))
+    prefixes = np.sort(rng.choice(np.arange(1_000, 100_000), count, replace=False))
+    region = prefixes // 10_000
+    states = np.array([rng.choice(CEP_REGIONS[r][0]) for r in region], dtype=object)
+    cities = np.array(CITY_NAMES, dtype=object)[(region * 2 + (prefixes // 100) % 2) % len(CITY_NAMES)]
+    centres = np.array([CEP_REGIONS[r][1] for r in region])
+    lat = centres[:, 0] + rng.normal(0, 1.5, count)
+    lng = centres[:, 1] + rng.normal(0, 1.5, count)
+    return pd.DataFrame({'prefix': prefixes, 'state': states, 'city': cities, 'lat': lat, 'lng': lng})
+
+
+def make_geolocation(rng, zips, scale):
+    rows = _count('geolocation', scale)
+    picked = zips.iloc[rng.integers(0, len(zips), rows)]
+    geolocation = pd.DataFrame({
+        'geolocation_zip_code_prefix': picked['prefix'].to_numpy(),
+        'geolocation_lat': (picked['lat'].to_numpy() + rng.normal(0, 0.02, rows)).clip(-90, 90),
+        'geolocation_lng': (picked['lng'].to_numpy() + rng.normal(0, 0.02, rows)).clip(-180, 180),
+        'geolocation_city': picked['city'].to_numpy(),
+        'geolocation_state': picked['state'].to_numpy()
+    })
+    # About a quarter of the real file is exact duplicate rows
+    duplicates = rng.random(rows) < 0.25
+    source = np.where(duplicates, rng.integers(0, rows, rows), np.arange(rows))
+    return geolocation.iloc[source].reset_index(drop=True)
+
+
+def make_sellers(rng, zips, scale):
+    count = _count('sellers', scale)
+    picked = zips.iloc[rng.integers(0, len(zips), count)]
+    return pd.DataFrame({
+        'seller_id': hex_ids(count, rng.integers(1, 2 ** 40)),
+        'seller_zip_code_prefix': picked['prefix'].to_numpy(),
+        'seller_city': picked['city'].to_numpy(),
+        'seller_state': picked['state'].to_numpy()
+    })
+
+
+def make_products(rng, categories, scale):
+    count = _count('products', scale)
+    names = categories['product_category_name'].to_numpy(dtype=object)
+    category = names[rng.integers(0, len(names), count)]
+    category[rng.random(count) < 0.0185] = None
+    products = pd.DataFrame({
+        'product_id': hex_ids(count, rng.integers(1, 2 ** 40)),
+        'product_category_name': category,
+        'product_name_lenght': rng.integers(5, 77, count).astype(float),
+        'product_description_lenght': rng.integers(4, 3_993, count).astype(float),
+        'product_photos_qty': rng.integers(1, 21, count).astype(float),
+        'product_weight_g': rng.integers(0, 40_426, count).astype(float),
+        'product_length_cm': rng.integers(7, 106, count).astype(float),
+        'product_height_cm': rng.integers(2, 106, count).astype(float),
+        'product_width_cm': rng.integers(6, 119, count).astype(float)
+    })
+    # Like the real file: uncategorised products miss their text stats, a few products miss dimensions
+    uncategorised = products['product_category_name'].isna()
+    products.loc[uncategorised, ['product_name_lenght', 'product_description_lenght', 'product_photos_qty']] = np.nan
+    no_dimensions = rng.random(count) < 0.0001
+    products.loc[no_dimensions, ['product_weight_g', 'product_length_cm', 'product_height_cm',
+                                 'product_width_cm']] = np.nan
+    return products.astype({col: 'Int64' for col in ['product_photos_qty', 'product_weight_g', 'product_length_cm',
+                                                      'product_height_cm', 'product_width_cm']})
+
+
+def make_customers_and_orders(rng, zips, scale):
+    # Olist issues a new customer_id per order; customer_unique_id identifies the person (~4% buy again)
+    count = _count('customers', scale)
+    unique_ids = hex_ids(int(count * 0.96) or 1, rng.integers(1, 2 ** 40))
+    person = rng.integers(0, len(unique_ids), count)
+    picked = zips.iloc[rng.integers(0, len(zips), len(unique_ids))]
+    customers = pd.DataFrame({
+        'customer_id': hex_ids(count, rng.integers(1, 2 ** 40)),
+        'customer_unique_id': unique_ids[person],
+        'customer_zip_code_prefix': picked['prefix'].to_numpy()[person],
+        'customer_city': picked['city'].to_numpy()[person],
+        'customer_state': picked['state'].to_numpy()[person]
+    })
+
+    status = rng.choice(ORDER_STATUSES, count, p=ORDER_STATUSES_P)
+    purchase = PURCHASE_START + _seconds(rng, count, 0, PURCHASE_DAYS)
+    approved = purchase + _seconds(rng, count, 0, 2)
+    carrier = approved + _seconds(rng, count, 0.5, 6)
+    delivered = carrier + _seconds(rng, count, 1, 30)
+    estimated = (purchase + _seconds(rng, count, 10, 40)).normalize()
+    is_delivered = status == 'delivered'
+    orders = pd.DataFrame({
+        'order_id': hex_ids(count, rng.integers(1, 2 ** 40)),
+        'customer_id': customers['customer_id'].to_numpy(),
+        'order_status': status,
+        'order_purchase_timestamp': purchase,
+        'order_approved_at': approved.where(~np.isin(status, ['created', 'canceled'])),
+        'order_delivered_carrier_date': carrier.where(is_delivered | (status == 'shipped')),
+        'order_delivered_customer_date': delivered.where(is_delivered),
+        'order_estimated_delivery_date': estimated
+    })
+    return customers, orders
+
+
+def make_order_items(rng, orders, products, sellers):
+    per_order = rng.choice(ITEMS_PER_ORDER, len(orders), p=ITEMS_PER_ORDER_P)
+    order_rows = np.repeat(np.arange(len(orders)), per_order)
+    count = len(order_rows)
+    # A few products and sellers take most of the sales, as in the real data
+    product_rows = (rng.random(count) ** 3 * len(products)).astype(np.int64)
+    seller_rows = (rng.random(count) ** 2 * len(sellers)).astype(np.int64)
+    starts = np.repeat(np.cumsum(per_order) - per_order, per_order)
+    price = np.round(rng.lognormal(4.4, 0.9, count), 2)
+    return pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[order_rows],
+        'order_item_id': np.arange(count) - starts + 1,
+        'product_id': products['product_id'].to_numpy()[product_rows],
+        'seller_id': sellers['seller_id'].to_numpy()[seller_rows],
+        'shipping_limit_date': orders['order_purchase_timestamp'].to_numpy()[order_rows]
+                               + _seconds(rng, count, 2, 8).to_numpy(),
+        'price': price,
+        'freight_value': np.round(rng.lognormal(2.8, 0.6, count), 2)
+    })
+
+
+def make_payments(rng, orders, order_items):
+    totals = (order_items.assign(total=order_items['price'] + order_items['freight_value'])
+              .groupby('order_id', sort=False)['total'].sum())
+    order_totals = totals.reindex(orders['order_id']).fillna(0).to_numpy()
+    # Most orders pay once; some split off part of the value into a voucher paid first
+    split = rng.random(len(orders)) < 0.03
+    rows = np.repeat(np.arange(len(orders)), np.where(split, 2, 1))
+    count = len(rows)
+    first_of_order = np.ones(count, dtype=bool)
+    first_of_order[1:] = rows[1:] != rows[:-1]
+    sequential = np.where(first_of_order, 1, 2)
+    share = np.where(split[rows], np.where(first_of_order, 0.3, 0.7), 1.0)
+
+    payment_type = rng.choice(PAYMENT_TYPES, count, p=PAYMENT_TYPES_P).astype(object)
+    payment_type[split[rows] & first_of_order] = 'voucher'
+    installments = np.where(payment_type == 'credit_card', rng.integers(1, 11, count), 1)
+    # A handful of zero installments, which process_order_payments corrects
+    installments[rng.random(count) < 0.0001] = 0
+    return pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[rows],
+        'payment_sequential': sequential,
+        'payment_type': payment_type,
+        'payment_installments': installments,
+        'payment_value': np.round(order_totals[rows] * share, 2)
+    })
+
+
+def make_reviews(rng, orders):
+    reviewed = np.flatnonzero(rng.random(len(orders)) < 0.992)
+    count = len(reviewed)
+    delivered = orders['order_delivered_customer_date'].to_numpy()[reviewed]
+    estimated = orders['order_estimated_delivery_date'].to_numpy()[reviewed]
+    created = pd.DatetimeIndex(np.where(np.isnat(delivered), estimated, delivered)).normalize() \
+        + _seconds(rng, count, 0, 3).floor('D')
+    review_ids = hex_ids(count, rng.integers(1, 2 ** 40))
+    # The real file repeats some review ids across orders; process_order_reviews keeps the first
+    repeated = np.flatnonzero(rng.random(count) < 0.008)
+    review_ids[repeated] = review_ids[rng.integers(0, count, len(repeated))]
+
+    titles = np.array(REVIEW_TITLES, dtype=object)[rng.integers(0, len(REVIEW_TITLES), count)]
+    titles[rng.random(count) < 0.88] = None
+    messages = np.array(REVIEW_MESSAGES, dtype=object)[rng.integers(0, len(REVIEW_MESSAGES), count)]
+    messages[rng.random(count) < 0.59] = None
+    return pd.DataFrame({
+        'review_id': review_ids,
+        'order_id': orders['order_id'].to_numpy()[reviewed],
+        'review_score': rng.choice([1, 2, 3, 4, 5], count, p=[0.115, 0.032, 0.082, 0.193, 0.578]),
+        'review_comment_title': titles,
+        'review_comment_message': messages,
+        'review_creation_date': created,
+        'review_answer_timestamp': created + _seconds(rng, count, 0.2, 5)
+    })
+
+
+def generate(output_dir, scale=1.0, seed=0):
+    # Writes the nine Olist files at scale times the public dataset's size. The same scale and seed always
+    # give the same files. Every foreign key resolves and every value passes the olist_model.py models
+    # after the process_* functions have run.
+    rng = np.random.default_rng(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    categories = category_names()
+    zips = make_zip_prefixes(rng, scale)
+    sellers = make_sellers(rng, zips, scale)
+    products = make_products(rng, categories, scale)
+    customers, orders = make_customers_and_orders(rng, zips, scale)
+    order_items = make_order_items(rng, orders, products, sellers)
+    frames = {
+        'olist_customers_dataset.csv': customers,
+        'olist_geolocation_dataset.csv': make_geolocation(rng, zips, scale),
+        'olist_order_items_dataset.csv': order_items,
+        'olist_order_payments_dataset.csv': make_payments(rng, orders, order_items),
+        'olist_order_reviews_dataset.csv': make_reviews(rng, orders),
+        'olist_orders_dataset.csv': orders,
+        'olist_products_dataset.csv': products,
+        'olist_sellers_dataset.csv': sellers,
+        'product_category_name_translation.csv': categories
+    }
+    rows = {}
+    for filename, df in frames.items():
+        df.to_csv(output_dir / filename, index=False, date_format=TIMESTAMP_FORMAT)
+        rows[filename] = len(df)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic Olist CSV files")
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for filename, count in generate(args.output_dir, args.scale, args.seed).items():
+        print(f"{filename:<42}{count:>12,}")
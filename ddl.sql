@@ -7,11 +7,16 @@ CREATE TABLE dim_date (
     day INT NOT NULL,
     quarter INT NOT NULL,
     day_of_week INT NOT NULL,
-    is_weekend BIT NOT NULL
+    is_weekend BIT NOT NULL,
+    week INT NOT NULL,
+    month_name VARCHAR(10) NOT NULL,
+    is_holiday BIT NOT NULL
 );
 
 CREATE TABLE dim_customers (
-    customer_id VARCHAR(50) PRIMARY KEY,
+    customer_key INT PRIMARY KEY,
+    customer_id VARCHAR(50) NOT NULL UNIQUE,
+    customer_unique_key INT NOT NULL,
     customer_unique_id VARCHAR(50) NOT NULL,
     customer_zip_code_prefix INT NOT NULL,
     customer_city VARCHAR(100) NOT NULL,
@@ -21,11 +26,12 @@ CREATE TABLE dim_customers (
 );
 
 CREATE TABLE dim_products (
-    product_id VARCHAR(50) PRIMARY KEY,
+    product_key INT PRIMARY KEY,
+    product_id VARCHAR(50) NOT NULL UNIQUE,
     product_category_name NVARCHAR(100) NULL,
     product_category_name_english NVARCHAR(100) NULL,
-    product_name_lenght INT NULL,
-    product_description_lenght INT NULL,
+    product_name_length INT NULL,
+    product_description_length INT NULL,
     product_photos_qty INT NULL,
     product_weight_g FLOAT NULL,
     product_length_cm FLOAT NULL,
@@ -34,19 +40,22 @@ CREATE TABLE dim_products (
 );
 
 CREATE TABLE dim_sellers (
-    seller_id VARCHAR(50) PRIMARY KEY,
+    seller_key INT PRIMARY KEY,
+    seller_id VARCHAR(50) NOT NULL UNIQUE,
     seller_zip_code_prefix INT NOT NULL,
     seller_city VARCHAR(100) NOT NULL,
-    seller_state CHAR(2) NOT NULL
+    seller_state CHAR(2) NOT NULL,
+    geolocation_lat FLOAT NULL,
+    geolocation_lng FLOAT NULL
 );
 
 
 CREATE TABLE fact_order_items (
     order_item_id INT NOT NULL,
-    order_id VARCHAR(50) NOT NULL,
-    product_id VARCHAR(50) NOT NULL,
-    seller_id VARCHAR(50) NOT NULL,
-    customer_id VARCHAR(50) NOT NULL,
+    order_key INT NOT NULL,
+    product_key INT NOT NULL,
+    seller_key INT NOT NULL,
+    customer_key INT NOT NULL,
     purchase_date_id INT NOT NULL,
     delivery_date_id INT NULL,
     price FLOAT NOT NULL,
@@ -55,13 +64,36 @@ CREATE TABLE fact_order_items (
     profit_margin FLOAT NOT NULL,
     delivery_time INT NULL,
     payment_installments INT NULL,
-    PRIMARY KEY (order_id, order_item_id),
-    FOREIGN KEY (product_id) REFERENCES dim_products(product_id),
-    FOREIGN KEY (seller_id) REFERENCES dim_sellers(seller_id),
-    FOREIGN KEY (customer_id) REFERENCES dim_customers(customer_id),
+    PRIMARY KEY (order_key, order_item_id),
+    FOREIGN KEY (product_key) REFERENCES dim_products(product_key),
+    FOREIGN KEY (seller_key) REFERENCES dim_sellers(seller_key),
+    FOREIGN KEY (customer_key) REFERENCES dim_customers(customer_key),
     FOREIGN KEY (purchase_date_id) REFERENCES dim_date(date_id),
     FOREIGN KEY (delivery_date_id) REFERENCES dim_date(date_id)
 );
+-- Report summary tables, maintained by load_to_sql_server (src/aggregates.py)
+CREATE TABLE agg_category_sales (
+    product_category_name NVARCHAR(100) PRIMARY KEY,
+    product_category_name_english NVARCHAR(100) NULL,
+    order_count INT NOT NULL,
+    total_sales FLOAT NOT NULL,
+    average_order_value FLOAT NULL
+);
+
+CREATE TABLE agg_seller_delivery (
+    seller_key INT PRIMARY KEY,
+    seller_id VARCHAR(50) NOT NULL,
+    delivered_items INT NOT NULL,
+    delivery_time_sum BIGINT NOT NULL,
+    avg_delivery FLOAT NULL
+);
+
+CREATE TABLE agg_state_orders (
+    customer_state CHAR(2) PRIMARY KEY,
+    order_count INT NOT NULL,
+    customer_count INT NOT NULL
+);
+
 CREATE TABLE etl_error_log (
     error_id INT IDENTITY(1,1) PRIMARY KEY,
     table_name VARCHAR(100) NOT NULL,
@@ -69,9 +101,20 @@ CREATE TABLE etl_error_log (
     error_time DATETIME NOT NULL
 );
 
-CREATE INDEX idx_fact_product ON fact_order_items(product_id);
-CREATE INDEX idx_fact_seller ON fact_order_items(seller_id);
-CREATE INDEX idx_fact_customer ON fact_order_items(customer_id);
+CREATE TABLE etl_watermark (
+    table_name VARCHAR(100) NOT NULL PRIMARY KEY,
+    watermark DATETIME NOT NULL
+);
+
+CREATE TABLE etl_load_version (
+    version INT NOT NULL PRIMARY KEY,
+    load_mode VARCHAR(20) NOT NULL,
+    loaded_at DATETIME NOT NULL
+);
+
+CREATE INDEX idx_fact_product ON fact_order_items(product_key);
+CREATE INDEX idx_fact_seller ON fact_order_items(seller_key);
+CREATE INDEX idx_fact_customer ON fact_order_items(customer_key);
 CREATE INDEX idx_fact_purchase_date ON fact_order_items(purchase_date_id);
 CREATE INDEX idx_fact_delivery_date ON fact_order_items(delivery_date_id);
 
@@ -0,0 +1,133 @@
+import pandas as pd
+
+# Summary tables behind the reports.sql queries, one row per report group. They hold additive measures (row
+# counts, sums, and distinct counts of keys that belong to a single group), so a delta of fact rows can be
+# folded into them without rescanning fact_order_items. The averages are derived from the measures.
+AGGREGATE_KEYS = {
+    'agg_category_sales': ['product_category_name'],
+    'agg_seller_delivery': ['seller_key'],
+    'agg_state_orders': ['customer_state']
+}
+# Descriptive columns carried along with the group key
+LABELS = {
+    'agg_category_sales': ['product_category_name_english'],
+    'agg_seller_delivery': ['seller_id'],
+    'agg_state_orders': []
+}
+MEASURES = {
+    'agg_category_sales': ['order_count', 'total_sales'],
+    'agg_seller_delivery': ['delivered_items', 'delivery_time_sum'],
+    'agg_state_orders': ['order_count', 'customer_count']
+}
+# average column -> (sum, count)
+AVERAGES = {
+    'agg_category_sales': {'average_order_value': ('total_sales', 'order_count')},
+    'agg_seller_delivery': {'avg_delivery': ('delivery_time_sum', 'delivered_items')},
+    'agg_state_orders': {}
+}
+
+
+def _weighted(*frames):
+    # (rows, weight) pairs -> one frame with a weight column; a weight of -1 takes rows back out of a total
+    return pd.concat([rows.assign(weight=weight) for rows, weight in frames], ignore_index=True)
+
+
+def _finish(table_name, df):
+    for column, (total, count) in AVERAGES[table_name].items():
+        df[column] = (df[total] / df[count]).where(df[count] > 0)
+    columns = AGGREGATE_KEYS[table_name] + LABELS[table_name] + MEASURES[table_name] + list(AVERAGES[table_name])
+    return df[columns].reset_index(drop=True)
+
+
+def category_sales(rows, products_dim):
+    # Query 1: items and sales per product category
+    rows = rows[['product_key', 'total_price', 'weight']].merge(
+        products_dim[['product_key', 'product_category_name', 'product_category_name_english']], on='product_key'
+    )
+    rows['total_sales'] = rows['total_price'] * rows['weight']
+    df = rows.groupby('product_category_name', as_index=False).agg(
+        product_category_name_english=('product_category_name_english', 'last'),
+        order_count=('weight', 'sum'),
+        total_sales=('total_sales', 'sum')
+    )
+    return _finish('agg_category_sales', df)
+
+
+def seller_delivery(rows, sellers_dim):
+    # Query 2: delivery time per seller over delivered items. Undelivered items have no delivery_date_id
+    # (0 in warehouses loaded before it was nullable), so the report's join to dim_date drops them.
+    rows = rows.loc[rows['delivery_date_id'].fillna(0).to_numpy() > 0, ['seller_key', 'delivery_time', 'weight']]
+    rows = rows.merge(sellers_dim[['seller_key', 'seller_id']], on='seller_key')
+    rows['delivery_time_sum'] = rows['delivery_time'] * rows['weight']
+    df = rows.groupby('seller_key', as_index=False).agg(
+        seller_id=('seller_id', 'last'),
+        delivered_items=('weight', 'sum'),
+        delivery_time_sum=('delivery_time_sum', 'sum')
+    )
+    return _finish('agg_seller_delivery', df)
+
+
+def state_orders(order_rows, customer_rows, customers_dim):
+    # Query 3: distinct orders and customers per customer state. An order has one customer and a customer one
+    # state, so the counts only grow by orders and customers the warehouse hasn't seen yet.
+    states = customers_dim[['customer_key', 'customer_state']]
+    orders = order_rows[['customer_key', 'order_key']].merge(states, on='customer_key')
+    customers = customer_rows[['customer_key']].merge(states, on='customer_key')
+    df = pd.DataFrame({
+        'order_count': orders.groupby('customer_state', observed=True)['order_key'].nunique(),
+        'customer_count': customers.groupby('customer_state', observed=True)['customer_key'].nunique()
+    }).fillna(0).astype('int64').rename_axis('customer_state').reset_index()
+    return _finish('agg_state_orders', df)
+
+
+def build_aggregates(fact_table, dims):
+    # Every summary table from the full fact table; dims maps dimension table names to their frames
+    rows = _weighted((fact_table, 1))
+    return {
+        'agg_category_sales': category_sales(rows, dims['dim_products']),
+        'agg_seller_delivery': seller_delivery(rows, dims['dim_sellers']),
+        'agg_state_orders': state_orders(fact_table, fact_table, dims['dim_customers'])
+    }
+
+
+def aggregate_delta(inserts, updates, previous, new_orders, new_customers, dims):
+    # Changes to each summary table from one fact merge: inserted and updated rows count in, the stored
+    # versions of the updated rows count out. new_orders / new_customers are the inserted rows whose order /
+    # customer had no fact rows before.
+    rows = _weighted((inserts, 1), (updates, 1), (previous, -1))
+    return {
+        'agg_category_sales': category_sales(rows, dims['dim_products']),
+        'agg_seller_delivery': seller_delivery(rows, dims['dim_sellers']),
+        'agg_state_orders': state_orders(new_orders, new_customers, dims['dim_customers'])
+    }
+
+
+def partition_delta(rows, previous, new_customers, gone_customers, dims):
+    # Changes to each summary table from replacing whole fact partitions: rows (the new partitions) count in,
+    # previous (the stored rows they replace) count out. Every order of either has all its rows there; the
+    # customers are the rows of customers with no fact rows outside the replaced ones.
+    weighted = _weighted((rows, 1), (previous, -1))
+    states = pd.concat([
+        state_orders(rows, new_customers, dims['dim_customers']),
+        state_orders(previous, gone_customers, dims['dim_customers']).pipe(
+            lambda df: df.assign(**{measure: -df[measure] for measure in MEASURES['agg_state_orders']})
+        )
+    ], ignore_index=True)
+    return {
+        'agg_category_sales': category_sales(weighted, dims['dim_products']),
+        'agg_seller_delivery': seller_delivery(weighted, dims['dim_sellers']),
+        'agg_state_orders': _finish('agg_state_orders', states.groupby('customer_state', as_index=False, observed=True)[
+            MEASURES['agg_state_orders']].sum())
+    }
+
+
+def fold_delta(table_name, existing, delta):
+    # Adds a delta to the stored summary rows; returns the groups the delta touched
+    keys, labels, measures = AGGREGATE_KEYS[table_name], LABELS[table_name], MEASURES[table_name]
+    touched = existing[existing[keys[0]].isin(delta[keys[0]])]
+    combined = pd.concat([touched[keys + labels + measures], delta[keys + labels + measures]], ignore_index=True)
+    df = combined.groupby(keys, as_index=False, observed=True).agg(
+        **{label: (label, 'last') for label in labels},
+        **{measure: (measure, 'sum') for measure in measures}
+    )
+    return _finish(table_name, df)
@@ -0,0 +1,132 @@
+import csv
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+STRATEGIES = ['fast_executemany', 'multi', 'staged']
+
+# Strategy used when none is given, per SQLAlchemy dialect name
+DEFAULT_STRATEGIES = {
+    'mssql': 'fast_executemany',
+    'sqlite': 'fast_executemany',
+    'postgresql': 'multi',
+    'mysql': 'multi'
+}
+
+DEFAULT_CHUNKSIZE = 50_000
+
+# Most bind parameters a single statement may carry, per dialect
+PARAMETER_LIMITS = {
+    'mssql': 2_000,
+    'sqlite': 32_766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+}
+# Most rows a single VALUES list may carry, per dialect
+ROW_LIMITS = {
+    'mssql': 1_000
+}
+
+# Directory for staged CSV files; for SQL Server BULK INSERT it must be readable by the database server
+STAGING_DIR = os.environ.get('OLIST_BULK_STAGING_DIR')
+
+
+def default_strategy(dialect_name):
+    return DEFAULT_STRATEGIES.get(dialect_name, 'multi')
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _qualified_name(conn, table_name, schema):
+    return f"{_quote(conn, schema)}.{_quote(conn, table_name)}" if schema else _quote(conn, table_name)
+
+
+def _insert_executemany(df, table_name, conn, schema, chunksize):
+    # On SQL Server this relies on an engine created with fast_executemany=True (see
+    # load_data.create_warehouse_engine), so pyodbc sends the whole parameter array in one round trip
+    df.to_sql(table_name, conn, if_exists='append', index=False, schema=schema, chunksize=chunksize)
+
+
+def _insert_multi_values(df, table_name, conn, schema, chunksize):
+    limit = PARAMETER_LIMITS.get(conn.dialect.name)
+    rows_per_statement = chunksize
+    if limit is not None:
+        rows_per_statement = max(1, min(chunksize, limit // max(1, len(df.columns))))
+    rows_per_statement = min(rows_per_statement, ROW_LIMITS.get(conn.dialect.name, rows_per_statement))
+    df.to_sql(table_name, conn, if_exists='append', index=False, schema=schema,
+              chunksize=rows_per_statement, method='multi')
+
+
+def _insert_staged(df, table_name, conn, schema, chunksize):
+    with tempfile.TemporaryDirectory(dir=STAGING_DIR) as staging_dir:
+        staged_file = Path(staging_dir) / f"{table_name}.csv"
+        df.to_csv(staged_file, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+        target = _qualified_name(conn, table_name, schema)
+
+        if conn.dialect.name == 'mssql':
+            conn.execute(text(
+                f"BULK INSERT {target} FROM '{staged_file.resolve()}' "
+                f"WITH (FORMAT = 'CSV', TABLOCK, BATCHSIZE = {chunksize})"
+            ))
+            return
+
+        # Elsewhere stream the staged file through the driver's executemany; empty fields load as NULL
+        columns = ', '.join(_quote(conn, col) for col in df.columns)
+        placeholders = ', '.join(['?' if conn.dialect.paramstyle == 'qmark' else '%s'] * len(df.columns))
+        insert_sql = f"INSERT INTO {target} ({columns}) VALUES ({placeholders})"
+        cursor = conn.connection.cursor()
+        try:
+            with open(staged_file, newline='') as f:
+                batch = []
+                for row in csv.reader(f):
+                    batch.append([value if value != '' else None for value in row])
+                    if len(batch) >= chunksize:
+                        cursor.executemany(insert_sql, batch)
+                        batch = []
+                if batch:
+                    cursor.executemany(insert_sql, batch)
+        finally:
+            cursor.close()
+
+
+INSERTERS = {
+    'fast_executemany': _insert_executemany,
+    'multi': _insert_multi_values,
+    'staged': _insert_staged
+}
+
+
+def bulk_insert(df, table_name, conn, schema='dw', strategy=None, chunksize=None, if_exists='append'):
+    if isinstance(conn, Engine):
+        with conn.begin() as connection:
+            return bulk_insert(df, table_name, connection, schema, strategy, chunksize, if_exists)
+
+    strategy = strategy or default_strategy(conn.dialect.name)
+    if strategy not in INSERTERS:
+        raise ValueError(f"Unknown bulk load strategy: {strategy}")
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+
+    # Create (or replace) the table from the frame's types, then insert the rows with the chosen strategy
+    df.head(0).to_sql(table_name, conn, if_exists=if_exists, index=False, schema=schema)
+    if len(df):
+        INSERTERS[strategy](df, table_name, conn, schema, chunksize)
+    return strategy
+
+
+def timed_bulk_insert(df, table_name, conn, schema='dw', strategy=None, chunksize=None, if_exists='append',
+                      logger=None):
+    if logger is None:
+        logger = logging.getLogger()
+    start = time.perf_counter()
+    strategy = bulk_insert(df, table_name, conn, schema, strategy, chunksize, if_exists)
+    elapsed = time.perf_counter() - start
+    rows_per_sec = len(df) / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Inserted {len(df)} rows into {table_name} with {strategy} in {elapsed:.2f}s "
+                f"({rows_per_sec:,.0f} rows/s)")
+    return elapsed
@@ -0,0 +1,125 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+CACHE_DIR = Path('../data/cache')
+MAX_CACHE_BYTES = int(os.environ.get('OLIST_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_digest(*objects):
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def combine_digests(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _copy(source, target):
+    # Outputs are files, or directories that are copied whole (e.g. the monthly partitions)
+    if Path(source).is_dir():
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(source, target)
+    else:
+        shutil.copyfile(source, target)
+
+
+def _size(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob('*') if child.is_file())
+    return path.stat().st_size
+
+
+# Keeps copies of stage output files keyed by content hash, evicting least recently used entries over max_bytes
+class StageCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, logger=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.manifest_file = self.cache_dir / 'manifest.json'
+        self.logger = logger or logging.getLogger()
+        self.entries = self._read_manifest()
+
+    def _read_manifest(self):
+        if not self.manifest_file.exists():
+            return {}
+        try:
+            return json.loads(self.manifest_file.read_text())['entries']
+        except (ValueError, KeyError) as e:
+            self.logger.warning(f"Ignoring unreadable cache manifest {self.manifest_file}: {e}")
+            return {}
+
+    def _write_manifest(self):
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        tmp_file.write_text(json.dumps({'entries': self.entries}, indent=2))
+        tmp_file.replace(self.manifest_file)
+
+    def restore(self, key, outputs):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        entry_dir = self.cache_dir / key
+        cached_files = [entry_dir / Path(output).name for output in outputs]
+        if not all(cached_file.exists() for cached_file in cached_files):
+            self._drop(key)
+            self._write_manifest()
+            return False
+
+        for cached_file, output in zip(cached_files, outputs):
+            _copy(cached_file, output)
+        entry['last_used'] = time.time()
+        self._write_manifest()
+        return True
+
+    def store(self, key, stage_name, outputs):
+        entry_dir = self.cache_dir / key
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        size = 0
+        for output in outputs:
+            _copy(output, entry_dir / Path(output).name)
+            size += _size(output)
+
+        self.entries[key] = {
+            'stage': stage_name,
+            'files': [Path(output).name for output in outputs],
+            'size': size,
+            'last_used': time.time()
+        }
+        self._evict(keep=key)
+        self._write_manifest()
+
+    def _drop(self, key):
+        self.entries.pop(key, None)
+        shutil.rmtree(self.cache_dir / key, ignore_errors=True)
+
+    def _evict(self, keep=None):
+        total = sum(entry['size'] for entry in self.entries.values())
+        by_age = sorted(self.entries, key=lambda k: self.entries[k]['last_used'])
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.entries[key]['size']
+            self.logger.info(f"Evicting cached {self.entries[key]['stage']} ({key[:12]})")
+            self._drop(key)
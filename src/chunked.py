@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# 64-bit row hashes, ~8 bytes per distinct row seen so far, kept as a few sorted runs: each chunk's new hashes
+# become a run, and runs are merged only with runs of similar size, so a chunk costs about its own size times the
+# (logarithmic) number of runs instead of a re-sort of everything seen
+class RowFingerprintSet:
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def _seen(self, hashes):
+        seen = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, hashes)
+            positions[positions == len(run)] = 0
+            seen |= run[positions] == hashes
+        return seen
+
+    def mark_new(self, df):
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+        # Keep the first occurrence inside the chunk, like drop_duplicates(keep='first')
+        unique_hashes, first_positions = np.unique(hashes, return_index=True)
+        unseen = ~self._seen(unique_hashes)
+        is_new = np.zeros(len(hashes), dtype=bool)
+        is_new[first_positions[unseen]] = True
+
+        run = unique_hashes[unseen]
+        if len(run):
+            self.runs.append(run)
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            # The runs are disjoint, so a merge is a concatenation and one sort
+            self.runs[-2:] = [np.sort(np.concatenate(self.runs[-2:]))]
+        return is_new
+
+
+def concat_chunks(chunks):
+    # Each chunk's categoricals only know the categories seen in that chunk, and plain concat would fall
+    # back to object for them; union the categories instead
+    df = pd.concat(chunks, ignore_index=True)
+    for col in chunks[0].columns:
+        if all(isinstance(chunk[col].dtype, pd.CategoricalDtype) for chunk in chunks):
+            df[col] = union_categoricals([chunk[col] for chunk in chunks])
+    return df
+
+
+def process_in_chunks(chunks, process, writer, dedupe_rows=False, on_chunk=None):
+    # Only one chunk is held at a time: each processed chunk is written, handed to on_chunk (e.g. to accumulate
+    # a summary of the whole file) and dropped. Returns the number of rows written.
+    fingerprints = RowFingerprintSet() if dedupe_rows else None
+    rows = chunk_count = 0
+
+    with writer:
+        for chunk in chunks:
+            chunk_count += 1
+            if fingerprints is not None:
+                chunk = chunk[fingerprints.mark_new(chunk)]
+            processed = process(chunk)
+            writer.write(processed)
+            if on_chunk is not None:
+                on_chunk(processed)
+            rows += len(processed)
+
+    if not chunk_count:
+        raise ValueError(f"No rows read for {writer.path.name}")
+    return rows
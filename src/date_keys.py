@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+# Brazilian national holidays: fixed (month, day) pairs and offsets in days from Easter Sunday
+FIXED_HOLIDAYS = [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25)]
+EASTER_HOLIDAYS = [-2]  # Good Friday
+
+
+def date_keys(timestamps):
+    # YYYYMMDD integer keys straight from the datetime64 values, with <NA> for missing timestamps
+    values = pd.Series(timestamps).to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(values)
+    days = values.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    year = months.astype(np.int64) // 12 + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    return pd.arrays.IntegerArray(year * 10_000 + month * 100 + day, missing)
+
+
+def easter_sunday(year):
+    # Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    leap = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * leap) // 451
+    month, day = divmod(h + leap - 7 * m + 114, 31)
+    return pd.Timestamp(year=year, month=month, day=day + 1)
+
+
+def holidays(years):
+    dates = [pd.Timestamp(year=year, month=month, day=day) for year in years for month, day in FIXED_HOLIDAYS]
+    dates += [easter_sunday(year) + pd.Timedelta(days=offset) for year in years for offset in EASTER_HOLIDAYS]
+    return pd.DatetimeIndex(dates)
+
+
+def build_calendar(start, end):
+    # One row per day from start to end, with no gaps, so every date key in that range has a row
+    dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+    calendar = pd.DataFrame({'date': dates})
+    calendar['date_id'] = date_keys(dates).astype(np.int64)
+    calendar['year'] = dates.year
+    calendar['month'] = dates.month
+    calendar['day'] = dates.day
+    calendar['quarter'] = dates.quarter
+    calendar['day_of_week'] = dates.dayofweek
+    calendar['is_weekend'] = (dates.dayofweek >= 5).astype(int)
+    calendar['week'] = dates.isocalendar().week.to_numpy(dtype=int)
+    calendar['month_name'] = dates.month_name()
+    calendar['is_holiday'] = dates.isin(holidays(range(dates.year.min(), dates.year.max() + 1))).astype(int)
+    return calendar
@@ -0,0 +1,158 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.enrichment import ORDER_COLUMNS
+from src.ingest import PANDAS_TYPES
+from src.instrumentation import instrumented
+
+# Engine for the order_items enrichment and the window functions, overridable per run with OLIST_ENGINE:
+# 'pandas' runs them as eager pandas merges, 'duckdb' as SQL in an embedded DuckDB database
+ENGINES = ['pandas', 'duckdb']
+ENGINE = os.environ.get('OLIST_ENGINE', 'pandas')
+
+# Joins, sorts and windows that outgrow MEMORY_LIMIT spill to TEMP_DIR instead of failing
+MEMORY_LIMIT = os.environ.get('OLIST_DUCKDB_MEMORY_LIMIT', '4GB')
+TEMP_DIR = Path(os.environ.get('OLIST_DUCKDB_TEMP_DIR', '../data/tmp/duckdb'))
+
+# (epoch_ns difference) / 1e9 / 86400 is the same float arithmetic as pandas' .dt.total_seconds() / 86400
+DELIVERY_DAYS = ("(epoch_ns(order_delivered_customer_date) - epoch_ns(order_purchase_timestamp)) "
+                 "/ 1e9 / (60 * 60 * 24)")
+
+
+def connect():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The duckdb engine needs the duckdb package (python-duckdb in environment.yml)") from e
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    return duckdb.connect(config={'memory_limit': MEMORY_LIMIT, 'temp_directory': str(TEMP_DIR)})
+
+
+def _register(con, name, df, columns, row_id=False):
+    # DuckDB scans the frame in place; row_id carries the pandas row order, which the pandas path's merges
+    # and stable sorts preserve, so ties are broken the same way
+    view = df[columns]
+    if row_id:
+        view = view.assign(row_id=np.arange(len(df)))
+    con.register(name, view)
+
+
+def _fetch(con, sql, dtypes=None):
+    df = con.sql(sql).fetch_arrow_table().to_pandas(types_mapper=PANDAS_TYPES.get)
+    # Columns taken from an input frame get that frame's dtype back (e.g. numpy int64 keys rather than Int64).
+    # Integer columns that picked up NULLs in a left join become float64, as in a pandas merge.
+    dtypes = {col: dtype for col, dtype in (dtypes or {}).items() if col in df.columns}
+    for col, dtype in dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype) \
+                and df[col].isna().any():
+            dtypes[col] = np.float64
+    return df.astype(dtypes)
+
+
+@instrumented('transform', step='enrich_order_items[duckdb]')
+def enrich_order_items(validated_df, orders_df=None, payments_df=None):
+    # Same columns, row order and dtypes as etl_processing.enrich_order_items, including the order columns
+    # the shared enriched frame carries (src/enrichment.py)
+    con = connect()
+    try:
+        _register(con, 'order_items', validated_df, list(validated_df.columns), row_id=True)
+        select, joins = ['i.* EXCLUDE (row_id)'], []
+        dtypes = validated_df.dtypes.to_dict()
+        if orders_df is not None:
+            order_columns = [col for col in ORDER_COLUMNS if col not in validated_df.columns]
+            _register(con, 'orders', orders_df, ['order_key', *order_columns])
+            select += [f"o.{col}" for col in order_columns]
+            if 'delivery_time_days' not in validated_df.columns:
+                select.append(f"{DELIVERY_DAYS} AS delivery_time_days")
+            joins.append("LEFT JOIN orders o ON o.order_key = i.order_key")
+            dtypes = {**orders_df[order_columns].dtypes.to_dict(), **dtypes}
+        if payments_df is not None and 'payment_installments' not in validated_df.columns:
+            _register(con, 'payments', payments_df, ['order_key', 'payment_installments'])
+            select.append("p.payment_installments")
+            joins.append("""LEFT JOIN (
+                SELECT order_key, CAST(SUM(payment_installments) AS BIGINT) AS payment_installments
+                FROM payments GROUP BY order_key
+            ) p ON p.order_key = i.order_key""")
+        return _fetch(con, f"""
+            SELECT {', '.join(select)}
+            FROM order_items i
+            {' '.join(joins)}
+            ORDER BY i.row_id
+        """, dtypes=dtypes)
+    finally:
+        con.close()
+
+
+@instrumented('transform', step='create_window_functions[duckdb]')
+def create_window_functions(orders_df, order_items_df, customers_df, products_df, window_sizes):
+    # Same outputs as etl_processing.create_window_functions (with a fresh RangeIndex). Sums and means are
+    # accumulated in a different order, so they can differ from the pandas path in the last bits; rounding
+    # is done in numpy afterwards, as on the pandas path.
+    con = connect()
+    try:
+        _register(con, 'order_items', order_items_df,
+                  ['order_key', 'product_key', 'order_id', 'product_id', 'shipping_limit_date', 'price'], row_id=True)
+        _register(con, 'orders', orders_df,
+                  ['order_key', 'customer_key', 'order_purchase_timestamp', 'order_delivered_customer_date'])
+        _register(con, 'customers', customers_df, ['customer_key', 'customer_unique_key', 'customer_unique_id'])
+        _register(con, 'products', products_df, ['product_key', 'product_category_name'])
+        dtypes = {**customers_df.dtypes.to_dict(), **products_df.dtypes.to_dict(),
+                  **order_items_df[['order_id', 'product_id', 'price']].dtypes.to_dict()}
+
+        results = {}
+        # Prices are validated non-negative, so the running total peaks at the group's last row and the
+        # total is taken from it, like grouped_total on the pandas path
+        customer_sales = _fetch(con, """
+            WITH customer_orders AS (
+                SELECT c.customer_unique_key, c.customer_unique_id, i.order_id, i.shipping_limit_date, i.price,
+                       i.row_id,
+                       SUM(i.price) OVER (PARTITION BY c.customer_unique_key
+                                          ORDER BY i.shipping_limit_date, i.row_id
+                                          ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS cumulative_sales,
+                       DENSE_RANK() OVER (PARTITION BY c.customer_unique_key ORDER BY i.price DESC) AS price_rank
+                FROM order_items i
+                JOIN orders o ON o.order_key = i.order_key
+                JOIN customers c ON c.customer_key = o.customer_key
+            )
+            SELECT customer_unique_id, order_id, price, cumulative_sales,
+                   MAX(cumulative_sales) OVER (PARTITION BY customer_unique_key) AS total_customer_sales,
+                   CAST(price_rank AS DOUBLE) AS price_rank
+            FROM customer_orders
+            ORDER BY customer_unique_id, shipping_limit_date, row_id
+        """, dtypes)
+        customer_sales.insert(5, 'percent_of_total', (
+                customer_sales['cumulative_sales'] / customer_sales['total_customer_sales'] * 100).round(2))
+        results['customer_sales'] = customer_sales
+
+        rolling = ',\n'.join(
+            f"AVG(delivery_time_days) OVER (PARTITION BY product_category_name ORDER BY delivery_time_days, row_id "
+            f"ROWS BETWEEN {window_size - 1} PRECEDING AND CURRENT ROW) AS rolling_avg_{window_size}d"
+            for window_size in window_sizes
+        )
+        category_delivery = _fetch(con, f"""
+            WITH valid_orders AS (
+                SELECT order_key, {DELIVERY_DAYS} AS delivery_time_days
+                FROM orders
+                WHERE order_delivered_customer_date IS NOT NULL AND order_purchase_timestamp IS NOT NULL
+            ), category_delivery AS (
+                SELECT i.order_id, i.product_id, p.product_category_name, v.delivery_time_days, i.row_id
+                FROM order_items i
+                JOIN products p ON p.product_key = i.product_key
+                JOIN valid_orders v ON v.order_key = i.order_key
+                WHERE v.delivery_time_days > 0
+            )
+            SELECT order_id, product_id, product_category_name, delivery_time_days,
+                   {rolling},
+                   AVG(delivery_time_days) OVER (PARTITION BY product_category_name) AS category_mean
+            FROM category_delivery
+            ORDER BY product_category_name NULLS LAST, delivery_time_days, row_id
+        """, dtypes)
+        for column in [*(f'rolling_avg_{window_size}d' for window_size in window_sizes), 'category_mean']:
+            category_delivery[column] = np.round(category_delivery[column].to_numpy(), 2)
+        results['category_delivery_time'] = category_delivery
+        return results
+    finally:
+        con.close()
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from src.date_keys import date_keys
+
+# Order columns that the order_items consumers (the window functions and the fact table) need.
+# enrich_order_items copies them onto the order_items frame once, so later consumers read them from there
+# instead of joining orders again.
+ORDER_COLUMNS = ['customer_key', 'order_purchase_timestamp', 'order_delivered_customer_date']
+
+SECONDS_PER_DAY = 60 * 60 * 24
+
+# Columns computed from other columns of the enriched frame. derived() adds each one the first time it is
+# asked for, so they are computed once however many consumers read them.
+DERIVED_COLUMNS = {
+    'total_price': lambda df: df['price'] + df['freight_value'],
+    'profit_margin': lambda df: df['price'] - df['freight_value'],
+    'delivery_time_days': lambda df: (
+            (df['order_delivered_customer_date'] - df['order_purchase_timestamp']).dt.total_seconds() / SECONDS_PER_DAY
+    ),
+    # Whole days for the fact table, 0 when the order wasn't delivered
+    'delivery_time': lambda df: derived(df, 'delivery_time_days').fillna(0).astype(int),
+    'purchase_date_id': lambda df: date_keys(df['order_purchase_timestamp']),
+    'delivery_date_id': lambda df: date_keys(df['order_delivered_customer_date'])
+}
+
+
+def attach_order_columns(order_items_df, orders_df, columns=ORDER_COLUMNS):
+    # Adds the columns that order_items_df doesn't have yet, looked up by order_key, in place. Each item's
+    # order is found by position rather than by a merge, so the item columns aren't copied. Items without an
+    # order get missing values, as in a left merge.
+    missing = [col for col in columns if col not in order_items_df.columns]
+    if not missing:
+        return order_items_df
+
+    order_index = pd.Index(orders_df['order_key'])
+    if not order_index.is_unique:
+        return order_items_df.merge(orders_df[['order_key', *missing]], on='order_key', how='left')
+
+    positions = order_index.get_indexer(order_items_df['order_key'])
+    for col in missing:
+        values = orders_df[col]
+        values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+        order_items_df[col] = pd.api.extensions.take(values, positions, allow_fill=True)
+    return order_items_df
+
+
+def derived(df, column):
+    # Memoized derived column: computed and stored on df on first use
+    if column not in df.columns:
+        df[column] = DERIVED_COLUMNS[column](df)
+    return df[column]
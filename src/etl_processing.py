@@ -1,8 +1,9 @@
 import warnings
 import logging
+from functools import partial
 from pathlib import Path
-from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 from src.models.data_schemas import SCHEMAS
@@ -17,167 +18,172 @@ from src.models.olist_model import (
     OlistSellersModel,
     ProductCategoryNameTranslationModel
 )
+from src.cache import StageCache, code_digest, combine_digests, file_digest
+from src.chunked import process_in_chunks
+from src.geo_index import GEO_INDEX_FILE, ZipCentroidAccumulator
+from src.instrumentation import (
+    collect,
+    instrumented,
+    measure,
+    reset,
+    run_instrumented,
+    setup_logging,
+    write_manifest
+)
+from src.key_registry import KeyRegistry
+from src.load_checkpoint import frame_fingerprint
+from src.partitions import (
+    PARTITION_COLUMN,
+    PARTITIONED,
+    order_months,
+    partition_path,
+    read_manifest,
+    replace_manifest,
+    row_months,
+    split_months,
+    write_partition
+)
+from src.processed import OUTPUT_DIR, load_clean_output, output_name
+from src.quarantine import FAILURE_MODE, quarantine_path, write_quarantine
+from src.running_totals import CustomerSalesState, customer_items, customer_sales
+from src.scheduler import Stage, run_stages
+from src.storage import OUTPUT_FORMAT, FrameWriter, frame_path, write_frame
+from src.validation import VALIDATION_LEVEL, projected, validate
+from src import (
+    chunked, duckdb_engine, enrichment, geo_index, ingest, partitions, quarantine, running_totals, storage, validation,
+    window_engine
+)
+from src.models import data_schemas, olist_model
+from src.duckdb_engine import ENGINE, ENGINES
+from src.enrichment import attach_order_columns, derived
+from src.window_engine import (
+    SortedGroups,
+    grouped_mean,
+    rolling_means,
+    sort_codes,
+    sorted_order
+)
 
 warnings.filterwarnings('ignore')
 
 # Directory settings
 INPUT_DIR = Path('../data/raw')
-OUTPUT_DIR = Path('../data/processed')
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-
-def setup_logging():
-    log_dir = Path('../logs')
-    log_dir.mkdir(parents=True, exist_ok=True)
-
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    log_file = log_dir / f'etl_process_{timestamp}.log'
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
-    )
-
-    return logging.getLogger()
+# Trailing window sizes (in orders) for the per-category delivery time averages
+ROLLING_WINDOWS = [3, 7, 14]
 
 
-def create_window_functions(orders_df, order_items_df, customers_df, products_df):
+@instrumented('transform')
+def create_window_functions(orders_df, order_items_df, customers_df, products_df, sales_state=None):
+    # With sales_state (a CustomerSalesState), customer_sales is brought up to date from the saved per-customer
+    # state: the results are its outputs from CustomerSalesState.refresh instead of the full customer_sales
     results = {}
 
 
-    # More efficient implementation with direct joins
-    customer_orders = (
-        order_items_df
-        .merge(orders_df[['order_id', 'customer_id']], on='order_id')
-        .merge(customers_df[['customer_id', 'customer_unique_id']], on='customer_id')
-        .sort_values(['customer_unique_id', 'shipping_limit_date'])
-    )
-
-    # Calculate cumulative sales per customer
-    customer_orders['cumulative_sales'] = customer_orders.groupby('customer_unique_id')['price'].cumsum()
-
-    # Calculate percentage of total customer spend and order rank by price
-    customer_orders['total_customer_sales'] = customer_orders.groupby('customer_unique_id')['price'].transform('sum')
-    customer_orders['percent_of_total'] = (
-            customer_orders['cumulative_sales'] / customer_orders['total_customer_sales'] * 100).round(2)
-    customer_orders['price_rank'] = customer_orders.groupby('customer_unique_id')['price'].rank(method='dense',
-                                                                                                ascending=False)
-
-    results['customer_sales'] = customer_orders[[
-        'customer_unique_id', 'order_id', 'price',
-        'cumulative_sales', 'total_customer_sales', 'percent_of_total', 'price_rank'
-    ]]
-
-    # Calculate delivery time in days for valid orders
-    orders_with_delivery = orders_df.dropna(subset=['order_delivered_customer_date', 'order_purchase_timestamp']).copy()
-    orders_with_delivery['delivery_time_days'] = (
-            (orders_with_delivery['order_delivered_customer_date'] - orders_with_delivery['order_purchase_timestamp'])
-            .dt.total_seconds() / (60 * 60 * 24)
-    )
+    # order_items from the order_items stage already carries the order columns and delivery days
+    # (src/enrichment.py); other frames get them attached to a shallow copy, leaving the caller's frame as is
+    order_items_df = attach_order_columns(order_items_df.copy(deep=False), orders_df)
 
+    if sales_state is None:
+        results['customer_sales'] = customer_sales(customer_items(order_items_df, customers_df))
+    else:
+        results.update(sales_state.refresh(order_items_df, customers_df))
 
-    valid_orders = orders_with_delivery[orders_with_delivery['delivery_time_days'] > 0]
-
-    # Join product categories with order items and delivery times
+    # Join product categories with the items of orders delivered after their purchase
+    # (categories are sorted by integer codes ordered like their names, not by comparing the strings)
+    delivered = (derived(order_items_df, 'delivery_time_days') > 0).to_numpy()
     category_delivery = (
-        order_items_df[['order_id', 'product_id']]
-        .merge(products_df[['product_id', 'product_category_name']], on='product_id')
-        .merge(valid_orders[['order_id', 'delivery_time_days']], on='order_id')
+        order_items_df.loc[delivered, ['product_key', 'order_id', 'product_id', 'delivery_time_days']]
+        .merge(products_df[['product_key', 'product_category_name']]
+               .assign(category_code=sort_codes(products_df['product_category_name'])), on='product_key')
+        [['order_id', 'product_id', 'product_category_name', 'category_code', 'delivery_time_days']]
     )
+    category_codes = category_delivery.pop('category_code').to_numpy()
+    order = sorted_order(category_codes, category_delivery['delivery_time_days'].to_numpy())
+    category_delivery = category_delivery.iloc[order]
 
-    category_delivery = category_delivery.sort_values(['product_category_name', 'delivery_time_days'])
+    # Calculate rolling averages with different window sizes in a single pass over the sorted rows
+    categories = SortedGroups(category_codes[order])
+    delivery_days = category_delivery['delivery_time_days'].to_numpy(dtype=float)
+    for window_size, rolling_mean in zip(ROLLING_WINDOWS, rolling_means(delivery_days, categories, ROLLING_WINDOWS)):
+        category_delivery[f'rolling_avg_{window_size}d'] = np.round(rolling_mean, 2)
 
-    # Calculate rolling averages with different window sizes
-    for window_size in [3, 7, 14]:
-        column_name = f'rolling_avg_{window_size}d'
-        category_delivery[column_name] = (
-            category_delivery
-            .groupby('product_category_name')['delivery_time_days']
-            .transform(lambda x: x.rolling(window=window_size, min_periods=1).mean().round(2))
-        )
-
-
-    category_delivery['category_mean'] = (
-        category_delivery
-        .groupby('product_category_name')['delivery_time_days']
-        .transform('mean')
-        .round(2)
-    )
+    category_delivery['category_mean'] = np.round(grouped_mean(delivery_days, categories), 2)
 
     results['category_delivery_time'] = category_delivery
 
     return results
 
 
+@instrumented('transform')
 def process_customers(df):
-    df['customer_city'] = df['customer_city'].str.title()
-    return OlistCustomersModel.validate(df)
+    # Columns may be missing from projected reads (see OUTPUT_COLUMNS), so each process_* touches only those present
+    if 'customer_city' in df.columns:
+        df['customer_city'] = df['customer_city'].str.title()
+    return validate(OlistCustomersModel, df)
 
 
+@instrumented('transform')
 def process_geolocation(df):
     df = df.drop_duplicates()
     df['geolocation_city'] = df['geolocation_city'].str.title()
-    return OlistGeolocationModel.validate(df)
+    return validate(OlistGeolocationModel, df)
 
 
+@instrumented('transform')
 def process_order_items(df, orders_df=None, payments_df=None):
-    df['shipping_limit_date'] = pd.to_datetime(df['shipping_limit_date'])
-    validated_df = OlistOrderItemsModel.validate(df)
-    validated_df['total_price'] = validated_df['price'] + validated_df['freight_value']
-    validated_df['profit_margin'] = validated_df['price'] - validated_df['freight_value']
-
+    validated_df = validate(OlistOrderItemsModel, df)
+    derived(validated_df, 'total_price')
+    derived(validated_df, 'profit_margin')
+    return enrich_order_items(validated_df, orders_df, payments_df)
+
+
+@instrumented('transform')
+def enrich_order_items(validated_df, orders_df=None, payments_df=None):
+    # Builds the shared enriched frame: the order columns and delivery days are attached here once and read
+    # by the window functions and the fact table. Lookups run on the integer surrogate keys attached by the
+    # key registry; the shallow copy keeps the new columns off the caller's frame.
+    validated_df = validated_df.copy(deep=False)
     if orders_df is not None:
-        orders_df['order_purchase_timestamp'] = pd.to_datetime(orders_df['order_purchase_timestamp'])
-        orders_df['order_delivered_customer_date'] = pd.to_datetime(orders_df['order_delivered_customer_date'])
-        orders_slim = orders_df[['order_id', 'order_purchase_timestamp', 'order_delivered_customer_date']]
-        merged_df = pd.merge(validated_df, orders_slim, on='order_id', how='left')
-        merged_df['delivery_time_days'] = (
-                (merged_df['order_delivered_customer_date'] - merged_df['order_purchase_timestamp'])
-                .dt.total_seconds() / (60 * 60 * 24)
-        )
-        validated_df = merged_df.drop(['order_purchase_timestamp', 'order_delivered_customer_date'], axis=1)
+        validated_df = attach_order_columns(validated_df, orders_df)
+        derived(validated_df, 'delivery_time_days')
 
     if payments_df is not None:
-        payment_counts = payments_df.groupby('order_id')['payment_installments'].sum().reset_index()
-        validated_df = pd.merge(validated_df, payment_counts, on='order_id', how='left')
+        payment_counts = payments_df.groupby('order_key')['payment_installments'].sum().reset_index()
+        validated_df = attach_order_columns(validated_df, payment_counts, ['payment_installments'])
 
     return validated_df
 
 
+@instrumented('transform')
 def process_order_payments(df):
     df.loc[df['payment_installments'] == 0, 'payment_installments'] = 1
-    df.loc[df['payment_type'].isnull(), 'payment_type'] = 'not_defined'
-    return OlistOrderPaymentsModel.validate(df)
+    if 'payment_type' in df.columns:
+        if 'not_defined' not in df['payment_type'].cat.categories:
+            df['payment_type'] = df['payment_type'].cat.add_categories('not_defined')
+        df['payment_type'] = df['payment_type'].fillna('not_defined')
+    return validate(OlistOrderPaymentsModel, df)
 
 
+@instrumented('transform')
 def process_order_reviews(df):
     df = df.drop_duplicates(subset=['review_id'], keep='first')
-    df['review_creation_date'] = pd.to_datetime(df['review_creation_date'])
-    df['review_answer_timestamp'] = pd.to_datetime(df['review_answer_timestamp'])
-    df['review_comment_title'] = df['review_comment_title'].fillna('')
-    df['review_comment_message'] = df['review_comment_message'].fillna('')
-    validated_df = OlistOrderReviewsModel.validate(df)
+    for col in SCHEMAS['olist_order_reviews_dataset.csv']['text']:
+        if col in df.columns:
+            df[col] = df[col].fillna('')
+    validated_df = validate(OlistOrderReviewsModel, df)
 
     return validated_df
 
 
+@instrumented('transform')
 def process_orders(df):
-    date_columns = [
-        'order_purchase_timestamp',
-        'order_approved_at',
-        'order_delivered_carrier_date',
-        'order_delivered_customer_date',
-        'order_estimated_delivery_date'
-    ]
-    for col in date_columns:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    return OlistOrdersModel.validate(df)
+    # The timestamp columns arrive parsed from ingestion
+    return validate(OlistOrdersModel, df)
 
 
+@instrumented('transform')
 def process_products(df):
     df.rename(columns={
         'product_name_lenght': 'product_name_length',
@@ -185,117 +191,550 @@ def process_products(df):
     }, inplace=True)
     dimension_cols = ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']
     df = df.dropna(subset=dimension_cols)
-    df['product_category_name'] = df['product_category_name'].fillna('unknown')
-    df['product_name_length'] = df['product_name_length'].fillna(df['product_name_length'].median())
-    df['product_description_length'] = df['product_description_length'].fillna(
-        df['product_description_length'].median())
-    df['product_photos_qty'] = df['product_photos_qty'].fillna(1)
-    return OlistProductsModel.validate(df)
+    if 'product_category_name' in df.columns:
+        df['product_category_name'] = df['product_category_name'].fillna('unknown')
+    for col in ['product_name_length', 'product_description_length']:
+        if col in df.columns:
+            df[col] = df[col].fillna(df[col].median())
+    if 'product_photos_qty' in df.columns:
+        df['product_photos_qty'] = df['product_photos_qty'].fillna(1)
+    return validate(OlistProductsModel, df)
 
 
+@instrumented('transform')
 def process_sellers(df):
-    df['seller_city'] = df['seller_city'].str.title()
-    return OlistSellersModel.validate(df)
+    if 'seller_city' in df.columns:
+        df['seller_city'] = df['seller_city'].str.title()
+    return validate(OlistSellersModel, df)
 
 
+@instrumented('transform')
 def process_category_translation(df):
     df = df.drop_duplicates()
     df['product_category_name'] = df['product_category_name'].fillna('unknown')
     df['product_category_name'] = df['product_category_name'].str.lower().str.replace(' ', '_')
     df['product_category_name_english'] = df['product_category_name_english'].str.lower().str.replace(' ', '_')
-    return ProductCategoryNameTranslationModel.validate(df)
+    return validate(ProductCategoryNameTranslationModel, df)
+
+
+PROCESSORS = {
+    'olist_customers_dataset.csv': process_customers,
+    'olist_geolocation_dataset.csv': process_geolocation,
+    'olist_order_payments_dataset.csv': process_order_payments,
+    'olist_order_reviews_dataset.csv': process_order_reviews,
+    'olist_orders_dataset.csv': process_orders,
+    'olist_products_dataset.csv': process_products,
+    'olist_sellers_dataset.csv': process_sellers,
+    'product_category_name_translation.csv': process_category_translation
+}
+
+MODELS = {
+    'olist_customers_dataset.csv': OlistCustomersModel,
+    'olist_geolocation_dataset.csv': OlistGeolocationModel,
+    'olist_order_payments_dataset.csv': OlistOrderPaymentsModel,
+    'olist_order_reviews_dataset.csv': OlistOrderReviewsModel,
+    'olist_orders_dataset.csv': OlistOrdersModel,
+    'olist_products_dataset.csv': OlistProductsModel,
+    'olist_sellers_dataset.csv': OlistSellersModel,
+    'product_category_name_translation.csv': ProductCategoryNameTranslationModel
+}
+
+
+@instrumented('read')
+def read_dataset(filename, chunksize=None, columns=None):
+    # Typed pyarrow read driven by the SCHEMAS entry; with chunksize, an iterator of frames
+    schema = SCHEMAS[filename]
+    if chunksize:
+        return ingest.iter_csv(INPUT_DIR / filename, schema, chunksize, columns=columns)
+    return ingest.read_csv(INPUT_DIR / filename, schema, columns=columns)
+
+
+def attach_text_columns(df, filename, columns=None):
+    # Loads the entry's 'text' columns (or the given ones) that df doesn't have, e.g. after a run that didn't
+    # read them, from the raw file on demand. They are looked up by the entry's 'key', first occurrence first
+    # like the process_* dedupes, and missing text is '' as after process_order_reviews.
+    schema = SCHEMAS[filename]
+    columns = [col for col in (columns or schema.get('text', [])) if col not in df.columns]
+    if not columns:
+        return df
+    key = schema['key']
+    text = read_dataset(filename, columns=[key, *columns]).drop_duplicates(subset=key)
+    positions = pd.Index(text[key]).get_indexer(df[key])
+    for col in columns:
+        df[col] = pd.api.extensions.take(text[col].fillna('').array, positions, allow_fill=True)
+    return df
+
+
+def run_base_stage(filename, columns=None):
+    # columns projects the read (see OUTPUT_COLUMNS); None reads every column of the SCHEMAS entry. A projected
+    # frame is partial, so it is written under its own name (output_name) rather than over the clean_* output.
+    logger = logging.getLogger()
+    schema = SCHEMAS[filename]
+    output_file = frame_path(OUTPUT_DIR, output_name(filename, projected=columns is not None))
+    quarantine.reset()
+
+    # The zip centroid index is built next to (and cached with) the geolocation output, so it is only rebuilt
+    # when that file changes
+    centroids = ZipCentroidAccumulator() if filename == 'olist_geolocation_dataset.csv' else None
+    with projected(columns is not None):
+        if schema.get('chunksize'):
+            # Streaming mode: transform, validate and write one chunk at a time. The frame is not returned, so
+            # memory stays bounded by the chunk size; later readers use the written file (load_clean_output).
+            rows = process_in_chunks(
+                read_dataset(filename, chunksize=schema['chunksize'], columns=columns),
+                PROCESSORS[filename],
+                FrameWriter(output_file),
+                dedupe_rows=schema.get('dedupe_rows', False),
+                on_chunk=centroids.add if centroids is not None else None
+            )
+            processed_df = None
+        else:
+            processed_df = PROCESSORS[filename](read_dataset(filename, columns=columns))
+            write_frame(processed_df, output_file)
+            rows = len(processed_df)
+            if centroids is not None:
+                centroids.add(processed_df)
+    logger.info(f"Saved {output_file} ({rows} rows)")
+    save_quarantine(filename)
+
+    if centroids is not None:
+        centroids.index().save(GEO_INDEX_FILE)
+        logger.info(f"Saved {GEO_INDEX_FILE}")
+    return processed_df
+
+
+def save_quarantine(filename):
+    path, rows = write_quarantine(filename)
+    if rows:
+        logging.getLogger().warning(f"Quarantined {rows} rows of {filename} to {path}")
+
+
+def run_order_items_validation_stage(columns=None):
+    logger = logging.getLogger()
+    quarantine.reset()
+    with projected(columns is not None):
+        validated_df = process_order_items(read_dataset('olist_order_items_dataset.csv', columns=columns))
+    output_file = frame_path(OUTPUT_DIR, output_name('olist_order_items_dataset.csv', 'validated',
+                                                     projected=columns is not None))
+    write_frame(validated_df, output_file)
+    logger.info(f"Saved {output_file}")
+    save_quarantine('olist_order_items_dataset.csv')
+    return validated_df
 
 
-def run_etl(logger=None):
-    if logger is None:
-        logger = setup_logging()
+def run_order_items_stage(validated_df, orders_df, payments_df, engine='pandas', projected=False):
+    logger = logging.getLogger()
+    if engine == 'duckdb':
+        processed_order_items = duckdb_engine.enrich_order_items(validated_df, orders_df, payments_df)
+    else:
+        processed_order_items = enrich_order_items(validated_df, orders_df, payments_df)
+    output_file = frame_path(OUTPUT_DIR, output_name('olist_order_items_dataset.csv', projected=projected))
+    write_frame(processed_order_items, output_file)
+    logger.info(f"Saved {output_file}")
+    return processed_order_items
+
+
+WINDOW_OUTPUTS = ['customer_sales', 'category_delivery_time']
+
+
+def incremental_sales(engine='pandas'):
+    # Whether the window stage keeps customer_sales up to date from its per-customer state (src/running_totals.py),
+    # which only the pandas engine does
+    return engine != 'duckdb' and running_totals.INCREMENTAL
+
+
+def window_outputs(incremental=False):
+    # With the customer_sales state, customer_sales is its base, delta and changed rows, plus the state itself
+    if not incremental:
+        return [frame_path(OUTPUT_DIR, f"window_{name}") for name in WINDOW_OUTPUTS]
+    names = [name for name in WINDOW_OUTPUTS if name != 'customer_sales'] + running_totals.STATE_OUTPUTS
+    return [frame_path(OUTPUT_DIR, f"window_{name}") for name in names] + [running_totals.STATE_DIR]
+
+
+def remove_stale_sales_outputs(incremental=False):
+    # The customer_sales files of the other mode are out of date, so read_customer_sales must not find them. It is
+    # also the window stage's load, since a cache hit restores only the files of its own mode.
+    stale = set(window_outputs(not incremental)) - set(window_outputs(incremental)) - {running_totals.STATE_DIR}
+    for output_file in stale:
+        output_file.unlink(missing_ok=True)
+
+
+def run_window_stage(orders_df, order_items_df, customers_df, products_df, engine='pandas', incremental=False):
+    # incremental (incremental_sales) is a stage argument, so a cached result of one mode is never reused in the other
+    logger = logging.getLogger()
+    sales_state = CustomerSalesState() if incremental else None
+    if engine == 'duckdb':
+        window_results = duckdb_engine.create_window_functions(orders_df, order_items_df, customers_df, products_df,
+                                                               ROLLING_WINDOWS)
+    else:
+        window_results = create_window_functions(orders_df, order_items_df, customers_df, products_df,
+                                                 sales_state=sales_state)
+    remove_stale_sales_outputs(incremental)
+    for name, df in window_results.items():
+        output_file = frame_path(OUTPUT_DIR, f"window_{name}")
+        write_frame(df, output_file)
+        logger.info(f"Saved {output_file}")
+    if sales_state is not None:
+        # After the outputs, so a failed write leaves the previous state with the previous output
+        sales_state.save()
+
+
+def transform_month(frames):
+    # One purchase month of the PARTITIONED datasets (raw rows by filename), cleaned and validated as the base
+    # stages do the whole files. The order_items enrichment needs the surrogate keys, so it waits for
+    # build_partitions.
+    processed = {filename: PROCESSORS[filename](df) for filename, df in frames.items() if filename in PROCESSORS}
+    processed['olist_order_items_dataset.csv'] = process_order_items(frames['olist_order_items_dataset.csv'])
+    # validate logs the rejected rows; the quarantine files are written by the base stages
+    quarantine.reset()
+    return processed
+
+
+def month_slices(months=None):
+    # The raw rows of each purchase month (all months, or those in months) as frames by filename. Every row is
+    # placed by its order, so an order's items, payments and reviews are processed together.
+    raw = {filename: read_dataset(filename) for filename in PARTITIONED}
+    # process_order_reviews keeps the first row of a review_id. One review_id can belong to orders of different
+    # months, so the duplicates are dropped across the whole file first.
+    reviews = raw['olist_order_reviews_dataset.csv']
+    raw['olist_order_reviews_dataset.csv'] = reviews.drop_duplicates(subset=['review_id'], keep='first')
+    months_by_order = order_months(raw['olist_orders_dataset.csv'])
+    positions = {filename: split_months(row_months(df, months_by_order)) for filename, df in raw.items()}
+    found = sorted(set().union(*positions.values()))
+    return {
+        month: {
+            filename: df.iloc[positions[filename].get(month, [])].reset_index(drop=True)
+            for filename, df in raw.items()
+        }
+        for month in found
+        if months is None or month in months
+    }
+
+
+def build_partitions(registry, logger, months=None, engine='pandas', max_workers=None, force=False):
+    # Writes the PARTITIONED datasets per purchase month from the raw files, so a fix to one month rebuilds only
+    # that month. Each month is cleaned and validated in its own worker process (transform_month). Its surrogate
+    # keys are assigned here, where the registry is, before it is enriched and written. months (YYYYMM) limits
+    # the build to those months. A month whose raw rows, code and settings are the same as at its last build is
+    # skipped unless force. Returns the months written or removed per dataset.
+    slices = month_slices(months)
+    previous = {filename: read_manifest(filename) for filename in PARTITIONED}
+    code = code_digest(*SHARED_CODE, *PARTITION_CODE)
+    sources = {
+        month: combine_digests(code, OUTPUT_FORMAT, VALIDATION_LEVEL, FAILURE_MODE, engine, registry.generation(),
+                               *(frame_fingerprint(frames[filename]) for filename in PARTITIONED))
+        for month, frames in slices.items()
+    }
+
+    def unchanged(month):
+        return all(
+            (entry is None and not len(slices[month][filename]))
+            or (entry is not None and entry.get('source') == sources[month]
+                and partition_path(filename, month).exists())
+            for filename, entry in ((filename, previous[filename].get(month)) for filename in PARTITIONED)
+        )
 
-    processed_dfs = {}
-    base_datasets = [
-        'olist_customers_dataset.csv',
-        'olist_geolocation_dataset.csv',
-        'olist_order_payments_dataset.csv',
-        'olist_order_reviews_dataset.csv',
-        'olist_orders_dataset.csv',
-        'olist_products_dataset.csv',
-        'olist_sellers_dataset.csv',
-        'product_category_name_translation.csv'
+    build = [month for month in slices if force or not unchanged(month)]
+    if len(build) < len(slices):
+        logger.info(f"Partitions of {len(slices) - len(build)} months are up to date")
+    stages = [
+        Stage(f"partition_{month}", partial(run_instrumented, f"partition_{month}", transform_month),
+              args=(slices[month],), label=f"{PARTITION_COLUMN}={month}")
+        for month in build
     ]
-
-    for filename in base_datasets:
-        logger.info(f"Processing {filename}...")
-        try:
-            schema = SCHEMAS[filename]
-            dtype = schema.get('dtype', {})
-            parse_dates = schema.get('parse_dates', None)
-            input_file = INPUT_DIR / filename
-            df = pd.read_csv(input_file, dtype=dtype, parse_dates=parse_dates)
-
-            if filename == 'olist_customers_dataset.csv':
-                processed_df = process_customers(df)
-            elif filename == 'olist_geolocation_dataset.csv':
-                processed_df = process_geolocation(df)
-            elif filename == 'olist_order_payments_dataset.csv':
-                processed_df = process_order_payments(df)
-            elif filename == 'olist_order_reviews_dataset.csv':
-                processed_df = process_order_reviews(df)
-            elif filename == 'olist_orders_dataset.csv':
-                processed_df = process_orders(df)
-            elif filename == 'olist_products_dataset.csv':
-                processed_df = process_products(df)
-            elif filename == 'olist_sellers_dataset.csv':
-                processed_df = process_sellers(df)
-            elif filename == 'product_category_name_translation.csv':
-                processed_df = process_category_translation(df)
-
-            processed_dfs[filename] = processed_df
-            output_file = OUTPUT_DIR / f"clean_{filename}"
-            processed_df.to_csv(output_file, index=False)
-            logger.info(f"Saved {output_file}")
-        except Exception as e:
-            logger.error(f"Error processing {filename}: {e}", exc_info=True)
-
-    logger.info("Processing order_items dataset...")
-    try:
-        if 'olist_orders_dataset.csv' in processed_dfs and 'olist_order_payments_dataset.csv' in processed_dfs:
-            schema = SCHEMAS['olist_order_items_dataset.csv']
-            input_file = INPUT_DIR / 'olist_order_items_dataset.csv'
-            order_items_df = pd.read_csv(input_file, dtype=schema.get('dtype', {}),
-                                         parse_dates=schema.get('parse_dates', None))
-            processed_order_items = process_order_items(
-                order_items_df,
-                processed_dfs['olist_orders_dataset.csv'],
-                processed_dfs['olist_order_payments_dataset.csv']
-            )
-            output_file = OUTPUT_DIR / "clean_olist_order_items_dataset.csv"
-            processed_order_items.to_csv(output_file, index=False)
-            logger.info(f"Saved {output_file}")
-            processed_dfs['olist_order_items_dataset.csv'] = processed_order_items
-        else:
-            logger.warning("Missing required datasets for order_items processing")
-    except Exception as e:
-        logger.error(f"Error processing order_items: {e}", exc_info=True)
-
-    logger.info("Creating window functions...")
-    try:
-        required = ['olist_orders_dataset.csv', 'olist_order_items_dataset.csv', 'olist_customers_dataset.csv',
-                    'olist_products_dataset.csv']
-        if all(ds in processed_dfs for ds in required):
-            window_results = create_window_functions(
-                processed_dfs['olist_orders_dataset.csv'],
-                processed_dfs['olist_order_items_dataset.csv'],
-                processed_dfs['olist_customers_dataset.csv'],
-                processed_dfs['olist_products_dataset.csv']
-            )
-            for name, df in window_results.items():
-                output_file = OUTPUT_DIR / f"window_{name}.csv"
-                df.to_csv(output_file, index=False)
-                logger.info(f"Saved {output_file}")
-        else:
-            logger.warning("Missing required datasets for window functions")
-    except Exception as e:
-        logger.error(f"Error creating window functions: {e}", exc_info=True)
-
+    months_of = {stage.name: month for stage, month in zip(stages, build)}
+    built = {filename: {} for filename in PARTITIONED}
+    written = {filename: [] for filename in PARTITIONED}
+
+    def finish(stage, result):
+        # As results arrive, like run_etl's attach_keys
+        month = months_of[stage.name]
+        frames = collect(stage.name, result)
+        for df in frames.values():
+            registry.assign(df)
+        registry.save()
+        enrich = duckdb_engine.enrich_order_items if engine == 'duckdb' else enrich_order_items
+        frames['olist_order_items_dataset.csv'] = enrich(frames['olist_order_items_dataset.csv'],
+                                                         frames['olist_orders_dataset.csv'],
+                                                         frames['olist_order_payments_dataset.csv'])
+        for filename, df in frames.items():
+            # A month left without rows (e.g. all of them quarantined) has no partition, and an earlier one is removed
+            built[filename][month] = None
+            if len(df):
+                built[filename][month], is_new = write_partition(filename, month, df, sources[month],
+                                                                 previous[filename].get(month))
+                if is_new:
+                    written[filename].append(month)
+
+    run_stages(stages, max_workers=max_workers, logger=logger, on_result=finish)
+
+    changed = {}
+    for filename in PARTITIONED:
+        # Months of the manifest that are no longer in the raw files are removed too, within months if given
+        gone = {month for month in previous[filename]
+                if month not in slices and (months is None or month in months)}
+        manifest = {month: entry for month, entry in {**previous[filename], **built[filename]}.items()
+                    if entry is not None and month not in gone}
+        removed = replace_manifest(filename, manifest)
+        changed[filename] = sorted(written[filename] + removed)
+        logger.info(f"Partitioned {filename} by {PARTITION_COLUMN}: {len(written[filename])} partitions written, "
+                    f"{len(removed)} removed")
+    return changed
+
+
+# Files a base stage writes besides its clean output
+DERIVED_OUTPUTS = {
+    'olist_geolocation_dataset.csv': [GEO_INDEX_FILE]
+}
+
+
+# Columns enrich_order_items reads from orders and payments
+ENRICHMENT_COLUMNS = {
+    'olist_orders_dataset.csv': ['order_id', 'customer_id', 'order_purchase_timestamp',
+                                 'order_delivered_customer_date'],
+    'olist_order_payments_dataset.csv': ['order_id', 'payment_installments']
+}
+
+# Raw columns each output needs per dataset, None for every column of the SCHEMAS entry (free text included).
+# run_etl(outputs=...) runs only the stages those outputs need and reads only the union of their columns.
+OUTPUT_COLUMNS = {
+    # Every clean_* dataset in full
+    'datasets': {filename: None for filename in SCHEMAS},
+    # What create_fact_table reads
+    'fact': {
+        'olist_order_items_dataset.csv': ['order_id', 'order_item_id', 'product_id', 'seller_id', 'price',
+                                          'freight_value'],
+        **ENRICHMENT_COLUMNS
+    },
+    # The other warehouse tables: the dimensions and the calendar behind dim_date
+    'dimensions': {
+        'olist_customers_dataset.csv': None,
+        'olist_geolocation_dataset.csv': None,
+        'olist_products_dataset.csv': None,
+        'olist_sellers_dataset.csv': None,
+        'product_category_name_translation.csv': None,
+        'olist_orders_dataset.csv': ENRICHMENT_COLUMNS['olist_orders_dataset.csv']
+    },
+    'window_functions': {
+        'olist_order_items_dataset.csv': ['order_id', 'product_id', 'shipping_limit_date', 'price', 'freight_value'],
+        **ENRICHMENT_COLUMNS,
+        'olist_customers_dataset.csv': ['customer_id', 'customer_unique_id'],
+        'olist_products_dataset.csv': ['product_id', 'product_category_name']
+    },
+    # build_partitions reads the raw files itself, one purchase month at a time
+    'partitions': {}
+}
+OUTPUTS = list(OUTPUT_COLUMNS)
+
+# Columns read whenever their dataset is, because its process_* function drops rows by them
+ROW_FILTER_COLUMNS = {
+    'olist_order_reviews_dataset.csv': ['review_id'],
+    'olist_products_dataset.csv': ['product_weight_g', 'product_length_cm', 'product_height_cm', 'product_width_cm']
+}
+
+
+def plan_columns(outputs):
+    # Columns to read per dataset for the given outputs; datasets no output needs are left out
+    unknown = [output for output in outputs if output not in OUTPUT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(unknown)}")
+    needed = {}
+    for output in outputs:
+        for filename, columns in OUTPUT_COLUMNS[output].items():
+            if columns is None or needed.get(filename, []) is None:
+                needed[filename] = None
+            else:
+                needed[filename] = {*needed.get(filename, []), *columns, *ROW_FILTER_COLUMNS.get(filename, [])}
+    # Kept in SCHEMAS order, so the same outputs always give the same stage cache keys
+    return {
+        filename: None if columns is None else [
+            col for col in ingest.schema_columns(SCHEMAS[filename]) if col in columns
+        ]
+        for filename, columns in needed.items()
+    }
+
+
+def build_stages(engine='pandas', outputs=None):
+    # Base datasets are independent; order_items and the window functions wait only on their own inputs.
+    # engine picks pandas or DuckDB for the order_items enrichment and the window functions. outputs (default:
+    # all) selects the stages to build and the columns their reads project to.
+    outputs = outputs or OUTPUTS
+    columns = plan_columns(outputs)
+    stages = [
+        Stage(filename, run_base_stage, args=(filename, columns[filename]),
+              outputs=[frame_path(OUTPUT_DIR, output_name(filename, projected=columns[filename] is not None)),
+                       quarantine_path(filename), *DERIVED_OUTPUTS.get(filename, [])],
+              # Streamed datasets stay on disk on a cache hit too
+              load=None if SCHEMAS[filename].get('chunksize') else partial(
+                  load_clean_output, filename, projected=columns[filename] is not None))
+        for filename in PROCESSORS
+        if filename in columns
+    ]
+    if 'olist_order_items_dataset.csv' not in columns:
+        return stages
+    order_items_projected = columns['olist_order_items_dataset.csv'] is not None
+
+    stages.append(Stage(
+        'order_items_validated',
+        run_order_items_validation_stage,
+        args=(columns['olist_order_items_dataset.csv'],),
+        label='order_items validation',
+        outputs=[frame_path(OUTPUT_DIR, output_name('olist_order_items_dataset.csv', 'validated',
+                                                    projected=order_items_projected)),
+                 quarantine_path('olist_order_items_dataset.csv')],
+        load=partial(load_clean_output, 'olist_order_items_dataset.csv', prefix='validated',
+                     projected=order_items_projected)
+    ))
+    stages.append(Stage(
+        'olist_order_items_dataset.csv',
+        run_order_items_stage,
+        deps=['order_items_validated', 'olist_orders_dataset.csv', 'olist_order_payments_dataset.csv'],
+        args=(engine, order_items_projected),
+        label='order_items',
+        outputs=[frame_path(OUTPUT_DIR, output_name('olist_order_items_dataset.csv', projected=order_items_projected))],
+        load=partial(load_clean_output, 'olist_order_items_dataset.csv', projected=order_items_projected)
+    ))
+    if 'window_functions' in outputs:
+        stages.append(Stage(
+            'window_functions',
+            run_window_stage,
+            deps=['olist_orders_dataset.csv', 'olist_order_items_dataset.csv', 'olist_customers_dataset.csv',
+                  'olist_products_dataset.csv'],
+            args=(engine, incremental_sales(engine)),
+            label='window functions',
+            outputs=window_outputs(incremental_sales(engine)),
+            load=partial(remove_stale_sales_outputs, incremental_sales(engine))
+        ))
+    return stages
+
+
+# The stage that reads, cleans and validates each raw file; for order_items, the one before the enrichment
+EXTRACT_STAGES = {
+    **{filename: filename for filename in PROCESSORS},
+    'olist_order_items_dataset.csv': 'order_items_validated'
+}
+
+
+def select_stages(stages, targets):
+    # The target stages and every stage they depend on, in build order
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)}")
+    selected, pending = set(), list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(by_name[name].deps)
+    return [stage for stage in stages if stage.name in selected]
+
+
+# Code every stage's output depends on: validation, the output writers, the models (OlistBaseModel included) and the
+# schemas
+SHARED_CODE = (validation, storage, olist_model, data_schemas)
+
+# Code each stage's output depends on, hashed into its cache key alongside its input files and upstream keys.
+# Helpers from other modules are hashed as whole modules, so their classes (e.g. RowFingerprintSet, ZipCentroidIndex)
+# are covered too.
+STAGE_CODE = {
+    **{
+        filename: (run_base_stage, read_dataset, ingest, chunked, quarantine, process, MODELS[filename])
+        for filename, process in PROCESSORS.items()
+    },
+    'olist_geolocation_dataset.csv': (run_base_stage, read_dataset, ingest, chunked, quarantine, process_geolocation,
+                                      OlistGeolocationModel, geo_index),
+    'order_items_validated': (run_order_items_validation_stage, read_dataset, ingest, process_order_items,
+                              quarantine, OlistOrderItemsModel, enrichment),
+    'olist_order_items_dataset.csv': (run_order_items_stage, enrich_order_items, enrichment, duckdb_engine),
+    'window_functions': (run_window_stage, create_window_functions, enrichment, window_engine, duckdb_engine,
+                         running_totals),
+}
+
+# Code the partitions depend on besides SHARED_CODE, hashed into each month's source digest (build_partitions)
+PARTITION_CODE = (build_partitions, month_slices, transform_month, read_dataset, ingest, quarantine, process_orders,
+                  process_order_payments, process_order_reviews, process_order_items, enrich_order_items,
+                  OlistOrdersModel, OlistOrderPaymentsModel, OlistOrderReviewsModel, OlistOrderItemsModel, enrichment,
+                  duckdb_engine, partitions)
+
+
+def assign_cache_keys(stages, logger, registry_generation=None):
+    # registry_generation (KeyRegistry.generation) is in every key: outputs carry surrogate keys, which are only
+    # valid with the registry that assigned them
+    keys = {}
+    for stage in stages:
+        if any(keys.get(dep) is None for dep in stage.deps):
+            keys[stage.name] = None
+            continue
+        parts = [stage.name, OUTPUT_FORMAT, VALIDATION_LEVEL, FAILURE_MODE, registry_generation, list(stage.args),
+                 code_digest(*SHARED_CODE, *STAGE_CODE[stage.name])]
+        parts += [keys[dep] for dep in stage.deps]
+        input_name = 'olist_order_items_dataset.csv' if stage.name == 'order_items_validated' else stage.name
+        if input_name in SCHEMAS and not stage.deps:
+            input_file = INPUT_DIR / input_name
+            if not input_file.exists():
+                keys[stage.name] = None
+                continue
+            parts += [file_digest(input_file), SCHEMAS[input_name]]
+        keys[stage.name] = stage.cache_key = combine_digests(*parts)
+    logger.info(f"Computed cache keys for {sum(key is not None for key in keys.values())} stages")
+
+
+def run_etl(logger=None, max_workers=None, force=False, use_cache=True, engine=None, outputs=None, targets=None,
+            months=None):
+    # targets (stage names) narrows the run to those stages and their upstream stages, e.g. some datasets only;
+    # 'partitions' among them builds the partitions. months (YYYYMM) limits the partitions to those purchase months.
+    if logger is None:
+        logger = setup_logging()
+    engine = engine or ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    # A new run starts a new manifest; load_to_sql_server adds its steps to it
+    reset()
+    outputs = outputs or OUTPUTS
+    stages = build_stages(engine, outputs)
+    partitioned = 'partitions' in outputs and (targets is None or 'partitions' in targets)
+    if targets is not None:
+        stages = select_stages(stages, [target for target in targets if target != 'partitions'])
+    for stage in stages:
+        # Each stage reports its step timings back with its result; attach_keys unwraps them
+        stage.func = partial(run_instrumented, stage.name, stage.func)
+    # Surrogate keys are assigned in this process as results arrive, so workers never race on the registry
+    registry = KeyRegistry()
+    cache = None
+    if use_cache:
+        assign_cache_keys(stages, logger, registry.generation())
+        cache = StageCache(logger=logger)
+
+    def attach_keys(stage, result):
+        # New keys are saved before any later stage can write (and cache) outputs that hold them
+        result = collect(stage.name, result)
+        if not isinstance(result, pd.DataFrame):
+            return result
+        registry.assign(result)
+        registry.save()
+        return result
+
+    with measure('run_etl', 'run'):
+        results = run_stages(stages, max_workers=max_workers, logger=logger, cache=cache, force=force,
+                             on_result=attach_keys)
+        if partitioned:
+            # Built month by month from the raw files, with a digest per month in place of the stage cache
+            build_partitions(registry, logger, months=months, engine=engine, max_workers=max_workers,
+                             force=force or not use_cache)
+
+    # Streamed datasets (a 'chunksize' in SCHEMAS) are left out: their frames are only on disk
+    processed_dfs = {
+        stage.name: results[stage.name]
+        for stage in stages
+        if stage.name in SCHEMAS and results.get(stage.name) is not None
+    }
+
+    write_manifest(logger, workers=max_workers, force=force, use_cache=use_cache,
+                   output_format=OUTPUT_FORMAT, validation_level=VALIDATION_LEVEL,
+                   validation_failures=FAILURE_MODE, engine=engine, outputs=list(outputs),
+                   stages=[stage.name for stage in stages], months=months)
     logger.info("ETL process completed successfully!")
     return processed_dfs
 
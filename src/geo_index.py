@@ -0,0 +1,117 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+GEO_INDEX_FILE = Path('../data/processed/geo_index.npz')
+
+# Zip code prefixes are five-digit integers, so every lookup table is an array indexed by the prefix itself
+PREFIX_SPACE = 100_000
+# Prefixes that share their first three digits (a CEP sector) cover neighbouring areas; the nearest-prefix
+# fallback never looks outside the sector
+SECTOR_SIZE = 100
+
+# Resolve prefixes missing from the geolocation data to the nearest known prefix in the same sector
+NEAREST_PREFIX_FALLBACK = os.environ.get('OLIST_GEO_NEAREST_FALLBACK', '0') == '1'
+
+
+# Mean latitude / longitude and number of geolocation points per zip code prefix
+class ZipCentroidIndex:
+    def __init__(self, lat, lng, points):
+        self.lat = lat
+        self.lng = lng
+        self.points = points
+        self._nearest = None
+
+    @classmethod
+    def from_geolocation(cls, geolocation_df):
+        return ZipCentroidAccumulator().add(geolocation_df).index()
+
+    @classmethod
+    def load(cls, path=GEO_INDEX_FILE):
+        with np.load(path) as arrays:
+            return cls(arrays['lat'], arrays['lng'], arrays['points'])
+
+    def save(self, path=GEO_INDEX_FILE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Write through a file object so numpy doesn't append its own .npz suffix
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, lat=self.lat, lng=self.lng, points=self.points)
+
+    def nearest_known(self):
+        # For every prefix, the closest prefix with geolocation points in the same sector (itself if known, -1 if
+        # the sector has none); ties go to the lower prefix. Built once, then every lookup is one array access.
+        if self._nearest is None:
+            known = np.flatnonzero(self.points > 0)
+            prefixes = np.arange(PREFIX_SPACE)
+            nearest = np.full(PREFIX_SPACE, -1, dtype=np.int64)
+            if len(known):
+                after = np.searchsorted(known, prefixes)
+                below = known[np.maximum(after - 1, 0)]
+                above = known[np.minimum(after, len(known) - 1)]
+                sector = prefixes // SECTOR_SIZE
+                below_ok = (below <= prefixes) & (below // SECTOR_SIZE == sector)
+                above_ok = (above >= prefixes) & (above // SECTOR_SIZE == sector)
+                use_above = above_ok & (~below_ok | (above - prefixes < prefixes - below))
+                nearest[below_ok] = below[below_ok]
+                nearest[use_above] = above[use_above]
+            self._nearest = nearest
+        return self._nearest
+
+    def lookup(self, prefixes, fallback=None):
+        if fallback is None:
+            fallback = NEAREST_PREFIX_FALLBACK
+        prefixes = pd.Series(prefixes).to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(prefixes) & (prefixes >= 0) & (prefixes < PREFIX_SPACE)
+        positions = np.where(valid, prefixes, 0).astype(np.int64)
+        if fallback:
+            positions = self.nearest_known()[positions]
+            valid &= positions >= 0
+        lat = np.where(valid, self.lat[positions], np.nan)
+        lng = np.where(valid, self.lng[positions], np.nan)
+        return lat, lng
+
+    def enrich(self, df, prefix_column, fallback=None):
+        df = df.copy()
+        df['geolocation_lat'], df['geolocation_lng'] = self.lookup(df[prefix_column], fallback=fallback)
+        return df
+
+
+# Per-prefix sums and counts of the geolocation points, so the index can be built one chunk at a time without
+# holding the whole geolocation frame; missing coordinates are left out of the means, as in a groupby mean
+class ZipCentroidAccumulator:
+    def __init__(self):
+        self.sums = {'lat': np.zeros(PREFIX_SPACE), 'lng': np.zeros(PREFIX_SPACE)}
+        self.counts = {'lat': np.zeros(PREFIX_SPACE, dtype=np.int64), 'lng': np.zeros(PREFIX_SPACE, dtype=np.int64)}
+        self.points = np.zeros(PREFIX_SPACE, dtype=np.int64)
+
+    def add(self, geolocation_df):
+        prefixes = geolocation_df['geolocation_zip_code_prefix'].to_numpy(dtype='float64', na_value=np.nan)
+        in_range = ~np.isnan(prefixes) & (prefixes >= 0) & (prefixes < PREFIX_SPACE)
+        prefixes = prefixes[in_range].astype(np.int64)
+        self.points += np.bincount(prefixes, minlength=PREFIX_SPACE)
+        for coordinate in self.sums:
+            values = geolocation_df[f'geolocation_{coordinate}'].to_numpy(dtype='float64', na_value=np.nan)[in_range]
+            known = ~np.isnan(values)
+            self.sums[coordinate] += np.bincount(prefixes[known], weights=values[known], minlength=PREFIX_SPACE)
+            self.counts[coordinate] += np.bincount(prefixes[known], minlength=PREFIX_SPACE)
+        return self
+
+    def index(self):
+        lat, lng = (
+            np.divide(self.sums[coordinate], self.counts[coordinate], out=np.full(PREFIX_SPACE, np.nan),
+                      where=self.counts[coordinate] > 0)
+            for coordinate in ('lat', 'lng')
+        )
+        return ZipCentroidIndex(lat, lng, self.points)
+
+
+def load_geo_index(processed_dfs=None, path=GEO_INDEX_FILE):
+    # The persisted index is written by the geolocation stage; without it, build one from the processed frame
+    if Path(path).exists():
+        return ZipCentroidIndex.load(path)
+    geolocation_df = (processed_dfs or {}).get('olist_geolocation_dataset.csv')
+    if geolocation_df is None:
+        return None
+    return ZipCentroidIndex.from_geolocation(geolocation_df)
@@ -0,0 +1,104 @@
+import logging
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from src.models.data_schemas import TIMESTAMP_FORMAT
+
+# Arrow type each SCHEMAS dtype is parsed into; 'category' columns are dictionary-encoded while parsing
+ARROW_TYPES = {
+    'string': pa.string(),
+    'Int64': pa.int64(),
+    'float': pa.float64(),
+    'category': pa.dictionary(pa.int32(), pa.string())
+}
+
+# pandas dtype for each Arrow type on conversion; dictionary columns become categoricals without a mapping
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.string(): pd.StringDtype()
+}
+
+
+def schema_columns(schema):
+    return [*schema.get('dtype', {}), *schema.get('parse_dates', [])]
+
+
+def convert_options(schema, columns=None, parse_dates=True):
+    # Every column gets its final type here, so nothing downstream has to convert or re-parse it.
+    # Only the requested columns (by default the ones SCHEMAS declares) are converted at all. With
+    # parse_dates=False, the timestamp columns are left as strings for parse_timestamps.
+    column_types = {col: ARROW_TYPES[dtype] for col, dtype in schema.get('dtype', {}).items()}
+    timestamp_type = pa.timestamp('ns') if parse_dates else pa.string()
+    column_types.update({col: timestamp_type for col in schema.get('parse_dates', [])})
+    return pa_csv.ConvertOptions(
+        column_types=column_types,
+        timestamp_parsers=[schema.get('date_format', TIMESTAMP_FORMAT)],
+        include_columns=columns or schema_columns(schema),
+        strings_can_be_null=True
+    )
+
+
+def _parse_timestamp(values, col, date_format):
+    try:
+        return pc.strptime(values, format=date_format, unit='ns')
+    except pa.ArrowInvalid:
+        # Values that don't match the format become NaT, as with pd.to_datetime(errors='coerce'), instead of
+        # failing the whole dataset
+        parsed = pd.to_datetime(values.to_pandas(), format=date_format, errors='coerce')
+        malformed = int(parsed.isna().sum()) - values.null_count
+        logging.getLogger().warning(f"{malformed} values of {col} don't match {date_format}; read as missing")
+        return pa.array(parsed, type=pa.timestamp('ns'))
+
+
+def parse_timestamps(table, schema):
+    # The 'parse_dates' columns are read as strings and parsed here: by Arrow while every value matches the
+    # format, else by pandas with the malformed values as NaT
+    date_format = schema.get('date_format', TIMESTAMP_FORMAT)
+    for col in schema.get('parse_dates', []):
+        if col in table.column_names:
+            table = table.set_column(table.column_names.index(col), col, _parse_timestamp(table[col], col, date_format))
+    return table
+
+
+def to_frame(table, self_destruct=False):
+    # self_destruct frees each Arrow column as soon as it is converted, for tables nothing else refers to
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get, split_blocks=True, self_destruct=self_destruct)
+
+
+def read_csv(path, schema, columns=None):
+    # Multithreaded read of the whole file, parsed and typed by Arrow. A timestamp that doesn't match the format
+    # fails the typed read; the file is then read again with the timestamps as strings, which parse_timestamps
+    # turns into NaT where malformed.
+    read_options = pa_csv.ReadOptions(use_threads=True)
+    try:
+        table = pa_csv.read_csv(path, read_options=read_options, convert_options=convert_options(schema, columns))
+    except pa.ArrowInvalid:
+        if not schema.get('parse_dates'):
+            raise
+        table = parse_timestamps(pa_csv.read_csv(
+            path,
+            read_options=read_options,
+            convert_options=convert_options(schema, columns, parse_dates=False)
+        ), schema)
+    return to_frame(table, self_destruct=True)
+
+
+def iter_csv(path, schema, chunksize, columns=None):
+    # Streams the file as frames of chunksize rows; Arrow reads it in blocks of bytes, so blocks are
+    # buffered and re-sliced on row boundaries. A failed block can't be read again, so the timestamps are
+    # always read as strings and parsed per chunk.
+    reader = pa_csv.open_csv(path, convert_options=convert_options(schema, columns, parse_dates=False))
+    pending, rows = [], 0
+    for batch in reader:
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield to_frame(parse_timestamps(table.slice(0, chunksize), schema))
+            rest = table.slice(chunksize)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield to_frame(parse_timestamps(pa.Table.from_batches(pending, schema=reader.schema), schema))
@@ -0,0 +1,229 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOG_DIR = Path('../logs')
+PROFILE_DIR = LOG_DIR / 'profiles'
+
+# Opt-in per-stage profiling: 'cprofile' dumps a .prof file per stage into PROFILE_DIR, 'tracemalloc' records
+# the stage's peak traced allocation and its top allocation sites. OLIST_PROFILE_STAGES limits it to a
+# comma-separated list of stage names.
+PROFILE = os.environ.get('OLIST_PROFILE', '')
+PROFILE_STAGES = [name for name in os.environ.get('OLIST_PROFILE_STAGES', '').split(',') if name]
+PROFILERS = ['', 'cprofile', 'tracemalloc']
+TOP_ALLOCATIONS = 10
+
+# Enclosing stage and nesting depth of the steps measured on the current thread
+class _Context(threading.local):
+    stage = None
+    depth = 0
+
+
+# Step records of this process; worker processes hand theirs back with the stage result
+_records = []
+_context = _Context()
+_run_info = {}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, dict):
+        frames = [v for v in value.values() if isinstance(v, pd.DataFrame)]
+        return sum(len(frame) for frame in frames) if frames else None
+    return None
+
+
+def _first_frame_rows(args):
+    return next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+
+
+@contextmanager
+def measure(step, kind, rows_in=None):
+    # Records wall time, CPU time, row counts and the growth of the process's peak RSS for one step. Set
+    # record['rows_out'] inside the block. Steps nest, and a step's times include the steps inside it; CPU
+    # time and peak RSS are per process, so steps running concurrently on threads share them.
+    record = {
+        'stage': _context.stage,
+        'step': step,
+        'kind': kind,
+        'depth': _context.depth,
+        'pid': os.getpid(),
+        'rows_in': rows_in,
+        'rows_out': None
+    }
+    peak_before = _peak_rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    _context.depth += 1
+    try:
+        yield record
+    finally:
+        _context.depth -= 1
+        record['wall_s'] = round(time.perf_counter() - wall_start, 4)
+        record['cpu_s'] = round(time.process_time() - cpu_start, 4)
+        record['peak_rss_delta_mb'] = None if peak_before is None else round(_peak_rss_mb() - peak_before, 1)
+        _records.append(record)
+
+
+def instrumented(kind, step=None):
+    # Decorator form of measure: rows_in is the first DataFrame argument, rows_out the result's length
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(step or func.__name__, kind, rows_in=_first_frame_rows(args)) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = _rows(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def _profiling(stage_name):
+    if PROFILE not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {PROFILE}")
+    return PROFILE if PROFILE and (not PROFILE_STAGES or stage_name in PROFILE_STAGES) else ''
+
+
+# Returned by run_instrumented in place of the bare stage result, so the worker's records reach the parent
+class StageOutput:
+    def __init__(self, value, records):
+        self.value = value
+        self.records = records
+
+
+def run_instrumented(stage_name, func, *args):
+    # Runs one stage (usually in a worker process) under a stage-level measure and the opt-in profiler
+    _records.clear()
+    _context.stage = stage_name
+    profiler = _profiling(stage_name)
+    profile = cProfile.Profile() if profiler == 'cprofile' else None
+    if profiler == 'tracemalloc':
+        tracemalloc.start()
+    try:
+        with measure(stage_name, 'stage', rows_in=_first_frame_rows(args)) as record:
+            if profile is not None:
+                value = profile.runcall(func, *args)
+            else:
+                value = func(*args)
+            record['rows_out'] = _rows(value)
+            if profile is not None:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                record['profile'] = str(PROFILE_DIR / f"{Path(stage_name).stem}.prof")
+                profile.dump_stats(record['profile'])
+            if profiler == 'tracemalloc':
+                record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+                record['top_allocations'] = [
+                    str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+                ]
+    finally:
+        if profiler == 'tracemalloc':
+            tracemalloc.stop()
+        _context.stage = None
+    return StageOutput(value, list(_records))
+
+
+def collect(stage_name, result):
+    # Unwraps a stage result in the parent process, keeping its records; results restored from the
+    # cache were never run, so they are recorded as cache hits
+    if isinstance(result, StageOutput):
+        _records.extend(result.records)
+        return result.value
+    _records.append({'stage': stage_name, 'step': stage_name, 'kind': 'stage', 'depth': 0, 'pid': os.getpid(),
+                     'cached': True})
+    return result
+
+
+def records():
+    return list(_records)
+
+
+def reset():
+    _records.clear()
+    _run_info.clear()
+
+
+def summarize(step_records):
+    # Totals per (stage, step, kind), for steps that run several times such as per-chunk transforms
+    summary = {}
+    for record in step_records:
+        key = f"{record['stage']}:{record['step']}:{record['kind']}"
+        entry = summary.setdefault(key, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0, 'rows_out': 0})
+        entry['calls'] += 1
+        entry['wall_s'] = round(entry['wall_s'] + record.get('wall_s', 0.0), 4)
+        entry['cpu_s'] = round(entry['cpu_s'] + record.get('cpu_s', 0.0), 4)
+        entry['rows_in'] += record.get('rows_in') or 0
+        entry['rows_out'] += record.get('rows_out') or 0
+    return summary
+
+
+def setup_logging():
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    log_file = LOG_DIR / f'etl_process_{timestamp}.log'
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+
+    return logging.getLogger()
+
+
+def manifest_path(logger=None):
+    # Next to the run's log file (etl_process_<timestamp>.log -> etl_process_<timestamp>.json)
+    for handler in (logger or logging.getLogger()).handlers:
+        if isinstance(handler, logging.FileHandler):
+            return Path(handler.baseFilename).with_suffix('.json')
+    return LOG_DIR / f"etl_process_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+
+def write_manifest(logger=None, path=None, **run_info):
+    # Writes every record collected in this process so far; later calls rewrite the file with the
+    # records (and run_info) added since, so the ETL and load phases of one run end up in one manifest
+    _run_info.update(run_info)
+    path = Path(path or manifest_path(logger))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    step_records = records()
+    peak_rss_mb = _peak_rss_mb()
+    manifest = {
+        'written': datetime.now().isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'peak_rss_mb': None if peak_rss_mb is None else round(peak_rss_mb, 1),
+        **_run_info,
+        'summary': summarize(step_records),
+        'steps': step_records
+    }
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2, default=str))
+    tmp_path.replace(path)
+    (logger or logging.getLogger()).info(f"Wrote run manifest {path}")
+    return path
@@ -0,0 +1,112 @@
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REGISTRY_DIR = Path('../data/registry')
+GENERATION_FILE = 'generation'
+
+# Natural key columns (32-char hex strings) and the integer surrogate column added next to them
+SURROGATE_KEYS = {
+    'order_id': 'order_key',
+    'customer_id': 'customer_key',
+    'customer_unique_id': 'customer_unique_key',
+    'product_id': 'product_key',
+    'seller_id': 'seller_key',
+    'review_id': 'review_key'
+}
+
+
+# Append-only mapping of natural keys to integer surrogates; a key's surrogate is its position + 1,
+# so surrogates never change once assigned and stay stable across runs
+class KeyRegistry:
+    def __init__(self, registry_dir=REGISTRY_DIR):
+        self.registry_dir = Path(registry_dir)
+        self._indexes = {}
+        self._changed = set()
+
+    def generation(self):
+        # Id of this registry, written when it is first asked for. Surrogates are only stable within one registry,
+        # so whatever keeps them (e.g. cached stage outputs) is tied to its generation; deleting the registry
+        # starts a new one.
+        path = self.registry_dir / GENERATION_FILE
+        if not path.exists():
+            self.registry_dir.mkdir(parents=True, exist_ok=True)
+            path.write_text(uuid.uuid4().hex)
+        return path.read_text().strip()
+
+    def _path(self, column):
+        return self.registry_dir / f"{column}.parquet"
+
+    def _index(self, column):
+        if column not in self._indexes:
+            path = self._path(column)
+            if path.exists():
+                self._indexes[column] = pd.Index(pd.read_parquet(path)['natural_key'].astype(object))
+            else:
+                self._indexes[column] = pd.Index([], dtype=object)
+        return self._indexes[column]
+
+    def encode(self, column, values):
+        values = pd.Series(values).astype(object)
+        present = values.notna().to_numpy()
+        index = self._index(column)
+
+        codes = index.get_indexer(values)
+        unknown = (codes == -1) & present
+        if unknown.any():
+            new_keys = pd.unique(values[unknown])
+            index = self._indexes[column] = index.append(pd.Index(new_keys, dtype=object))
+            self._changed.add(column)
+            codes[unknown] = index.get_indexer(values[unknown])
+
+        if present.all():
+            return codes.astype(np.int64) + 1
+        surrogates = pd.array(codes + 1, dtype='Int64')
+        surrogates[~present] = pd.NA
+        return surrogates
+
+    def decode(self, column, keys):
+        return self._index(column).take(np.asarray(keys, dtype=np.int64) - 1)
+
+    def assign(self, df):
+        # Adds the surrogate column for every natural key column in df that doesn't have one yet
+        for natural, surrogate in SURROGATE_KEYS.items():
+            if natural in df.columns and surrogate not in df.columns:
+                df[surrogate] = self.encode(natural, df[natural])
+        return df
+
+    def mismatched(self, df):
+        # Surrogate columns df already carries that don't match the registry, e.g. in outputs written before the
+        # registry was deleted
+        mismatched = []
+        for natural, surrogate in SURROGATE_KEYS.items():
+            if natural in df.columns and surrogate in df.columns:
+                expected = pd.array(self.encode(natural, df[natural]), dtype='Int64')
+                if not expected.equals(pd.array(df[surrogate], dtype='Int64')):
+                    mismatched.append(surrogate)
+        return mismatched
+
+    def save(self):
+        self.registry_dir.mkdir(parents=True, exist_ok=True)
+        for column in self._changed:
+            pd.DataFrame({'natural_key': pd.Series(self._indexes[column], dtype='string')}).to_parquet(
+                self._path(column), index=False
+            )
+        self._changed.clear()
+
+
+def attach_surrogate_keys(processed_dfs, registry=None):
+    # Frames read back from disk may carry surrogates of an earlier registry. Those can't be re-encoded here (the
+    # customer_key of order_items has no customer_id next to it), so they fail the load instead of corrupting it.
+    registry = registry or KeyRegistry()
+    for filename, df in processed_dfs.items():
+        if isinstance(df, pd.DataFrame):
+            mismatched = registry.mismatched(df)
+            if mismatched:
+                raise ValueError(f"{filename} carries {', '.join(mismatched)} of another key registry; "
+                                 f"run the transform again")
+            registry.assign(df)
+    registry.save()
+    return processed_dfs
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+CHECKPOINT_DIR = Path('../data/checkpoints')
+
+
+def frame_fingerprint(df):
+    # Content hash of a frame (columns, dtypes and values), to tell whether a staged table holds the same rows
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Records which tables of a replace load have reached their staging table, so a retry after a failure loads only
+# the tables that hadn't. One file per warehouse; it is removed once the staged tables are swapped into place.
+class LoadCheckpoint:
+    def __init__(self, target, checkpoint_dir=CHECKPOINT_DIR, logger=None):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        target_id = hashlib.sha256(str(target).encode()).hexdigest()[:16]
+        self.checkpoint_file = self.checkpoint_dir / f"load_{target_id}.json"
+        self.logger = logger or logging.getLogger()
+        self.lock = threading.Lock()
+        self.tables = self._read()
+
+    def _read(self):
+        if not self.checkpoint_file.exists():
+            return {}
+        try:
+            return json.loads(self.checkpoint_file.read_text())['tables']
+        except (ValueError, KeyError) as e:
+            self.logger.warning(f"Ignoring unreadable load checkpoint {self.checkpoint_file}: {e}")
+            return {}
+
+    def _write(self):
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.checkpoint_file.with_suffix('.tmp')
+        tmp_file.write_text(json.dumps({'tables': self.tables}, indent=2))
+        tmp_file.replace(self.checkpoint_file)
+
+    def is_staged(self, table_name, fingerprint, rows):
+        entry = self.tables.get(table_name)
+        return entry is not None and entry['fingerprint'] == fingerprint and entry['rows'] == rows
+
+    def mark_staged(self, table_name, fingerprint, rows):
+        with self.lock:
+            self.tables[table_name] = {'fingerprint': fingerprint, 'rows': rows}
+            self._write()
+
+    def clear(self):
+        with self.lock:
+            self.tables = {}
+            self.checkpoint_file.unlink(missing_ok=True)
@@ -1,89 +1,588 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
+from pathlib import Path
 import logging
+import re
+import threading
+import time
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-
-
-def log_error(conn, error_message, table_name="unknown"):
-    create_table_sql = """
-    IF NOT EXISTS (
-        SELECT * 
-        FROM sys.tables t
-        INNER JOIN sys.schemas s ON t.schema_id = s.schema_id
-        WHERE t.name = 'etl_error_log' AND s.name = 'dw'
-    )
-    BEGIN
-        CREATE TABLE dw.etl_error_log (
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.pool import StaticPool
+
+from src.aggregates import AGGREGATE_KEYS, aggregate_delta, build_aggregates, fold_delta, partition_delta
+from src.bulk_load import bulk_insert, timed_bulk_insert
+from src.date_keys import build_calendar
+from src.enrichment import attach_order_columns, derived
+from src.geo_index import load_geo_index
+from src.instrumentation import measure, write_manifest
+from src.key_registry import attach_surrogate_keys
+from src.load_checkpoint import LoadCheckpoint, frame_fingerprint
+from src.partitions import purchase_months
+from src.quarantine import REASON_COLUMN, mark_logged, pending_quarantine
+
+# Primary keys from ddl.sql, used to merge incremental loads
+TABLE_KEYS = {
+    'dim_date': ['date_id'],
+    'dim_customers': ['customer_key'],
+    'dim_products': ['product_key'],
+    'dim_sellers': ['seller_key'],
+    'fact_order_items': ['order_key', 'order_item_id'],
+    **AGGREGATE_KEYS
+}
+
+WATERMARK_TABLE = 'etl_watermark'
+# One row per successful load; report results are cached per version (src/reports.py)
+LOAD_VERSION_TABLE = 'etl_load_version'
+# Orders purchased up to this long before the watermark are staged again to pick up late changes (e.g. deliveries)
+INCREMENTAL_LOOKBACK = pd.Timedelta(days=30)
+
+# Concurrent dimension builds and table loads, and the connection pool size that backs them
+LOAD_WORKERS = 4
+
+LOAD_MODES = ['replace', 'incremental', 'partitions']
+
+# Replace loads write each table to <STAGING_PREFIX><table> first and swap them all in at the end
+STAGING_PREFIX = 'stg_'
+# Staging tables are created from their ddl.sql definitions, so the swapped-in tables keep its keys and indexes
+DDL_FILE = Path(__file__).resolve().parent.parent / 'ddl.sql'
+
+ERROR_LOG_TABLE = 'etl_error_log'
+# Rows per INSERT when writing to the error log
+ERROR_LOG_BATCH = 1000
+
+# Keys per IN (...) lookup when folding fact deltas into the summary tables (SQL Server allows 2100 parameters)
+AGGREGATE_LOOKUP_BATCH = 1000
+
+
+def create_warehouse_engine(connection_string, pool_size=LOAD_WORKERS):
+    if not connection_string.startswith('sqlite'):
+        options = {}
+        if make_url(connection_string).drivername == 'mssql+pyodbc':
+            # Only honoured at engine creation: it also turns off SQLAlchemy's insertmanyvalues batching, so
+            # executemany inserts go through pyodbc's parameter arrays (bulk_load's fast_executemany strategy)
+            options['fast_executemany'] = True
+        return create_engine(connection_string, pool_size=pool_size, max_overflow=2, pool_pre_ping=True, **options)
+
+    # SQLite stands in for SQL Server locally: the database file is attached a second time as the dw schema
+    engine = create_engine(connection_string)
+    database = engine.url.database or ':memory:'
+    if database == ':memory:':
+        engine = create_engine(connection_string, poolclass=StaticPool,
+                               connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def attach_dw_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{database}' AS dw")
+        # pysqlite only opens transactions before DML, so DDL would autocommit; BEGIN is emitted explicitly
+        # instead, making table swaps transactional as they are on SQL Server
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(conn):
+        conn.exec_driver_sql('BEGIN')
+
+    return engine
+
+
+def _create_error_log(conn, schema='dw'):
+    if inspect(conn).has_table(ERROR_LOG_TABLE, schema=schema):
+        return
+    if conn.dialect.name == 'sqlite':
+        create_table_sql = f"""
+        CREATE TABLE {schema}.{ERROR_LOG_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name VARCHAR(255) DEFAULT 'unknown',
+            error_message TEXT NOT NULL,
+            error_time DATETIME NOT NULL
+        )
+        """
+    else:
+        create_table_sql = f"""
+        CREATE TABLE {schema}.{ERROR_LOG_TABLE} (
             id INT IDENTITY(1,1) PRIMARY KEY,
             table_name VARCHAR(255) DEFAULT 'unknown',
             error_message NVARCHAR(MAX) NOT NULL,
             error_time DATETIME NOT NULL
-        );
-    END
-    """
+        )
+        """
     conn.execute(text(create_table_sql))
-    conn.commit()
 
+
+def log_errors(conn, errors, schema='dw'):
+    # errors: (table_name, message) pairs, inserted ERROR_LOG_BATCH rows per statement and committed once
+    if not errors:
+        return
+    _create_error_log(conn, schema)
     current_time = datetime.now()
-    insert_sql = """
-    INSERT INTO dw.etl_error_log (table_name, error_message, error_time)
-    VALUES (:table_name, :error_message, :error_time)
-    """
-    conn.execute(text(insert_sql), {
-        "table_name": table_name,
-        "error_message": str(error_message),
-        "error_time": current_time
-    })
+    insert_sql = text(f"INSERT INTO {schema}.{ERROR_LOG_TABLE} (table_name, error_message, error_time) "
+                      "VALUES (:table_name, :error_message, :error_time)")
+    for start in range(0, len(errors), ERROR_LOG_BATCH):
+        conn.execute(insert_sql, [
+            {"table_name": table_name, "error_message": str(message), "error_time": current_time}
+            for table_name, message in errors[start:start + ERROR_LOG_BATCH]
+        ])
     conn.commit()
 
 
-def load_dataframe_to_sql(df, table_name, engine, schema='dw', logger=None):
+def log_error(conn, error_message, table_name="unknown"):
+    log_errors(conn, [(table_name, error_message)])
+
+
+def quarantine_errors(quarantined):
+    # One error log entry per quarantined row, with its reasons and its *_id columns to find it by
+    errors = []
+    for filename, rows in quarantined.items():
+        keys = [col for col in rows.columns if col.endswith('_id')]
+        for reason, *values in rows[[REASON_COLUMN, *keys]].astype(str).itertuples(index=False):
+            row_ids = ', '.join(f"{col}={value}" for col, value in zip(keys, values))
+            errors.append((filename, f"Quarantined row: {reason}" + (f" [{row_ids}]" if row_ids else '')))
+    return errors
+
+
+def log_quarantine(engine, logger=None):
+    # Rows the ETL run set aside at validation go to the error log, one entry per row, once the load has
+    # committed. Rows already logged to this warehouse (by an earlier load of the same run) are skipped.
+    if logger is None:
+        logger = logging.getLogger()
+    target = engine.url.render_as_string(hide_password=True)
+    pending = pending_quarantine(target)
+    if not pending:
+        return
+    errors = quarantine_errors({filename: rows for filename, (rows, _) in pending.items()})
+    with engine.connect() as conn:
+        _timed("Logging quarantined rows", log_errors, conn, errors, logger=logger)
+    mark_logged(target, pending)
+    logger.warning(f"Logged {len(errors)} quarantined rows from {', '.join(pending)} to {ERROR_LOG_TABLE}")
+
+
+def load_dataframe_to_sql(df, table_name, engine, schema='dw', logger=None, strategy=None, chunksize=None):
     if logger is None:
         logger = logging.getLogger()
 
-    df.to_sql(table_name, engine, if_exists='replace', index=False, schema=schema)
+    timed_bulk_insert(df, table_name, engine, schema, strategy=strategy, chunksize=chunksize,
+                      if_exists='replace', logger=logger)
     logger.info(f"Loaded {table_name} into SQL Server.")
 
 
-def create_date_dimension(orders_df):
-    purchase_dates = orders_df['order_purchase_timestamp'].dropna().dt.date.unique()
-    delivered_dates = orders_df['order_delivered_customer_date'].dropna().dt.date.unique()
-    unique_dates = pd.Series(list(set(purchase_dates) | set(delivered_dates))).sort_values()
+def staging_table(table_name):
+    return f"{STAGING_PREFIX}{table_name}"
 
-    date_dim = pd.DataFrame({'date': pd.to_datetime(unique_dates)})
-    date_dim['date_id'] = date_dim['date'].dt.strftime('%Y%m%d').astype(int)
-    date_dim['year'] = date_dim['date'].dt.year
-    date_dim['month'] = date_dim['date'].dt.month
-    date_dim['day'] = date_dim['date'].dt.day
-    date_dim['quarter'] = date_dim['date'].dt.quarter
-    date_dim['day_of_week'] = date_dim['date'].dt.dayofweek
-    date_dim['is_weekend'] = date_dim['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
 
-    return date_dim
+def read_ddl(ddl_file=DDL_FILE):
+    # The CREATE TABLE statement of every table in ddl.sql and its (index name, columns) pairs
+    tables, indexes = {}, {}
+    for statement in re.sub(r'--[^\n]*', '', Path(ddl_file).read_text()).split(';'):
+        statement = statement.strip()
+        if match := re.match(r'CREATE TABLE (\w+)', statement):
+            tables[match[1]] = statement
+        elif match := re.match(r'CREATE INDEX (\w+) ON (\w+)\s*\((.*)\)', statement, re.S):
+            indexes.setdefault(match[2], []).append((match[1], match[3].strip()))
+    return tables, indexes
 
 
-def create_customers_dimension(customers_df, processed_dfs):
-    geolocation_df = processed_dfs.get('olist_geolocation_dataset.csv')
+def _referenced_tables(create_sql):
+    return re.findall(r'REFERENCES (\w+)', create_sql)
 
-    if geolocation_df is not None:
 
-        geo_grouped = geolocation_df.groupby('geolocation_zip_code_prefix').agg({
-            'geolocation_lat': 'mean',
-            'geolocation_lng': 'mean'
-        }).reset_index()
+def _dependents(table_name, tables):
+    # Tables whose foreign keys reference table_name
+    return [name for name, create_sql in tables.items() if table_name in _referenced_tables(create_sql)]
 
-        customers_dim = pd.merge(
-            customers_df,
-            geo_grouped,
-            left_on='customer_zip_code_prefix',
-            right_on='geolocation_zip_code_prefix',
-            how='left'
+
+def _create_index(conn, index_name, table_name, columns, schema='dw'):
+    # SQLite qualifies the index rather than its table, and index names are unique per schema there
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text(f"CREATE INDEX {schema}.{index_name} ON {table_name} ({columns})"))
+    else:
+        conn.execute(text(f"CREATE INDEX {index_name} ON {schema}.{table_name} ({columns})"))
+
+
+# Serializes the drops of dependent staging tables between concurrent dimension loads
+_staging_drop_lock = threading.Lock()
+
+
+def _create_staging_table(conn, table_name, create_sql, schema='dw'):
+    # ddl.sql's definition under the staging name; foreign keys point at the other staging tables, which are
+    # renamed along with it at the swap
+    def reference(match):
+        target = staging_table(match[1])
+        # SQLite resolves a foreign key within the table's own schema and doesn't allow a qualified name
+        return f"REFERENCES {target if conn.dialect.name == 'sqlite' else f'{schema}.{target}'}"
+
+    create_sql = re.sub(r'CREATE TABLE \w+', f"CREATE TABLE {schema}.{staging_table(table_name)}", create_sql,
+                        count=1)
+    conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{staging_table(table_name)}"))
+    conn.execute(text(re.sub(r'REFERENCES (\w+)', reference, create_sql)))
+
+
+def stage_dataframe_to_sql(df, table_name, engine, ddl, schema='dw', logger=None, strategy=None, chunksize=None):
+    # Loads df into the staging table of table_name, with the primary key, constraints and indexes of ddl.sql
+    # (ddl = read_ddl()); the indexes are built after the rows are in. Tables ddl.sql doesn't define are
+    # created from the frame's types.
+    if logger is None:
+        logger = logging.getLogger()
+    tables, indexes = ddl
+    if table_name not in tables:
+        return load_dataframe_to_sql(df, staging_table(table_name), engine, schema, logger, strategy, chunksize)
+
+    # A staging table referencing this one (the fact table) was loaded against its previous rows and would block
+    # the drop on SQL Server, so it goes first and is staged again
+    with _staging_drop_lock, engine.begin() as conn:
+        for dependent in _dependents(table_name, tables):
+            conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{staging_table(dependent)}"))
+
+    with engine.begin() as conn:
+        _create_staging_table(conn, table_name, tables[table_name], schema)
+        # Columns in table order, which positional loads (BULK INSERT) rely on
+        columns = [col['name'] for col in inspect(conn).get_columns(staging_table(table_name), schema=schema)]
+        timed_bulk_insert(df[[col for col in columns if col in df.columns]], staging_table(table_name), conn,
+                          schema, strategy=strategy, chunksize=chunksize, if_exists='append', logger=logger)
+        for index_name, index_columns in indexes.get(table_name, []):
+            _create_index(conn, staging_table(index_name), staging_table(table_name), index_columns, schema)
+    logger.info(f"Loaded {table_name} into SQL Server.")
+
+
+def _staged_rows(engine, table_name, schema='dw'):
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(staging_table(table_name), schema=schema):
+            return None
+        return conn.execute(text(f"SELECT COUNT(*) FROM {schema}.{staging_table(table_name)}")).scalar()
+
+
+def swap_staged_tables(engine, table_names, schema='dw', logger=None, ddl=None):
+    # Replaces every table by its staging table in one transaction, so readers see either all of the old
+    # tables or all of the new ones and never a missing or half-loaded table. Tables whose foreign keys
+    # reference others (the fact table) are dropped before the tables they reference.
+    if logger is None:
+        logger = logging.getLogger()
+    tables, indexes = ddl or read_ddl()
+    referenced = {target for name in table_names for target in _referenced_tables(tables.get(name, ''))}
+    table_names = sorted(table_names, key=lambda name: name in referenced)
+
+    with engine.begin() as conn:
+        for table_name in table_names:
+            conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{table_name}"))
+        for table_name in table_names:
+            if conn.dialect.name == 'mssql':
+                conn.execute(text(f"EXEC sp_rename '{schema}.{staging_table(table_name)}', '{table_name}'"))
+            else:
+                conn.execute(text(f"ALTER TABLE {schema}.{staging_table(table_name)} RENAME TO {table_name}"))
+            for index_name, columns in indexes.get(table_name, []):
+                if conn.dialect.name == 'mssql':
+                    conn.execute(text(f"EXEC sp_rename '{schema}.{table_name}.{staging_table(index_name)}', "
+                                      f"'{index_name}', 'INDEX'"))
+                else:
+                    # SQLite can't rename an index, so it is built again under its own name
+                    conn.execute(text(f"DROP INDEX IF EXISTS {schema}.{staging_table(index_name)}"))
+                    _create_index(conn, index_name, table_name, columns, schema)
+    logger.info(f"Swapped {len(table_names)} staged tables into place: {', '.join(table_names)}")
+
+
+def read_watermark(conn, table_name, schema='dw'):
+    if not inspect(conn).has_table(WATERMARK_TABLE, schema=schema):
+        return None
+    value = conn.execute(
+        text(f"SELECT watermark FROM {schema}.{WATERMARK_TABLE} WHERE table_name = :table_name"),
+        {"table_name": table_name}
+    ).scalar()
+    return None if value is None else pd.Timestamp(value)
+
+
+def write_watermark(conn, table_name, watermark, schema='dw'):
+    if not inspect(conn).has_table(WATERMARK_TABLE, schema=schema):
+        conn.execute(text(f"""
+        CREATE TABLE {schema}.{WATERMARK_TABLE} (
+            table_name VARCHAR(100) NOT NULL PRIMARY KEY,
+            watermark DATETIME NOT NULL
         )
-        customers_dim = customers_dim[['customer_id', 'customer_unique_id',
-                                       'customer_zip_code_prefix', 'customer_city',
-                                       'customer_state', 'geolocation_lat', 'geolocation_lng']]
+        """))
+    conn.execute(text(f"DELETE FROM {schema}.{WATERMARK_TABLE} WHERE table_name = :table_name"),
+                 {"table_name": table_name})
+    conn.execute(
+        text(f"INSERT INTO {schema}.{WATERMARK_TABLE} (table_name, watermark) VALUES (:table_name, :watermark)"),
+        {"table_name": table_name, "watermark": pd.Timestamp(watermark).to_pydatetime()}
+    )
+
+
+def read_load_version(conn, schema='dw'):
+    # 0 for a warehouse that was never loaded (or was loaded before versions were recorded)
+    if not inspect(conn).has_table(LOAD_VERSION_TABLE, schema=schema):
+        return 0
+    return conn.execute(text(f"SELECT MAX(version) FROM {schema}.{LOAD_VERSION_TABLE}")).scalar() or 0
+
+
+def write_load_version(conn, mode, schema='dw'):
+    if not inspect(conn).has_table(LOAD_VERSION_TABLE, schema=schema):
+        conn.execute(text(f"""
+        CREATE TABLE {schema}.{LOAD_VERSION_TABLE} (
+            version INT NOT NULL PRIMARY KEY,
+            load_mode VARCHAR(20) NOT NULL,
+            loaded_at DATETIME NOT NULL
+        )
+        """))
+    version = read_load_version(conn, schema) + 1
+    conn.execute(
+        text(f"INSERT INTO {schema}.{LOAD_VERSION_TABLE} (version, load_mode, loaded_at) "
+             "VALUES (:version, :load_mode, :loaded_at)"),
+        {"version": version, "load_mode": mode, "loaded_at": datetime.now()}
+    )
+    return version
+
+
+def _to_records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _same_values(new, old):
+    # Values read back from the database lose their pandas dtypes, so coerce before comparing
+    if pd.api.types.is_datetime64_any_dtype(new):
+        old = pd.to_datetime(old)
+    elif pd.api.types.is_numeric_dtype(new) or pd.api.types.is_bool_dtype(new):
+        old = pd.to_numeric(old)
+    else:
+        new, old = new.astype(object), old.astype(object)
+    same = (new == old) | (new.isna() & old.isna())
+    return same.fillna(False).to_numpy(dtype=bool)
+
+
+def upsert_dataframe(df, table_name, conn, key_columns=None, schema='dw', where=None, params=None,
+                     bulk_strategy=None, on_change=None):
+    # Merges df into the table on its key: new keys are inserted, rows whose values differ are updated and
+    # identical rows are skipped. where/params restrict which existing rows are read for the comparison.
+    # on_change(inserts, updates, previous) is called before anything is written; previous holds the stored
+    # versions of the updated rows.
+    key_columns = key_columns or TABLE_KEYS[table_name]
+
+    if not inspect(conn).has_table(table_name, schema=schema):
+        if on_change is not None:
+            on_change(df, df.head(0), df.head(0))
+        bulk_insert(df, table_name, conn, schema, strategy=bulk_strategy, if_exists='fail')
+        return {'inserted': len(df), 'updated': 0, 'skipped': 0}
+
+    query = f"SELECT * FROM {schema}.{table_name}" + (f" WHERE {where}" if where else "")
+    existing = pd.read_sql(text(query), conn, params=params)
+    for col in key_columns:
+        existing[col] = existing[col].astype(df[col].dtype)
+
+    value_columns = [col for col in df.columns if col not in key_columns and col in existing.columns]
+    merged = df[key_columns + value_columns].merge(
+        existing[key_columns + value_columns].drop_duplicates(subset=key_columns),
+        on=key_columns, how='left', suffixes=('', '__old'), indicator=True
+    )
+
+    is_new = (merged['_merge'] == 'left_only').to_numpy()
+    unchanged = ~is_new
+    for col in value_columns:
+        unchanged &= _same_values(merged[col], merged[f'{col}__old'])
+    is_changed = ~is_new & ~unchanged
+
+    inserts = df[is_new]
+    updates = df[is_changed]
+    if on_change is not None:
+        on_change(inserts, updates, existing.merge(updates[key_columns], on=key_columns))
+    if len(inserts):
+        bulk_insert(inserts, table_name, conn, schema, strategy=bulk_strategy)
+    if len(updates) and value_columns:
+        set_clause = ', '.join(f"{col} = :{col}" for col in value_columns)
+        where_clause = ' AND '.join(f"{col} = :{col}" for col in key_columns)
+        conn.execute(text(f"UPDATE {schema}.{table_name} SET {set_clause} WHERE {where_clause}"),
+                     _to_records(updates[key_columns + value_columns]))
+
+    return {'inserted': len(inserts), 'updated': len(updates), 'skipped': len(df) - len(inserts) - len(updates)}
+
+
+def merge_dimension(df, table_name, engine, schema='dw', logger=None, bulk_strategy=None):
+    if logger is None:
+        logger = logging.getLogger()
+
+    with engine.begin() as conn:
+        stats = upsert_dataframe(df, table_name, conn, schema=schema, bulk_strategy=bulk_strategy)
+    logger.info(f"Merged {table_name}: {stats}")
+    return stats
+
+
+def _stored_keys(conn, column, values, schema='dw'):
+    # Which of values already appear in column of the fact table, looked up in batches of bound parameters
+    values = pd.unique(pd.Series(values).dropna()).tolist()
+    if not values or not inspect(conn).has_table('fact_order_items', schema=schema):
+        return set()
+    found = set()
+    for start in range(0, len(values), AGGREGATE_LOOKUP_BATCH):
+        batch = values[start:start + AGGREGATE_LOOKUP_BATCH]
+        placeholders = ', '.join(f":v{i}" for i in range(len(batch)))
+        found.update(conn.execute(
+            text(f"SELECT DISTINCT {column} FROM {schema}.fact_order_items WHERE {column} IN ({placeholders})"),
+            {f"v{i}": int(value) for i, value in enumerate(batch)}
+        ).scalars())
+    return found
+
+
+def merge_aggregates(conn, inserts, updates, previous, dims, schema='dw', logger=None, bulk_strategy=None):
+    # Folds one fact merge into the summary tables. Runs before the fact rows are written, in the same
+    # transaction, so the lookups see the warehouse without them.
+    if logger is None:
+        logger = logging.getLogger()
+
+    new_orders = inserts[~inserts['order_key'].isin(_stored_keys(conn, 'order_key', inserts['order_key'], schema))]
+    new_customers = new_orders[
+        ~new_orders['customer_key'].isin(_stored_keys(conn, 'customer_key', new_orders['customer_key'], schema))
+    ]
+    deltas = aggregate_delta(inserts, updates, previous, new_orders, new_customers, dims)
+    _fold_aggregates(conn, deltas, schema, logger, bulk_strategy)
+
+
+def _fold_aggregates(conn, deltas, schema='dw', logger=None, bulk_strategy=None):
+    for table_name, delta in deltas.items():
+        existing = pd.read_sql(text(f"SELECT * FROM {schema}.{table_name}"), conn)
+        stats = upsert_dataframe(fold_delta(table_name, existing, delta), table_name, conn, schema=schema,
+                                 bulk_strategy=bulk_strategy)
+        (logger or logging.getLogger()).info(f"Merged {table_name}: {stats}")
+
+
+def _rebuild_aggregates(conn, fact_table, dims, schema='dw', logger=None, bulk_strategy=None):
+    aggregates = build_aggregates(fact_table, dims)
+    for table_name in AGGREGATE_KEYS:
+        bulk_insert(aggregates[table_name], table_name, conn, schema, strategy=bulk_strategy, if_exists='replace')
+    (logger or logging.getLogger()).info(f"Built {', '.join(AGGREGATE_KEYS)} from {len(fact_table)} fact rows")
+
+
+def merge_fact_table(fact_table, orders_df, engine, schema='dw', logger=None, bulk_strategy=None, dims=None):
+    # dims (dimension table name -> frame) turns on maintenance of the summary tables in src/aggregates.py
+    if logger is None:
+        logger = logging.getLogger()
+
+    purchase_timestamps = fact_table[['order_key']].merge(
+        orders_df[['order_key', 'order_purchase_timestamp']], on='order_key', how='left'
+    )['order_purchase_timestamp']
+
+    with engine.begin() as conn:
+        watermark = read_watermark(conn, 'fact_order_items', schema)
+        if watermark is None:
+            staged = fact_table
+        else:
+            staged = fact_table[(purchase_timestamps > watermark - INCREMENTAL_LOOKBACK).to_numpy()]
+        logger.info(f"Staging {len(staged)} of {len(fact_table)} fact rows (watermark: {watermark})")
+
+        # If a summary table is missing, they are all rebuilt from the whole fact frame instead of a delta
+        rebuild = [] if dims is None else [
+            table_name for table_name in AGGREGATE_KEYS if not inspect(conn).has_table(table_name, schema=schema)
+        ]
+        on_change = None
+        if dims is not None and not rebuild:
+            on_change = partial(merge_aggregates, conn, dims=dims, schema=schema, logger=logger,
+                                bulk_strategy=bulk_strategy)
+
+        if len(staged):
+            stats = upsert_dataframe(
+                staged, 'fact_order_items', conn, schema=schema,
+                where='purchase_date_id >= :min_date_id',
+                params={'min_date_id': int(staged['purchase_date_id'].min())},
+                bulk_strategy=bulk_strategy,
+                on_change=on_change
+            )
+        else:
+            stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        stats['skipped'] += len(fact_table) - len(staged)
+
+        if rebuild:
+            _rebuild_aggregates(conn, fact_table, dims, schema, logger, bulk_strategy)
+
+        if purchase_timestamps.notna().any():
+            write_watermark(conn, 'fact_order_items', purchase_timestamps.max(), schema)
+
+    logger.info(f"Merged fact_order_items: {stats}")
+    return stats
+
+
+def fact_months(fact_table):
+    # Purchase month (YYYYMM) of each fact row
+    return fact_table['purchase_date_id'].fillna(0).to_numpy(dtype=np.int64) // 100
+
+
+def _month_filter(months):
+    # WHERE clause (and its parameters) matching the fact rows purchased in months
+    where = ' OR '.join(f"purchase_date_id BETWEEN :first{i} AND :last{i}" for i in range(len(months)))
+    params = {}
+    for i, month in enumerate(months):
+        params[f"first{i}"], params[f"last{i}"] = int(month) * 100, int(month) * 100 + 99
+    return f"({where})", params
+
+
+def _take_fact_rows(conn, where, params, schema='dw'):
+    # Reads and deletes the matching fact rows
+    rows = pd.read_sql(text(f"SELECT * FROM {schema}.fact_order_items WHERE {where}"), conn, params=params)
+    conn.execute(text(f"DELETE FROM {schema}.fact_order_items WHERE {where}"), params)
+    return rows
+
+
+def replace_fact_partitions(fact_table, engine, months=None, schema='dw', logger=None, bulk_strategy=None,
+                            dims=None):
+    # Replaces whole purchase months of fact_order_items with the rows of fact_table, in one transaction:
+    # months (YYYYMM) or by default every month fact_table covers. Other months are not read or written.
+    # dims (dimension table name -> frame) turns on maintenance of the summary tables in src/aggregates.py.
+    if logger is None:
+        logger = logging.getLogger()
+
+    row_months = fact_months(fact_table)
+    months = sorted(set(months) if months is not None else set(np.unique(row_months).tolist()))
+    rows = fact_table[np.isin(row_months, months)]
+    stats = {'inserted': len(rows), 'updated': 0, 'skipped': len(fact_table) - len(rows)}
+
+    with engine.begin() as conn:
+        rebuild = dims is not None and not all(
+            inspect(conn).has_table(table_name, schema=schema) for table_name in AGGREGATE_KEYS
+        )
+        previous = rows.iloc[:0]
+        if inspect(conn).has_table('fact_order_items', schema=schema):
+            previous = pd.concat([
+                _take_fact_rows(conn, *_month_filter(months[start:start + AGGREGATE_LOOKUP_BATCH // 2]),
+                                schema=schema)
+                for start in range(0, len(months), AGGREGATE_LOOKUP_BATCH // 2)
+            ] or [previous], ignore_index=True)
+            # Orders whose purchase date moved into one of the months from a month that isn't replaced
+            moved = sorted(_stored_keys(conn, 'order_key', rows['order_key'], schema))
+            for start in range(0, len(moved), AGGREGATE_LOOKUP_BATCH):
+                batch = moved[start:start + AGGREGATE_LOOKUP_BATCH]
+                placeholders = ', '.join(f":v{i}" for i in range(len(batch)))
+                previous = pd.concat([previous, _take_fact_rows(
+                    conn, f"order_key IN ({placeholders})", {f"v{i}": int(key) for i, key in enumerate(batch)},
+                    schema
+                )], ignore_index=True)
+
+            if dims is not None and not rebuild:
+                customers = pd.concat([rows['customer_key'], previous['customer_key']])
+                elsewhere = _stored_keys(conn, 'customer_key', customers, schema)
+                deltas = partition_delta(rows, previous, rows[~rows['customer_key'].isin(elsewhere)],
+                                         previous[~previous['customer_key'].isin(elsewhere)], dims)
+                _fold_aggregates(conn, deltas, schema, logger, bulk_strategy)
+
+        bulk_insert(rows, 'fact_order_items', conn, schema, strategy=bulk_strategy)
+        if rebuild:
+            _rebuild_aggregates(conn, pd.read_sql(text(f"SELECT * FROM {schema}.fact_order_items"), conn), dims,
+                                schema, logger, bulk_strategy)
+
+    stats['deleted'] = len(previous)
+    logger.info(f"Replaced {len(months)} purchase months of fact_order_items: {stats}")
+    return stats
+
+
+def create_date_dimension(orders_df):
+    # Gap-free calendar from the first purchase to the last delivery, so every fact date key has a row
+    timestamps = pd.concat([
+        orders_df['order_purchase_timestamp'], orders_df['order_delivered_customer_date']
+    ]).dropna()
+    return build_calendar(timestamps.min(), timestamps.max())
+
+
+def create_customers_dimension(customers_df, geo_index=None):
+    customer_columns = ['customer_key', 'customer_id', 'customer_unique_key', 'customer_unique_id',
+                        'customer_zip_code_prefix', 'customer_city', 'customer_state']
+
+    if geo_index is not None:
+        customers_dim = geo_index.enrich(customers_df[customer_columns], 'customer_zip_code_prefix')
     else:
         customers_dim = customers_df.copy()
         customers_dim['geolocation_lat'] = np.nan
@@ -92,6 +591,16 @@ def create_customers_dimension(customers_df, processed_dfs):
     return customers_dim
 
 
+def create_sellers_dimension(sellers_df, geo_index=None):
+    if geo_index is not None:
+        return geo_index.enrich(sellers_df, 'seller_zip_code_prefix')
+
+    sellers_dim = sellers_df.copy()
+    sellers_dim['geolocation_lat'] = np.nan
+    sellers_dim['geolocation_lng'] = np.nan
+    return sellers_dim
+
+
 def create_products_dimension(products_df, processed_dfs):
     category_translation_df = processed_dfs.get('product_category_name_translation.csv')
 
@@ -108,96 +617,161 @@ def create_products_dimension(products_df, processed_dfs):
     return products_dim
 
 
-def create_fact_table(order_items_df, orders_df, processed_dfs, date_mapping):
-    # Merge order items with orders to get dates
-    fact_order_items = pd.merge(
-        order_items_df,
-        orders_df[['order_id', 'customer_id', 'order_purchase_timestamp', 'order_delivered_customer_date']],
-        on='order_id',
-        how='left'
-    )
-
-    # Calculate required fields if not already present
-    if 'total_price' not in fact_order_items.columns:
-        fact_order_items['total_price'] = fact_order_items['price'] + fact_order_items['freight_value']
-
-    if 'profit_margin' not in fact_order_items.columns:
-        fact_order_items['profit_margin'] = fact_order_items['price'] - fact_order_items['freight_value']
-
-    # Calculate delivery time if not already present
-    if 'delivery_time' not in fact_order_items.columns:
-        fact_order_items['delivery_time'] = (
-                (fact_order_items['order_delivered_customer_date'] - fact_order_items['order_purchase_timestamp'])
-                .dt.total_seconds() / (60 * 60 * 24)
-        ).fillna(0).astype(int)
+def create_fact_table(order_items_df, orders_df, processed_dfs, months=None):
+    # order_items from run_etl already carries the order columns, prices and delivery days (src/enrichment.py),
+    # so nothing is merged again. The fact-only columns are derived on a shallow copy. months (YYYYMM) limits
+    # the build to the items purchased in those months.
+    fact_order_items = attach_order_columns(order_items_df.copy(deep=False), orders_df)
+    if months is not None:
+        item_months = purchase_months(fact_order_items['order_purchase_timestamp'])
+        fact_order_items = fact_order_items[np.isin(item_months, list(months))]
+    for column in ['total_price', 'profit_margin', 'delivery_time']:
+        derived(fact_order_items, column)
 
     # Ensure payment_installments column exists
     if 'payment_installments' not in fact_order_items.columns:
         payment_df = processed_dfs.get('olist_order_payments_dataset.csv')
         if payment_df is not None:
-            payment_counts = payment_df.groupby('order_id')['payment_installments'].sum().reset_index()
-            fact_order_items = pd.merge(fact_order_items, payment_counts, on='order_id', how='left')
+            payment_counts = payment_df.groupby('order_key')['payment_installments'].sum().reset_index()
+            fact_order_items = attach_order_columns(fact_order_items, payment_counts, ['payment_installments'])
             fact_order_items['payment_installments'] = fact_order_items['payment_installments'].fillna(1)
         else:
             fact_order_items['payment_installments'] = 1
 
-    fact_order_items['purchase_date'] = fact_order_items['order_purchase_timestamp'].dt.date
-    fact_order_items['delivery_date'] = fact_order_items['order_delivered_customer_date'].dt.date
-
-
-    fact_order_items['purchase_date_id'] = fact_order_items['purchase_date'].map(date_mapping)
-    fact_order_items['delivery_date_id'] = fact_order_items['delivery_date'].map(date_mapping)
-
+    # Date keys are computed from the timestamps themselves, so they match dim_date without a lookup
+    derived(fact_order_items, 'purchase_date_id')
+    derived(fact_order_items, 'delivery_date_id')
 
     fact_columns = [
-        'order_id', 'order_item_id', 'product_id', 'seller_id', 'customer_id',
+        'order_key', 'order_item_id', 'product_key', 'seller_key', 'customer_key',
         'purchase_date_id', 'delivery_date_id', 'price', 'freight_value',
         'total_price', 'profit_margin', 'delivery_time', 'payment_installments'
     ]
 
     fact_table = fact_order_items[fact_columns].copy()
-    fact_table['delivery_date_id'] = fact_table['delivery_date_id'].fillna(0).astype(int)
+    # Undelivered items have no delivery date: NULL, which the foreign key to dim_date allows
+    fact_table['delivery_date_id'] = fact_table['delivery_date_id'].astype('Int64')
 
     return fact_table
 
 
-def load_to_sql_server(processed_dfs, connection_string, logger=None):
+def _timed(label, func, *args, logger=None, kind='load', **kwargs):
+    # Measured like the ETL steps, so builds and loads show up in the run manifest
+    rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+    with measure(label, kind, rows_in=rows_in) as record:
+        result = func(*args, **kwargs)
+        if isinstance(result, pd.DataFrame):
+            record['rows_out'] = len(result)
+    (logger or logging.getLogger()).info(f"{label} took {record['wall_s']:.2f}s")
+    return result
+
+
+def load_to_sql_server(processed_dfs, connection_string, logger=None, mode='replace', bulk_strategy=None,
+                       max_workers=LOAD_WORKERS, months=None):
+    # mode: 'replace' swaps in every table; 'incremental' merges new and changed rows; 'partitions' merges the
+    # dimensions and replaces whole purchase months of fact_order_items (months, YYYYMM, or every month of
+    # processed_dfs), building only those months of the fact table
     if logger is None:
         logger = logging.getLogger()
-
-    engine = create_engine(connection_string)
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {mode}")
+
+    engine = create_warehouse_engine(connection_string, pool_size=max_workers)
+    # SQLite allows one writer at a time, so tables are loaded one after another there
+    load_workers = 1 if engine.dialect.name == 'sqlite' else max_workers
+
+    # Replace loads stage every table and record it in the checkpoint, so a retry after a failure skips the
+    # tables whose staging table already holds the same rows
+    checkpoint = LoadCheckpoint(engine.url.render_as_string(hide_password=True), logger=logger)
+    ddl = read_ddl() if mode == 'replace' else None
+
+    def load_table(table_name, df):
+        if mode in ('incremental', 'partitions'):
+            return _timed(f"Loading {table_name}", merge_dimension, df, table_name, engine,
+                          logger=logger, bulk_strategy=bulk_strategy)
+        fingerprint = frame_fingerprint(df)
+        if checkpoint.is_staged(table_name, fingerprint, len(df)) and _staged_rows(engine, table_name) == len(df):
+            logger.info(f"{table_name} is already staged, skipping its load")
+            return {'inserted': 0, 'updated': 0, 'skipped': len(df)}
+        _timed(f"Loading {table_name}", stage_dataframe_to_sql, df, table_name, engine, ddl, logger=logger,
+               strategy=bulk_strategy)
+        checkpoint.mark_staged(table_name, fingerprint, len(df))
+        return {'inserted': len(df), 'updated': 0, 'skipped': 0}
 
     try:
-        with engine.connect() as conn:
-            order_items_df = processed_dfs['olist_order_items_dataset.csv']
-            customers_df = processed_dfs['olist_customers_dataset.csv']
-            products_df = processed_dfs['olist_products_dataset.csv']
-            sellers_df = processed_dfs['olist_sellers_dataset.csv']
-            orders_df = processed_dfs['olist_orders_dataset.csv']
-
-            logger.info("Creating date dimension...")
-            date_dim = create_date_dimension(orders_df)
-
-            logger.info("Creating customers dimension...")
-            customers_dim = create_customers_dimension(customers_df, processed_dfs)
-
-            logger.info("Creating products dimension...")
-            products_dim = create_products_dimension(products_df, processed_dfs)
-
-            date_mapping = dict(zip(date_dim['date'].dt.date, date_dim['date_id']))
-
-            logger.info("Creating fact order items table...")
-            fact_table = create_fact_table(order_items_df, orders_df, processed_dfs, date_mapping)
-
-            load_dataframe_to_sql(date_dim, 'dim_date', engine, logger=logger)
-            load_dataframe_to_sql(customers_dim, 'dim_customers', engine, logger=logger)
-            load_dataframe_to_sql(products_dim, 'dim_products', engine, logger=logger)
-            load_dataframe_to_sql(sellers_df, 'dim_sellers', engine, logger=logger)
-            load_dataframe_to_sql(fact_table, 'fact_order_items', engine, logger=logger)
-
-            logger.info("Successfully loaded all tables into SQL Server.")
+        start = time.perf_counter()
+        # No-op after run_etl; needed when the frames were rehydrated with load_processed, whose stored surrogates
+        # it checks against the registry
+        attach_surrogate_keys(processed_dfs)
+        order_items_df = processed_dfs['olist_order_items_dataset.csv']
+        customers_df = processed_dfs['olist_customers_dataset.csv']
+        products_df = processed_dfs['olist_products_dataset.csv']
+        sellers_df = processed_dfs['olist_sellers_dataset.csv']
+        orders_df = processed_dfs['olist_orders_dataset.csv']
+        # Zip prefix centroids shared by the customer and seller dimensions
+        geo_index = load_geo_index(processed_dfs)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as build_pool, \
+                ThreadPoolExecutor(max_workers=load_workers) as load_pool:
+            logger.info("Creating date, customers, sellers and products dimensions...")
+            builds = {
+                build_pool.submit(_timed, "Creating date dimension", create_date_dimension, orders_df,
+                                  logger=logger, kind='transform'): 'dim_date',
+                build_pool.submit(_timed, "Creating customers dimension", create_customers_dimension,
+                                  customers_df, geo_index, logger=logger, kind='transform'): 'dim_customers',
+                build_pool.submit(_timed, "Creating sellers dimension", create_sellers_dimension,
+                                  sellers_df, geo_index, logger=logger, kind='transform'): 'dim_sellers',
+                build_pool.submit(_timed, "Creating products dimension", create_products_dimension,
+                                  products_df, processed_dfs, logger=logger, kind='transform'): 'dim_products'
+            }
+
+            # The fact table derives its date keys itself, so it is built alongside the dimensions
+            fact_future = build_pool.submit(_timed, "Creating fact order items table", create_fact_table,
+                                            order_items_df, orders_df, processed_dfs, months=months,
+                                            logger=logger, kind='transform')
+
+            # Each dimension is loaded as soon as it is built
+            dims, dimension_loads = {}, {}
+            for future in as_completed(builds):
+                table_name = builds[future]
+                dims[table_name] = future.result()
+                dimension_loads[table_name] = load_pool.submit(load_table, table_name, dims[table_name])
+
+            fact_table = fact_future.result()
+            # The fact load waits for every dimension to be committed so its foreign keys resolve
+            load_stats = {table_name: future.result() for table_name, future in dimension_loads.items()}
+
+        # The report summary tables are folded from the fact delta in incremental and partitions mode and
+        # rebuilt in replace mode
+        if mode == 'incremental':
+            load_stats['fact_order_items'] = _timed("Loading fact_order_items", merge_fact_table, fact_table,
+                                                    orders_df, engine, logger=logger, bulk_strategy=bulk_strategy,
+                                                    dims=dims)
+        elif mode == 'partitions':
+            load_stats['fact_order_items'] = _timed("Loading fact_order_items partitions", replace_fact_partitions,
+                                                    fact_table, engine, months, logger=logger,
+                                                    bulk_strategy=bulk_strategy, dims=dims)
+        else:
+            load_stats['fact_order_items'] = load_table('fact_order_items', fact_table)
+            aggregates = _timed("Creating aggregate tables", build_aggregates, fact_table, dims, logger=logger,
+                                kind='transform')
+            for table_name, df in aggregates.items():
+                load_stats[table_name] = load_table(table_name, df)
+            _timed("Swapping staged tables", swap_staged_tables, engine, list(load_stats), logger=logger, ddl=ddl)
+            checkpoint.clear()
+
+        # Stamped last, so cached report results are invalidated only once every table has landed
+        with engine.begin() as conn:
+            version = write_load_version(conn, mode)
+        log_quarantine(engine, logger)
+        logger.info(f"Successfully loaded all tables into SQL Server in {time.perf_counter() - start:.2f}s "
+                    f"(load version {version}).")
+        return load_stats
 
     except Exception as e:
         with engine.connect() as conn:
             log_error(conn, str(e))
-        logger.error(f"Error loading data to SQL Server: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Error loading data to SQL Server: {e}", exc_info=True)
+    finally:
+        write_manifest(logger, load_mode=mode, bulk_strategy=bulk_strategy, load_workers=load_workers)
+        engine.dispose()
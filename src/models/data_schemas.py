@@ -1,4 +1,13 @@
-# How csv should be read and data type for each column
+# Format of every timestamp in the raw Olist files
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# How csv should be read and data type for each column (src/ingest.py turns each entry into a typed Arrow read)
+# Only the columns listed here are read; 'parse_dates' columns are parsed once, with TIMESTAMP_FORMAT
+# unless the entry sets 'date_format'; 'category' columns are dictionary-encoded while parsing
+# 'chunksize' streams the file through its process_* function in chunks of that many rows;
+# 'dedupe_rows' drops duplicate rows across chunks by row fingerprint
+# 'text' lists free-text columns, which only outputs that need them read (attach_text_columns loads them later,
+# by the entry's 'key' column)
 SCHEMAS = {
     'olist_customers_dataset.csv': {
         'dtype': {
@@ -6,7 +15,7 @@ SCHEMAS = {
             'customer_unique_id': 'string',
             'customer_zip_code_prefix': 'Int64',
             'customer_city': 'string',
-            'customer_state': 'string'
+            'customer_state': 'category'
         }
     },
     'olist_geolocation_dataset.csv': {
@@ -15,8 +24,10 @@ SCHEMAS = {
             'geolocation_lat': 'float',
             'geolocation_lng': 'float',
             'geolocation_city': 'string',
-            'geolocation_state': 'string'
-        }
+            'geolocation_state': 'category'
+        },
+        'chunksize': 200_000,
+        'dedupe_rows': True
     },
     'olist_order_items_dataset.csv': {
         'dtype': {
@@ -33,7 +44,7 @@ SCHEMAS = {
         'dtype': {
             'order_id': 'string',
             'payment_sequential': 'Int64',
-            'payment_type': 'string',
+            'payment_type': 'category',
             'payment_installments': 'Int64',
             'payment_value': 'float'
         }
@@ -46,13 +57,15 @@ SCHEMAS = {
             'review_comment_title': 'string',
             'review_comment_message': 'string'
         },
-        'parse_dates': ['review_creation_date', 'review_answer_timestamp']
+        'parse_dates': ['review_creation_date', 'review_answer_timestamp'],
+        'text': ['review_comment_title', 'review_comment_message'],
+        'key': 'review_id'
     },
     'olist_orders_dataset.csv': {
         'dtype': {
             'order_id': 'string',
             'customer_id': 'string',
-            'order_status': 'string'
+            'order_status': 'category'
         },
         'parse_dates': [
             'order_purchase_timestamp',
@@ -66,8 +79,8 @@ SCHEMAS = {
         'dtype': {
             'product_id': 'string',
             'product_category_name': 'string',
-            'product_name_length': 'float',
-            'product_description_length': 'float',
+            'product_name_lenght': 'float',
+            'product_description_lenght': 'float',
             'product_photos_qty': 'Int64',
             'product_weight_g': 'Int64',
             'product_length_cm': 'Int64',
@@ -80,7 +93,7 @@ SCHEMAS = {
             'seller_id': 'string',
             'seller_zip_code_prefix': 'Int64',
             'seller_city': 'string',
-            'seller_state': 'string'
+            'seller_state': 'category'
         }
     },
     'product_category_name_translation.csv': {
@@ -1,6 +1,6 @@
 import pandas as pd
 import pandera as pa
-from pandera.typing import Series, DateTime
+from pandera.typing import Series, Category, DateTime
 
 # Ensuring that data is loaded correctly maintaining correct data type and constraints
 class OlistBaseModel(pa.DataFrameModel):
@@ -13,7 +13,7 @@ class OlistCustomersModel(OlistBaseModel):
     customer_unique_id: Series[pd.StringDtype] = pa.Field(nullable=False)
     customer_zip_code_prefix: Series[int] = pa.Field(nullable=True, ge=1000)
     customer_city: Series[pd.StringDtype] = pa.Field(nullable=False)
-    customer_state: Series[pd.StringDtype] = pa.Field(nullable=False)
+    customer_state: Series[Category] = pa.Field(nullable=False)
 
 
 class OlistGeolocationModel(OlistBaseModel):
@@ -21,7 +21,7 @@ class OlistGeolocationModel(OlistBaseModel):
     geolocation_lat: Series[float] = pa.Field(nullable=False, ge=-90.0, le=90.0)
     geolocation_lng: Series[float] = pa.Field(nullable=False, ge=-180.0, le=180.0)
     geolocation_city: Series[pd.StringDtype] = pa.Field(nullable=False)
-    geolocation_state: Series[pd.StringDtype] = pa.Field(nullable=False)
+    geolocation_state: Series[Category] = pa.Field(nullable=False)
 
 
 class OlistOrderItemsModel(OlistBaseModel):
@@ -37,9 +37,9 @@ class OlistOrderItemsModel(OlistBaseModel):
 class OlistOrderPaymentsModel(OlistBaseModel):
     order_id: Series[pd.StringDtype] = pa.Field(nullable=False)
     payment_sequential: Series[int] = pa.Field(nullable=True, ge=1)
-    payment_type: Series[pd.StringDtype] = pa.Field(nullable=False,
-                                                    isin=["credit_card", "boleto", "voucher", "debit_card",
-                                                          "not_defined"])
+    payment_type: Series[Category] = pa.Field(nullable=False,
+                                              isin=["credit_card", "boleto", "voucher", "debit_card",
+                                                    "not_defined"])
     payment_installments: Series[int] = pa.Field(nullable=True, ge=1)
     payment_value: Series[float] = pa.Field(nullable=False, ge=0.0)
 
@@ -57,7 +57,7 @@ class OlistOrderReviewsModel(OlistBaseModel):
 class OlistOrdersModel(OlistBaseModel):
     order_id: Series[pd.StringDtype] = pa.Field(nullable=False, unique=True)
     customer_id: Series[pd.StringDtype] = pa.Field(nullable=False)
-    order_status: Series[pd.StringDtype] = pa.Field(nullable=False)
+    order_status: Series[Category] = pa.Field(nullable=False)
     order_purchase_timestamp: Series[DateTime] = pa.Field(nullable=False)
     order_approved_at: Series[DateTime] = pa.Field(nullable=True)
     order_delivered_carrier_date: Series[DateTime] = pa.Field(nullable=True)
@@ -81,7 +81,7 @@ class OlistSellersModel(OlistBaseModel):
     seller_id: Series[pd.StringDtype] = pa.Field(nullable=False, unique=True)
     seller_zip_code_prefix: Series[int] = pa.Field(nullable=True, ge=1000)
     seller_city: Series[pd.StringDtype] = pa.Field(nullable=False)
-    seller_state: Series[pd.StringDtype] = pa.Field(nullable=False)
+    seller_state: Series[Category] = pa.Field(nullable=False)
 
 
 class ProductCategoryNameTranslationModel(OlistBaseModel):
@@ -0,0 +1,134 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.chunked import concat_chunks
+from src.date_keys import date_keys
+from src.load_checkpoint import frame_fingerprint
+from src.models.data_schemas import SCHEMAS
+from src.storage import frame_path, read_frame, write_frame
+
+# Datasets that are also written per purchase month. Every row is placed by its order's
+# order_purchase_timestamp, so one order's items, payments and reviews share a partition.
+PARTITIONED = [
+    'olist_orders_dataset.csv',
+    'olist_order_items_dataset.csv',
+    'olist_order_payments_dataset.csv',
+    'olist_order_reviews_dataset.csv'
+]
+PARTITION_COLUMN = 'purchase_month'
+PARTITION_DIR = Path('../data/processed/partitions')
+PARTITION_WORKERS = int(os.environ.get('OLIST_PARTITION_WORKERS', 4))
+# Partition of rows whose order is unknown or has no purchase timestamp
+UNKNOWN_MONTH = 0
+MANIFEST_FILE = '_partitions.json'
+
+
+def purchase_months(timestamps):
+    # YYYYMM of each timestamp, UNKNOWN_MONTH where missing
+    return (pd.Series(date_keys(timestamps)) // 100).fillna(UNKNOWN_MONTH).to_numpy(dtype=np.int64)
+
+
+def month_key(value):
+    # YYYYMM from a date, a timestamp or a YYYYMM number
+    if isinstance(value, (int, np.integer)) or (isinstance(value, str) and value.isdigit() and len(value) == 6):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    return timestamp.year * 100 + timestamp.month
+
+
+def order_months(orders_df):
+    # Purchase month per order_id, for placing the rows of the other datasets
+    orders = orders_df.drop_duplicates(subset='order_id')
+    return pd.Series(purchase_months(orders['order_purchase_timestamp']), index=pd.Index(orders['order_id']))
+
+
+def row_months(df, months_by_order):
+    positions = months_by_order.index.get_indexer(df['order_id'])
+    months = months_by_order.to_numpy()[positions]
+    months[positions < 0] = UNKNOWN_MONTH
+    return months
+
+
+def split_months(months):
+    # Row positions per month
+    return pd.Series(np.arange(len(months))).groupby(months).indices
+
+
+def dataset_dir(filename):
+    return PARTITION_DIR / Path(filename).stem
+
+
+def partition_path(filename, month, fmt=None):
+    return frame_path(dataset_dir(filename), f"{PARTITION_COLUMN}={month}", fmt)
+
+
+def read_manifest(filename):
+    manifest_file = dataset_dir(filename) / MANIFEST_FILE
+    if not manifest_file.exists():
+        return {}
+    return {int(month): entry for month, entry in json.loads(manifest_file.read_text()).items()}
+
+
+def _write_manifest(filename, manifest):
+    manifest_file = dataset_dir(filename) / MANIFEST_FILE
+    tmp_file = manifest_file.with_suffix('.tmp')
+    tmp_file.write_text(json.dumps({str(month): entry for month, entry in sorted(manifest.items())}, indent=2))
+    tmp_file.replace(manifest_file)
+
+
+def write_partition(filename, month, df, source=None, previous=None):
+    # Writes one month's rows, unless they hash the same as at the last write (previous, its manifest entry).
+    # source identifies what the rows were built from (build_partitions). Returns the new entry and whether the
+    # file was written.
+    entry = {'fingerprint': frame_fingerprint(df), 'rows': len(df), 'source': source}
+    path = partition_path(filename, month)
+    if previous is not None and previous['fingerprint'] == entry['fingerprint'] and path.exists():
+        return entry, False
+    dataset_dir(filename).mkdir(parents=True, exist_ok=True)
+    write_frame(df, path)
+    return entry, True
+
+
+def replace_manifest(filename, manifest):
+    # Records the partitions of filename as manifest (month -> entry) and removes the files of the months it no
+    # longer has; returns those months
+    dataset_dir(filename).mkdir(parents=True, exist_ok=True)
+    removed = [month for month in read_manifest(filename) if month not in manifest]
+    for month in removed:
+        partition_path(filename, month).unlink(missing_ok=True)
+    _write_manifest(filename, manifest)
+    return removed
+
+
+def partition_months(filename, start=None, end=None):
+    # Months of the written partitions that fall in [start, end]; the unknown-month partition only without a range
+    months = sorted(read_manifest(filename))
+    if start is None and end is None:
+        return months
+    first = month_key(start) if start is not None else UNKNOWN_MONTH + 1
+    last = month_key(end) if end is not None else float('inf')
+    return [month for month in months if month != UNKNOWN_MONTH and first <= month <= last]
+
+
+def read_partitions(filename, start=None, end=None, columns=None, fmt=None, max_workers=PARTITION_WORKERS):
+    # The rows of filename purchased between start and end, read from the matching partitions only; None when
+    # the dataset was never partitioned
+    written = partition_months(filename)
+    if not written:
+        return None
+    schema = SCHEMAS[filename]
+
+    def read(month):
+        return read_frame(partition_path(filename, month, fmt), columns=columns, fmt=fmt,
+                          dtype=schema.get('dtype'), parse_dates=schema.get('parse_dates'))
+
+    months = partition_months(filename, start, end)
+    if not months:
+        return read(written[0]).iloc[:0]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return concat_chunks(list(pool.map(read, months)))
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from src.models.data_schemas import SCHEMAS
+from src.partitions import PARTITIONED, read_partitions
+from src.storage import frame_path, read_frame
+
+# Reading back what run_etl wrote. Kept apart from etl_processing so a load from disk doesn't import the
+# transforms and their Pandera models.
+OUTPUT_DIR = Path('../data/processed')
+# Runs projected to some outputs (see etl_processing.OUTPUT_COLUMNS) write partial frames. They go under this extra
+# prefix, so load_processed and the clean_* files of full runs never see them.
+PROJECTED_PREFIX = 'projected'
+
+
+def output_name(filename, prefix='clean', projected=False):
+    name = f"{prefix}_{filename}"
+    return f"{PROJECTED_PREFIX}_{name}" if projected else name
+
+
+def load_clean_output(filename, prefix='clean', projected=False):
+    schema = SCHEMAS[filename]
+    return read_frame(
+        frame_path(OUTPUT_DIR, output_name(filename, prefix, projected)),
+        dtype=schema.get('dtype'),
+        parse_dates=schema.get('parse_dates')
+    )
+
+
+def load_processed(filenames=None, columns=None, fmt=None, start_date=None, end_date=None):
+    # Rehydrate the clean_* outputs of a previous run without re-running the transforms;
+    # columns optionally maps a filename to the subset of columns to read. With start_date / end_date, the
+    # PARTITIONED datasets are read from the purchase months in that range only.
+    if filenames is None:
+        filenames = list(SCHEMAS)
+    columns = columns or {}
+
+    processed_dfs = {}
+    for filename in filenames:
+        if filename in PARTITIONED and (start_date is not None or end_date is not None):
+            df = read_partitions(filename, start_date, end_date, columns=columns.get(filename), fmt=fmt)
+            if df is not None:
+                processed_dfs[filename] = df
+                continue
+        path = frame_path(OUTPUT_DIR, output_name(filename), fmt)
+        if path.exists():
+            schema = SCHEMAS[filename]
+            processed_dfs[filename] = read_frame(
+                path,
+                columns=columns.get(filename),
+                fmt=fmt,
+                dtype=schema.get('dtype'),
+                parse_dates=schema.get('parse_dates')
+            )
+    return processed_dfs
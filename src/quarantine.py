@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from src.chunked import concat_chunks
+from src.load_checkpoint import frame_fingerprint
+from src.models.data_schemas import SCHEMAS
+from src.storage import frame_path, read_frame, write_frame
+
+# What validate does with rows that fail a value check (nulls, duplicates, range and set checks): 'quarantine'
+# sets them aside with the reasons and carries on with the clean rows; 'raise' fails the whole dataset, and with
+# it every stage downstream. Structural failures (missing columns, wrong dtypes) always raise.
+FAILURE_MODES = ['quarantine', 'raise']
+FAILURE_MODE = os.environ.get('OLIST_VALIDATION_FAILURES', 'quarantine')
+
+QUARANTINE_DIR = Path('../data/quarantine')
+REASON_COLUMN = 'quarantine_reason'
+# Which quarantined rows have already reached each warehouse's error log: warehouse id -> dataset -> fingerprint
+LOGGED_FILE = QUARANTINE_DIR / '_logged.json'
+
+# Rows quarantined in this process since the last reset; a stage may validate several chunks
+_quarantined = []
+
+
+def reset():
+    _quarantined.clear()
+
+
+def collect(rows):
+    # rows carry their reasons in REASON_COLUMN
+    _quarantined.append(rows)
+
+
+def quarantine_path(filename):
+    return frame_path(QUARANTINE_DIR, f"quarantine_{filename}")
+
+
+def write_quarantine(filename):
+    # Always writes the file, empty when nothing was quarantined, so it is cached along with the stage output
+    # and a clean rerun replaces the rows of an earlier one
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+    rows = concat_chunks(_quarantined) if _quarantined else pd.DataFrame({REASON_COLUMN: pd.Series(dtype=str)})
+    path = write_frame(rows, quarantine_path(filename))
+    reset()
+    return path, len(rows)
+
+
+def read_quarantine(filenames=None):
+    # Non-empty quarantine files of the last run, by dataset
+    quarantined = {}
+    for filename in filenames or SCHEMAS:
+        path = quarantine_path(filename)
+        if path.exists():
+            rows = read_frame(path)
+            if len(rows):
+                quarantined[filename] = rows
+    return quarantined
+
+
+def _warehouse_id(target):
+    return hashlib.sha256(str(target).encode()).hexdigest()[:16]
+
+
+def _read_logged():
+    try:
+        return json.loads(LOGGED_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def pending_quarantine(target, filenames=None):
+    # The quarantined rows of the last run that target (a warehouse URL) hasn't logged yet, by dataset, with
+    # their fingerprints for mark_logged. A file restored from the cache or read by another load holds the same
+    # rows, so each set of rows is logged once per warehouse.
+    logged = _read_logged().get(_warehouse_id(target), {})
+    pending = {}
+    for filename, rows in read_quarantine(filenames).items():
+        fingerprint = frame_fingerprint(rows)
+        if logged.get(filename) != fingerprint:
+            pending[filename] = rows, fingerprint
+    return pending
+
+
+def mark_logged(target, pending):
+    # Called once the rows of pending_quarantine are committed to the error log
+    logged = _read_logged()
+    logged.setdefault(_warehouse_id(target), {}).update(
+        {filename: fingerprint for filename, (_, fingerprint) in pending.items()}
+    )
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = LOGGED_FILE.with_suffix('.tmp')
+    tmp_file.write_text(json.dumps(logged, indent=2))
+    tmp_file.replace(LOGGED_FILE)
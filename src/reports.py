@@ -0,0 +1,227 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from src.config import warehouse_url
+from src.load_data import create_warehouse_engine, read_load_version
+
+CONNECTION_STRING = warehouse_url()
+# Results kept in memory per ReportService, least recently used first out
+MAX_CACHED_REPORTS = int(os.environ.get('OLIST_REPORT_CACHE_ENTRIES', 128))
+MAX_REPORT_CACHE_BYTES = int(os.environ.get('OLIST_REPORT_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+
+# The reports.sql queries. Each is answered from its summary table (src/aggregates.py) when every given
+# parameter is in summary_filters, and from the fact table otherwise. Dates filter on the purchase date.
+DATE_FILTERS = {
+    'start_date': 'f.purchase_date_id >= :start_date',
+    'end_date': 'f.purchase_date_id <= :end_date'
+}
+REPORTS = {
+    'category_sales': {
+        'summary_table': 'agg_category_sales',
+        'summary': """
+            SELECT product_category_name_english AS category, order_count, total_sales, average_order_value
+            FROM {schema}.agg_category_sales
+            WHERE order_count > 0 {filters}
+            ORDER BY total_sales DESC, product_category_name
+        """,
+        'summary_filters': {},
+        'detail': """
+            SELECT dp.product_category_name_english AS category, COUNT(f.order_key) AS order_count,
+                   SUM(f.total_price) AS total_sales, AVG(f.total_price) AS average_order_value
+            FROM {schema}.fact_order_items f
+            JOIN {schema}.dim_products dp ON f.product_key = dp.product_key
+            JOIN {schema}.dim_customers c ON f.customer_key = c.customer_key
+            WHERE 1 = 1 {filters}
+            GROUP BY dp.product_category_name_english, dp.product_category_name
+            ORDER BY total_sales DESC, dp.product_category_name
+        """,
+        'filters': {**DATE_FILTERS, 'state': 'c.customer_state = :state'}
+    },
+    'seller_delivery': {
+        'summary_table': 'agg_seller_delivery',
+        'summary': """
+            SELECT a.avg_delivery, a.seller_id
+            FROM {schema}.agg_seller_delivery a
+            JOIN {schema}.dim_sellers ds ON a.seller_key = ds.seller_key
+            WHERE a.delivered_items > 0 {filters}
+            ORDER BY a.avg_delivery DESC, a.seller_id
+        """,
+        'summary_filters': {'state': 'ds.seller_state = :state'},
+        'detail': """
+            SELECT AVG(CAST(f.delivery_time AS FLOAT)) AS avg_delivery, ds.seller_id
+            FROM {schema}.fact_order_items f
+            JOIN {schema}.dim_sellers ds ON f.seller_key = ds.seller_key
+            JOIN {schema}.dim_date d ON f.delivery_date_id = d.date_id
+            WHERE 1 = 1 {filters}
+            GROUP BY ds.seller_id
+            ORDER BY avg_delivery DESC, ds.seller_id
+        """,
+        'filters': {**DATE_FILTERS, 'state': 'ds.seller_state = :state'}
+    },
+    'state_orders': {
+        'summary_table': 'agg_state_orders',
+        'summary': """
+            SELECT customer_state, order_count, customer_count
+            FROM {schema}.agg_state_orders
+            WHERE order_count > 0 {filters}
+            ORDER BY order_count DESC, customer_state
+        """,
+        'summary_filters': {'state': 'customer_state = :state'},
+        'detail': """
+            SELECT c.customer_state, COUNT(DISTINCT f.order_key) AS order_count,
+                   COUNT(DISTINCT c.customer_key) AS customer_count
+            FROM {schema}.fact_order_items f
+            JOIN {schema}.dim_customers c ON f.customer_key = c.customer_key
+            WHERE 1 = 1 {filters}
+            GROUP BY c.customer_state
+            ORDER BY order_count DESC, c.customer_state
+        """,
+        'filters': {**DATE_FILTERS, 'state': 'c.customer_state = :state'}
+    }
+}
+
+
+def _bind(params):
+    # Dates become YYYYMMDD keys, like the fact table's date ids
+    bound = {}
+    for name, value in params.items():
+        if name in DATE_FILTERS:
+            value = int(pd.Timestamp(value).strftime('%Y%m%d'))
+        bound[name] = value
+    return bound
+
+
+def report_query(name, params, schema='dw', summary=True):
+    # SQL text for one report and parameter set
+    if name not in REPORTS:
+        raise ValueError(f"Unknown report: {name}")
+    report = REPORTS[name]
+    unknown = set(params) - set(report['filters'])
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+
+    source = 'summary' if summary and set(params) <= set(report['summary_filters']) else 'detail'
+    filters = report['summary_filters'] if source == 'summary' else report['filters']
+    where = ''.join(f" AND {filters[param]}" for param in sorted(params))
+    return source, report[source].format(schema=schema, filters=where)
+
+
+# In-memory LRU of report results, bounded by entry count and by the frames' memory
+class ReportCache:
+    def __init__(self, max_entries=MAX_CACHED_REPORTS, max_bytes=MAX_REPORT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+
+    def put(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (df.copy(), nbytes)
+            self.size += nbytes
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def drop_versions_before(self, version):
+        # Results of older load versions can't be hit again
+        with self.lock:
+            for key in [key for key in self.entries if key[0] < version]:
+                self.size -= self.entries.pop(key)[1]
+
+
+class ReportService:
+    def __init__(self, connection_string=CONNECTION_STRING, engine=None, schema='dw', cache=None, logger=None):
+        self.engine = engine or create_warehouse_engine(connection_string)
+        self.schema = schema
+        self.cache = cache or ReportCache()
+        self.logger = logger or logging.getLogger()
+        self.version = None
+
+    def run(self, name, summary=True, **params):
+        # Results are cached under the warehouse's load version, which every successful load bumps, so new
+        # data invalidates them without any expiry time
+        params = {param: value for param, value in params.items() if value is not None}
+        with self.engine.connect() as conn:
+            version = read_load_version(conn, self.schema)
+            if version != self.version:
+                self.cache.drop_versions_before(version)
+                self.version = version
+
+            key = (version, name, summary, tuple(sorted(_bind(params).items())))
+            df = self.cache.get(key)
+            if df is not None:
+                return df
+
+            source, sql = report_query(name, params, self.schema, summary)
+            if source == 'summary' and not inspect(conn).has_table(REPORTS[name]['summary_table'],
+                                                                   schema=self.schema):
+                source, sql = report_query(name, params, self.schema, summary=False)
+            df = pd.read_sql(text(sql), conn, params=_bind(params))
+        self.logger.info(f"Report {name} {params} from {source} (load version {version}): {len(df)} rows")
+        self.cache.put(key, df)
+        return df
+
+    def close(self):
+        self.engine.dispose()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the warehouse reports")
+    parser.add_argument('reports', nargs='*', metavar='report',
+                        help=f"Reports to run: {', '.join(REPORTS)} (default: all)")
+    parser.add_argument('--connection', default=CONNECTION_STRING,
+                        help="Warehouse connection string (default: OLIST_WAREHOUSE_URL, the olist.ini [warehouse] url "
+                             "or the local SQL Server)")
+    parser.add_argument('--start-date', help="First purchase date to include (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="Last purchase date to include (YYYY-MM-DD)")
+    parser.add_argument('--state', help="Two-letter state (customer state, or seller state for seller_delivery)")
+    parser.add_argument('--output', help="Write each report to <output>_<report>.csv instead of printing it")
+    args = parser.parse_args()
+    unknown = [name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"Unknown report: {', '.join(unknown)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    service = ReportService(args.connection)
+    try:
+        for name in args.reports or REPORTS:
+            df = service.run(name, start_date=args.start_date, end_date=args.end_date, state=args.state)
+            if args.output:
+                df.to_csv(f"{args.output}_{name}.csv", index=False)
+            else:
+                print(f"\n{name}")
+                df.to_string(sys.stdout, index=False)
+                print()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+import json
+import logging
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.processed import OUTPUT_DIR
+from src.storage import frame_path, read_frame
+from src.window_engine import (SortedGroups, grouped_cumsum, grouped_dense_rank, grouped_total, sort_codes,
+                               sorted_order)
+
+# The customer_sales window output is kept up to date from a per-customer state instead of being recomputed over
+# every order item: items of orders above the state's order_key watermark update only their customers' rows.
+# OLIST_CUSTOMER_SALES_STATE=0 recomputes it in full every run.
+INCREMENTAL = os.environ.get('OLIST_CUSTOMER_SALES_STATE', '1') == '1'
+STATE_DIR = Path('../data/customer_sales_state')
+# Window outputs kept with the state. The base is customer_sales as of its last full write, so it is not named
+# window_customer_sales: it is only current together with the delta (read_customer_sales).
+STATE_OUTPUTS = ['customer_sales_base', 'customer_sales_delta', 'customer_sales_changes']
+# A run with more new items than this share of the items already counted recomputes customer_sales in full,
+# which is the faster path from there on (benchmarks/bench_running_totals.py)
+REBUILD_FRACTION = float(os.environ.get('OLIST_CUSTOMER_SALES_REBUILD_FRACTION', '0.3'))
+# The customers changed since customer_sales was last written in full are kept apart, in the delta output and
+# state; once they hold this share of all rows, they are merged back and customer_sales is rewritten
+COMPACT_FRACTION = float(os.environ.get('OLIST_CUSTOMER_SALES_COMPACT_FRACTION', '0.1'))
+
+COLUMNS = ['customer_unique_id', 'order_id', 'price', 'cumulative_sales', 'total_customer_sales',
+           'percent_of_total', 'price_rank']
+# Columns of the state's rows; the others are computed from the customer's running sum and prices
+ROW_COLUMNS = ['order_id', 'price', 'cumulative_sales']
+# Summed over order_items at the watermark; a different total means earlier items changed
+HISTORY_REL_TOL = 1e-12
+
+
+def customer_items(order_items_df, customers_df):
+    # Items with their customer_unique_key and _id; items whose order is missing have no customer, as in an
+    # inner join with orders. Customers are looked up by position, like the order columns in src/enrichment.py.
+    has_customer = order_items_df['customer_key'].notna().to_numpy()
+    items = order_items_df if has_customer.all() else order_items_df[has_customer]
+    items = items[['order_id', 'shipping_limit_date', 'price', 'customer_key']].reset_index(drop=True)
+    customer_index = pd.Index(customers_df['customer_key'])
+    positions = customer_index.get_indexer(items['customer_key']) if customer_index.is_unique else None
+    if positions is None or (positions < 0).any():
+        return items.merge(customers_df[['customer_key', 'customer_unique_key', 'customer_unique_id']],
+                           on='customer_key')
+    for col in ['customer_unique_key', 'customer_unique_id']:
+        values = customers_df[col]
+        values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+        items[col] = pd.api.extensions.take(values, positions)
+    return items
+
+
+def _sort(rows):
+    # In customer_unique_id order, by integer codes ordered like the ids; each id has one customer_unique_key, so
+    # the rows of a key are contiguous and the groups are found on the key
+    return rows.take(sorted_order(sort_codes(rows['customer_unique_id']), rows['shipping_limit_date'].to_numpy()))
+
+
+def customer_sales(rows, return_state=False):
+    # Running total, customer total, share of it and price rank of every customer_items row, per
+    # customer_unique_id in shipping_limit_date order; all customer windows share one set of group offsets
+    customer_orders = _sort(rows)
+    customers = SortedGroups(customer_orders['customer_unique_key'].to_numpy())
+    prices = customer_orders['price'].to_numpy(dtype=float)
+    cumulative, compensation = grouped_cumsum(prices, customers, return_compensation=True)
+    customer_orders['cumulative_sales'] = cumulative
+    customer_orders['total_customer_sales'] = grouped_total(prices, customers, cumulative=cumulative)
+    customer_orders['percent_of_total'] = (
+            customer_orders['cumulative_sales'] / customer_orders['total_customer_sales'] * 100).round(2)
+    customer_orders['price_rank'] = grouped_dense_rank(prices, customers, ascending=False)
+
+    output = customer_orders[COLUMNS]
+    if not return_state:
+        return output
+    price_groups, price_values = _distinct_prices(customers.broadcast(np.arange(len(customers.starts))), prices)
+    state = StateTables.from_frames(
+        pd.DataFrame({
+            'customer_unique_key': customer_orders['customer_unique_key'].to_numpy()[customers.starts],
+            'customer_unique_id': customer_orders['customer_unique_id'].iloc[customers.starts].reset_index(drop=True),
+            'running_sum': cumulative[customers.ends],
+            'compensation': compensation[customers.ends],
+            'item_count': customers.lengths,
+            'last_shipping': customer_orders['shipping_limit_date'].to_numpy()[customers.ends],
+            'price_count': SortedGroups(price_groups).lengths
+        }),
+        customer_orders[ROW_COLUMNS].reset_index(drop=True),
+        price_values
+    )
+    return output, state
+
+
+def _distinct_prices(groups, prices):
+    # Each group's distinct prices, highest first, in group order
+    order = np.lexsort((-prices, groups))
+    groups, prices = groups[order], prices[order]
+    first = np.ones(len(groups), dtype=bool)
+    first[1:] = (groups[1:] != groups[:-1]) | (prices[1:] != prices[:-1])
+    return groups[first], prices[first]
+
+
+def _starts(counts):
+    return np.cumsum(counts) - counts
+
+
+def _ranges(starts, lengths):
+    # Row positions of the blocks of lengths rows at starts, one block after the other
+    return np.repeat(starts - _starts(lengths), lengths) + np.arange(lengths.sum())
+
+
+def _column(table, name):
+    # Without a copy for a memory-mapped table of one record batch
+    column = table.column(name)
+    return column.chunk(0).to_numpy() if column.num_chunks == 1 else column.to_numpy()
+
+
+# Per-customer state behind customer_sales, as blocks in customer_unique_key order. customers has one row per
+# customer: its customer_unique_key and _id, the running sum of its prices and its Kahan compensation (new items
+# continue the sum exactly as a full recompute would), item_count, the latest shipping_limit_date, price_count and
+# where its blocks start. rows holds its output rows (order_id, price, cumulative_sales) in output order and prices
+# its distinct prices, highest first, for the price ranks.
+class StateTables:
+    NAMES = ['customers', 'rows', 'prices']
+
+    def __init__(self, customers, rows, prices):
+        self.customers, self.rows, self.prices = customers, rows, prices
+        self.keys = _column(customers, 'customer_unique_key')
+
+    @classmethod
+    def from_frames(cls, customers, rows, prices):
+        # customers without the block starts, with the rows frame and prices array as blocks in its order
+        order = np.argsort(customers['customer_unique_key'].to_numpy(), kind='stable')
+        item_counts = customers['item_count'].to_numpy()
+        price_counts = customers['price_count'].to_numpy()
+        rows = rows.take(_ranges(_starts(item_counts)[order], item_counts[order])).reset_index(drop=True)
+        prices = np.asarray(prices)[_ranges(_starts(price_counts)[order], price_counts[order])]
+        customers = customers.take(order).reset_index(drop=True)
+        customers['row_start'] = _starts(item_counts[order])
+        customers['price_start'] = _starts(price_counts[order])
+        return cls(*(pa.Table.from_pandas(df, preserve_index=False)
+                     for df in [customers, rows, pd.DataFrame({'price': prices})]))
+
+    @classmethod
+    def read(cls, directory):
+        # Memory-mapped: a run reads only the blocks of the customers it updates
+        return cls(*(feather.read_table(Path(directory) / f"{name}.arrow", memory_map=True) for name in cls.NAMES))
+
+    def write(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, table in zip(self.NAMES, [self.customers, self.rows, self.prices]):
+            # Uncompressed and in one record batch so it can be mapped; written next to the file and moved over
+            # it, so a mapped copy of the old file stays readable
+            tmp_file = directory / f"{name}.arrow.tmp"
+            feather.write_feather(table, tmp_file, compression='uncompressed', chunksize=max(table.num_rows, 1))
+            os.replace(tmp_file, directory / f"{name}.arrow")
+
+    def empty(self):
+        return StateTables(self.customers.slice(0, 0), self.rows.slice(0, 0), self.prices.slice(0, 0))
+
+    def find(self, keys):
+        # Positions of keys in customers, -1 for customers not in it
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        return np.where(found, positions, -1)
+
+    def blocks(self, positions):
+        # The customers at positions (without the block starts), with their rows and prices as blocks in that order
+        customers = self.customers.take(positions).to_pandas()
+        rows = self.rows.take(_ranges(customers['row_start'].to_numpy(), customers['item_count'].to_numpy()))
+        prices = _column(self.prices, 'price')[_ranges(customers['price_start'].to_numpy(),
+                                                       customers['price_count'].to_numpy())]
+        return customers.drop(columns=['row_start', 'price_start']), rows.to_pandas(), prices
+
+    def merge(self, other):
+        # These customers with those of other replaced by, or added as, their blocks in other
+        keep = np.flatnonzero(~np.isin(self.keys, other.keys))
+        order = np.argsort(np.concatenate([self.keys[keep], other.keys]), kind='stable')
+        customers = pa.concat_tables([self.customers.take(keep),
+                                      other.customers.cast(self.customers.schema)]).take(order)
+        tables = {}
+        for name, start, count in [('rows', 'row_start', 'item_count'), ('prices', 'price_start', 'price_count')]:
+            table, other_table = getattr(self, name), getattr(other, name)
+            starts = np.concatenate([_column(self.customers, start)[keep],
+                                     _column(other.customers, start) + table.num_rows])[order]
+            counts = _column(customers, count)
+            tables[name] = pa.concat_tables([table, other_table.cast(table.schema)]).take(_ranges(starts, counts))
+            customers = customers.set_column(customers.schema.get_field_index(start), start,
+                                             pa.array(_starts(counts)))
+        return StateTables(customers, tables['rows'], tables['prices'])
+
+    def output(self):
+        # The customer_sales rows of these customers, in customer_unique_id order
+        customers = self.customers.to_pandas()
+        customers = customers.take(sorted_order(sort_codes(customers['customer_unique_id'])))
+        item_counts = customers['item_count'].to_numpy()
+        groups = np.repeat(np.arange(len(customers)), item_counts)
+        output = self.rows.take(_ranges(customers['row_start'].to_numpy(), item_counts)).to_pandas()
+        output['customer_unique_id'] = customers['customer_unique_id'].array.take(groups)
+        output['total_customer_sales'] = customers['running_sum'].to_numpy()[groups]
+        output['percent_of_total'] = (output['cumulative_sales'] / output['total_customer_sales'] * 100).round(2)
+        output['price_rank'] = grouped_dense_rank(output['price'].to_numpy(dtype=float), SortedGroups(groups),
+                                                  ascending=False)
+        return output[COLUMNS]
+
+
+def read_customer_sales(output_dir=OUTPUT_DIR):
+    # The current customer_sales: window_customer_sales as written by a full recompute, or after an incremental run
+    # the base output with the customers of the delta output replaced by their rows there, in customer_unique_id
+    # order. The window stage removes the files of the mode it didn't run in.
+    base_file = frame_path(output_dir, 'window_customer_sales_base')
+    if not base_file.exists():
+        return read_frame(frame_path(output_dir, 'window_customer_sales'))
+    output = read_frame(base_file)
+    delta = read_frame(frame_path(output_dir, 'window_customer_sales_delta'))
+    if not len(delta):
+        return output
+    output = pd.concat([output[~output['customer_unique_id'].isin(delta['customer_unique_id'])], delta],
+                       ignore_index=True)
+    return output.iloc[sorted_order(sort_codes(output['customer_unique_id']))].reset_index(drop=True)
+
+
+# The customer_sales state, in its own directory so the window stage caches it with its outputs: the base tables
+# for the customers as of the last full write of customer_sales, the delta tables for those changed since (both
+# StateTables), and a meta file with the order_key watermark, the item count and price total of order_items at it
+# and the row counts of the tables.
+class CustomerSalesState:
+    def __init__(self, state_dir=STATE_DIR, output_dir=OUTPUT_DIR, logger=None):
+        self.state_dir = Path(state_dir)
+        self.output_dir = Path(output_dir)
+        self.logger = logger or logging.getLogger()
+        self.base = self.delta = self.meta = None
+        self.base_changed = False
+
+    def _load(self):
+        meta_file = self.state_dir / 'state.json'
+        if not meta_file.exists() or not frame_path(self.output_dir, 'window_customer_sales_base').exists():
+            return False
+        self.meta = json.loads(meta_file.read_text())
+        self.base = StateTables.read(self.state_dir / 'base')
+        self.delta = StateTables.read(self.state_dir / 'delta')
+        return True
+
+    def save(self):
+        # The base tables only when this run rewrote them
+        if self.base_changed:
+            self.base.write(self.state_dir / 'base')
+        self.delta.write(self.state_dir / 'delta')
+        self.meta.update(base_rows=self.base.rows.num_rows, delta_rows=self.delta.rows.num_rows)
+        # Written last: tables that don't match their meta file are rebuilt
+        (self.state_dir / 'state.json').write_text(json.dumps(self.meta, indent=2))
+
+    def _advance(self, order_items_df):
+        self.meta = {
+            'watermark': int(order_items_df['order_key'].max()) if len(order_items_df) else 0,
+            'history_items': len(order_items_df),
+            'history_price_sum': float(order_items_df['price'].to_numpy(dtype=float).sum())
+        }
+
+    def refresh(self, order_items_df, customers_df):
+        # The customer_sales outputs to write for order_items_df, by name (STATE_OUTPUTS): customer_sales_changes has
+        # the rows that changed since the saved state (every row when it is rebuilt), customer_sales_delta the rows
+        # of every customer changed since customer_sales was written in full, and customer_sales_base, the full
+        # table, is only there when it is rewritten (the state was rebuilt or the delta merged back).
+        # read_customer_sales combines them.
+        # order_items_df carries customer_key (src/enrichment.py).
+        try:
+            result = self._update(order_items_df, customers_df) if self._load() else None
+        except (OSError, KeyError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable customer_sales state {self.state_dir}: {e}")
+            result = None
+        if result is None:
+            output, self.base = customer_sales(customer_items(order_items_df, customers_df), return_state=True)
+            self.delta = self.base.empty()
+            self.base_changed = True
+            result = {'customer_sales_base': output, 'customer_sales_delta': output.iloc[:0],
+                      'customer_sales_changes': output}
+        self._advance(order_items_df)
+        return result
+
+    def _lookup(self, keys):
+        # Which keys have saved blocks, and those blocks in the order of keys, from the delta tables or else the
+        # base ones
+        in_delta = self.delta.find(keys)
+        in_base = np.where(in_delta < 0, self.base.find(keys), -1)
+        parts = [self.delta.blocks(in_delta[in_delta >= 0]), self.base.blocks(in_base[in_base >= 0])]
+        order = np.argsort(np.concatenate([np.flatnonzero(in_delta >= 0), np.flatnonzero(in_base >= 0)]),
+                           kind='stable')
+        customers = pd.concat([part[0] for part in parts], ignore_index=True)
+        item_counts, price_counts = customers['item_count'].to_numpy(), customers['price_count'].to_numpy()
+        rows = pd.concat([part[1] for part in parts], ignore_index=True)
+        prices = np.concatenate([part[2] for part in parts])
+        return (
+            (in_delta >= 0) | (in_base >= 0),
+            customers.take(order).reset_index(drop=True),
+            rows.take(_ranges(_starts(item_counts)[order], item_counts[order])).reset_index(drop=True),
+            prices[_ranges(_starts(price_counts)[order], price_counts[order])]
+        )
+
+    def _update(self, order_items_df, customers_df):
+        # None when the saved state can't be carried forward, or when there are so many new items that a full
+        # recompute is faster, so the caller rebuilds. The items at or below the watermark are only counted and
+        # summed; only the new ones are joined with their customers.
+        prices = order_items_df['price'].to_numpy(dtype=float)
+        applied = order_items_df['order_key'].to_numpy() <= self.meta['watermark']
+        if (applied.sum() != self.meta['history_items']
+                or not math.isclose(prices[applied].sum(), self.meta['history_price_sum'], rel_tol=HISTORY_REL_TOL)
+                or self.base.rows.num_rows != self.meta['base_rows']
+                or self.delta.rows.num_rows != self.meta['delta_rows']):
+            self.logger.info("Items below the customer_sales watermark changed, rebuilding its state")
+            return None
+        new_items = len(applied) - self.meta['history_items']
+        if new_items > REBUILD_FRACTION * self.meta['history_items']:
+            self.logger.info(f"{new_items} new items, more than {REBUILD_FRACTION:.0%} of the items in the "
+                             f"customer_sales state, recomputing it in full")
+            return None
+
+        rows = _sort(customer_items(order_items_df[~applied], customers_df)).reset_index(drop=True)
+        keys = rows['customer_unique_key'].to_numpy()
+        groups = SortedGroups(keys)
+        affected = keys[groups.starts]
+        affected_ids = rows['customer_unique_id'].iloc[groups.starts].reset_index(drop=True)
+        known, earlier, earlier_rows, earlier_prices = self._lookup(affected)
+        if (earlier['customer_unique_id'].to_numpy(dtype=object) != affected_ids.to_numpy(dtype=object)[known]).any():
+            self.logger.info("customer_unique_key no longer matches the customer_sales state, rebuilding it")
+            return None
+        shipping = rows['shipping_limit_date'].to_numpy()
+        if (earlier['last_shipping'].to_numpy() >= shipping[groups.starts][known]).any():
+            self.logger.info("New items precede earlier items of their customer, rebuilding the customer_sales state")
+            return None
+
+        # New items continue their customer's running sum
+        sums, compensations = np.zeros(len(affected)), np.zeros(len(affected))
+        sums[known] = earlier['running_sum'].to_numpy()
+        compensations[known] = earlier['compensation'].to_numpy()
+        new_prices = rows['price'].to_numpy(dtype=float)
+        cumulative, compensation = grouped_cumsum(new_prices, groups, initial=(sums, compensations),
+                                                  return_compensation=True)
+        rows['cumulative_sales'] = cumulative
+
+        # The new rows and prices go after the customer's earlier ones. Rows are numbered by their customer's
+        # position among the affected ones, which is customer_unique_id order.
+        new_groups = groups.broadcast(np.arange(len(affected)))
+        earlier_groups = np.flatnonzero(known)
+        item_counts = earlier['item_count'].to_numpy()
+        order = np.argsort(np.concatenate([np.repeat(earlier_groups, item_counts), new_groups]), kind='stable')
+        changed_rows = pd.concat([earlier_rows, rows[ROW_COLUMNS]], ignore_index=True).take(order)
+        price_groups, price_values = _distinct_prices(
+            np.concatenate([np.repeat(earlier_groups, earlier['price_count'].to_numpy()), new_groups]),
+            np.concatenate([earlier_prices, new_prices])
+        )
+        counts = groups.lengths.copy()
+        counts[known] += item_counts
+        changed = StateTables.from_frames(
+            pd.DataFrame({
+                'customer_unique_key': affected,
+                'customer_unique_id': affected_ids,
+                'running_sum': cumulative[groups.ends],
+                'compensation': compensation[groups.ends],
+                'item_count': counts,
+                'last_shipping': shipping[groups.ends],
+                'price_count': SortedGroups(price_groups).lengths
+            }),
+            changed_rows.reset_index(drop=True),
+            price_values
+        )
+        self.logger.info(f"Updated customer_sales for {len(affected)} customers from {len(rows)} new items")
+
+        result = {'customer_sales_changes': changed.output()}
+        self.delta = self.delta.merge(changed)
+        if self.delta.rows.num_rows > COMPACT_FRACTION * self.base.rows.num_rows:
+            self.logger.info(f"Merging the customer_sales delta ({self.delta.rows.num_rows} rows) into its output")
+            self.base, self.delta = self.base.merge(self.delta), self.delta.empty()
+            self.base_changed = True
+            result['customer_sales_base'] = self.base.output()
+        result['customer_sales_delta'] = self.delta.output()
+        return result
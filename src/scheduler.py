@@ -0,0 +1,128 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from logging.handlers import QueueHandler, QueueListener
+
+
+# A unit of work in the ETL graph: func is called with the results of deps (in order) followed by args.
+# outputs are the files the stage writes; with a cache_key they can be restored from the cache, and
+# load (if set) rebuilds the stage result from them.
+class Stage:
+    def __init__(self, name, func, deps=(), args=(), label=None, outputs=(), load=None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.args = tuple(args)
+        self.label = label or name
+        self.outputs = list(outputs)
+        self.load = load
+        self.cache_key = None
+
+
+def _init_worker(log_queue, level):
+    # Route worker log records back to the parent's handlers
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+
+def _check_graph(stages):
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = [dep for dep in stage.deps if dep not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {unknown}")
+
+
+def _restore_from_cache(stage, cache, logger):
+    try:
+        if not cache.restore(stage.cache_key, stage.outputs):
+            return False, None
+        logger.info(f"Reusing cached {stage.label} ({stage.cache_key[:12]})")
+        return True, stage.load() if stage.load else None
+    except Exception as e:
+        logger.warning(f"Could not reuse cached {stage.label}: {e}")
+        return False, None
+
+
+def _store_in_cache(stage, cache, logger):
+    try:
+        cache.store(stage.cache_key, stage.name, stage.outputs)
+    except Exception as e:
+        logger.warning(f"Could not cache {stage.label}: {e}")
+
+
+def run_stages(stages, max_workers=None, logger=None, cache=None, force=False, on_result=None):
+    # on_result(stage, result) runs in this process on every result (computed or cached) and may replace it
+    if logger is None:
+        logger = logging.getLogger()
+
+    _check_graph(stages)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(stages)))
+
+    results = {}
+    unavailable = set()
+    pending = list(stages)
+    running = {}
+
+    def finish(stage, result):
+        # on_result gets the same isolation as the stage itself: if it raises, only this stage (and the stages
+        # that depend on it) is lost
+        try:
+            results[stage.name] = on_result(stage, result) if on_result else result
+        except Exception as e:
+            logger.error(f"Error processing {stage.label}: {e}", exc_info=e)
+            unavailable.add(stage.name)
+
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *(logger.handlers or logging.getLogger().handlers),
+                             respect_handler_level=True)
+    listener.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(log_queue, logger.getEffectiveLevel())) as executor:
+            while pending or running:
+                progressed = False
+                for stage in list(pending):
+                    if any(dep in unavailable for dep in stage.deps):
+                        logger.warning(f"Missing required datasets for {stage.label}")
+                        unavailable.add(stage.name)
+                        pending.remove(stage)
+                        progressed = True
+                    elif all(dep in results for dep in stage.deps):
+                        pending.remove(stage)
+                        progressed = True
+                        if cache is not None and stage.cache_key and not force:
+                            hit, result = _restore_from_cache(stage, cache, logger)
+                            if hit:
+                                finish(stage, result)
+                                continue
+                        logger.info(f"Processing {stage.label}...")
+                        inputs = [results[dep] for dep in stage.deps]
+                        running[executor.submit(stage.func, *inputs, *stage.args)] = stage
+
+                if not running:
+                    if progressed:
+                        continue
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Error processing {stage.label}: {e}", exc_info=e)
+                        unavailable.add(stage.name)
+                        continue
+                    if cache is not None and stage.cache_key:
+                        _store_in_cache(stage, cache, logger)
+                    finish(stage, result)
+    finally:
+        listener.stop()
+
+    return results
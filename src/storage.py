@@ -0,0 +1,117 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from src.instrumentation import instrumented
+
+# Format used for the processed outputs, overridable per run with OLIST_OUTPUT_FORMAT
+OUTPUT_FORMAT = os.environ.get('OLIST_OUTPUT_FORMAT', 'parquet')
+COMPRESSION = 'zstd'
+
+EXTENSIONS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv': '.csv'
+}
+
+
+def frame_path(directory, name, fmt=None):
+    fmt = fmt or OUTPUT_FORMAT
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    return Path(directory) / f"{Path(name).stem}{EXTENSIONS[fmt]}"
+
+
+def _to_table(df):
+    if isinstance(df, pa.Table):
+        return df
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# df is a DataFrame or a pyarrow Table (written as is, without a round trip through pandas)
+@instrumented('write')
+def write_frame(df, path, fmt=None):
+    fmt = fmt or OUTPUT_FORMAT
+    if fmt == 'parquet':
+        pq.write_table(_to_table(df), path, compression=COMPRESSION)
+    elif fmt == 'arrow':
+        feather.write_feather(_to_table(df), path, compression=COMPRESSION)
+    elif fmt == 'csv':
+        (df.to_pandas() if isinstance(df, pa.Table) else df).to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+    return path
+
+
+@instrumented('read')
+def read_frame(path, columns=None, fmt=None, dtype=None, parse_dates=None):
+    fmt = fmt or OUTPUT_FORMAT
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns).to_pandas()
+    if fmt == 'arrow':
+        return feather.read_table(path, columns=columns).to_pandas()
+    if fmt == 'csv':
+        # CSV carries no types, so they have to be supplied again (e.g. from SCHEMAS)
+        # The partial outputs of a projected run (processed.output_name) may lack some of the date columns
+        if parse_dates is not None:
+            present = columns if columns is not None else pd.read_csv(path, nrows=0).columns
+            parse_dates = [col for col in parse_dates if col in present]
+        return pd.read_csv(path, usecols=columns, dtype=dtype, parse_dates=parse_dates)
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+@instrumented('read', step='read_table')
+def read_table(path, columns=None, fmt=None):
+    # Like read_frame, as a pyarrow Table for callers that only slice and rewrite the rows
+    fmt = fmt or OUTPUT_FORMAT
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns)
+    if fmt == 'arrow':
+        return feather.read_table(path, columns=columns)
+    if fmt == 'csv':
+        return _to_table(pd.read_csv(path, usecols=columns))
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+# Appends frames with the same columns to one output file, for the chunked path
+class FrameWriter:
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or OUTPUT_FORMAT
+        self._writer = None
+        self._schema = None
+        self._chunks = 0
+
+    @instrumented('write', step='FrameWriter.write')
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.path, index=False, mode='w' if self._chunks == 0 else 'a', header=self._chunks == 0)
+        else:
+            table = _to_table(df)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.fmt == 'parquet':
+                    self._writer = pq.ParquetWriter(self.path, self._schema, compression=COMPRESSION)
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+                    self._writer = pa.ipc.new_file(self.path, self._schema, options=options)
+            else:
+                # Later chunks may infer narrower types (e.g. an all-null column), so align them to the first chunk
+                table = table.replace_schema_metadata(self._schema.metadata).cast(self._schema)
+            self._writer.write_table(table)
+        self._chunks += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,255 @@
+import hashlib
+import logging
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+from pandera.engines import pandas_engine
+
+from src.cache import CACHE_DIR, code_digest, combine_digests
+from src.instrumentation import instrumented
+from src import quarantine
+from src.quarantine import FAILURE_MODE, FAILURE_MODES, REASON_COLUMN
+
+# full: every row against every constraint; sampled: a seeded fraction of the rows;
+# schema: column names and dtypes only
+VALIDATION_LEVELS = ['full', 'sampled', 'schema']
+VALIDATION_LEVEL = os.environ.get('OLIST_VALIDATION_LEVEL', 'full')
+SAMPLE_FRACTION = float(os.environ.get('OLIST_VALIDATION_SAMPLE_FRACTION', 0.1))
+SAMPLE_SEED = int(os.environ.get('OLIST_VALIDATION_SEED', 42))
+
+# Frames that passed validation leave an empty marker file named after their content hash.
+# Hashing a frame costs more than the compiled checks (a hit on 1M rows takes 0.2-0.7s against 0.08-0.5s for
+# the checks, benchmarks/bench_validation.py), so by default ('auto') the cache is only used for models that fall
+# back to pandera. Every model in olist_model.py compiles, so it is off for them on purpose; '1' caches every
+# model, '0' none.
+VALIDATION_CACHE_DIR = CACHE_DIR / 'validation'
+VALIDATION_CACHE = os.environ.get('OLIST_VALIDATION_CACHE', 'auto')
+
+# Set while a stage works on a projected read (only some of a dataset's columns, see OUTPUT_COLUMNS in
+# etl_processing): model columns the frame doesn't have are skipped instead of failing validation
+_projected = False
+
+
+@contextmanager
+def projected(enabled=True):
+    global _projected
+    previous, _projected = _projected, enabled
+    try:
+        yield
+    finally:
+        _projected = previous
+
+
+def _isin(values, stats):
+    return values.isin(stats['allowed_values'])
+
+
+def _in_range(values, stats):
+    above = values >= stats['min_value'] if stats.get('include_min', True) else values > stats['min_value']
+    below = values <= stats['max_value'] if stats.get('include_max', True) else values < stats['max_value']
+    return above & below
+
+
+# Vectorized versions of the pandera built-in checks, keyed by check name; they see non-null values only
+CHECKS = {
+    'greater_than_or_equal_to': lambda values, stats: values >= stats['min_value'],
+    'greater_than': lambda values, stats: values > stats['min_value'],
+    'less_than_or_equal_to': lambda values, stats: values <= stats['max_value'],
+    'less_than': lambda values, stats: values < stats['max_value'],
+    'equal_to': lambda values, stats: values == stats['value'],
+    'not_equal_to': lambda values, stats: values != stats['value'],
+    'in_range': _in_range,
+    'isin': _isin,
+    'notin': lambda values, stats: ~values.isin(stats['forbidden_values'])
+}
+
+
+# A pandera model flattened into plain per-column constraint lists that are evaluated with one vectorized
+# expression each. Models using checks outside CHECKS fall back to pandera itself.
+class CompiledSchema:
+    def __init__(self, model):
+        self.model = model
+        self.schema = model.to_schema()
+        self.columns = {
+            name: (column, [(check.name, check.statistics) for check in column.checks])
+            for name, column in self.schema.columns.items()
+        }
+        self.supported = not self.schema.checks and all(
+            check_name in CHECKS for _, checks in self.columns.values() for check_name, _ in checks
+        )
+
+    def structure_failures(self, df, projected=False):
+        failures = [] if projected else [
+            f"column '{name}' not in dataframe" for name in self.columns if name not in df.columns
+        ]
+        if self.schema.strict:
+            failures += [f"column '{name}' not in {self.model.__name__}" for name in df.columns
+                         if name not in self.columns]
+        for name, (column, _) in self.columns.items():
+            if name in df.columns and not column.dtype.check(pandas_engine.Engine.dtype(df[name].dtype)):
+                failures.append(f"expected column '{name}' to have type {column.dtype}, got {df[name].dtype}")
+        return failures
+
+    def violations(self, df):
+        # (summary, per-row reason, failing-row mask) for each violated constraint; checks skip null values
+        for name, (column, checks) in self.columns.items():
+            if name not in df.columns:
+                continue
+            series = df[name]
+            missing = series.isna().to_numpy()
+            if not column.nullable and missing.any():
+                yield (f"non-nullable column '{name}' contains {int(missing.sum())} null values",
+                       f"{name} is null", missing)
+            if column.unique:
+                duplicated = series.duplicated().to_numpy()
+                if duplicated.any():
+                    yield (f"column '{name}' contains {int(duplicated.sum())} duplicate values",
+                           f"{name} is a duplicate", duplicated)
+            for check_name, stats in checks:
+                failed = ~CHECKS[check_name](series, stats).to_numpy(dtype=bool, na_value=True) & ~missing
+                if failed.any():
+                    failure_cases = series[failed].unique()[:5].tolist()
+                    yield (f"column '{name}' failed {check_name}{stats} for {int(failed.sum())} rows, "
+                           f"e.g. {failure_cases}", f"{name} failed {check_name}{stats}", failed)
+
+    def value_failures(self, df):
+        return [summary for summary, _, _ in self.violations(df)]
+
+    def _pandera_schema(self, df):
+        # The model's schema, narrowed to the frame's columns for projected reads
+        if all(name in df.columns for name in self.columns):
+            return self.model
+        return self.schema.select_columns([name for name in self.columns if name in df.columns])
+
+    def row_failures(self, df):
+        # Reasons for every failing row, '; '-joined and indexed by row position
+        positions, reasons = [], []
+        if self.supported:
+            for _, reason, failed in self.violations(df):
+                failed_positions = np.flatnonzero(failed)
+                positions.append(failed_positions)
+                reasons.append(np.full(len(failed_positions), reason, dtype=object))
+        else:
+            try:
+                self._pandera_schema(df).validate(df.reset_index(drop=True), lazy=True)
+            except pa.errors.SchemaErrors as e:
+                cases = e.failure_cases
+                if cases['index'].isna().any():
+                    # Dataframe-wide failures can't be pinned on rows
+                    raise
+                positions.append(cases['index'].to_numpy(dtype=np.int64))
+                reasons.append((cases['column'].astype(str) + ' failed ' + cases['check'].astype(str)).to_numpy())
+        if not positions:
+            return pd.Series(dtype=object)
+        reasons = pd.Series(np.concatenate(reasons), index=np.concatenate(positions))
+        return reasons.groupby(level=0).agg(lambda row: '; '.join(dict.fromkeys(row)))
+
+    def _checked_positions(self, df, level):
+        # Positions of the rows the value checks look at, or None for all of them
+        if level != 'sampled':
+            return None
+        return pd.Series(np.arange(len(df))).sample(frac=SAMPLE_FRACTION, random_state=SAMPLE_SEED).to_numpy()
+
+    def _raise_on_structure(self, df, projected=False):
+        failures = self.structure_failures(df, projected)
+        if failures:
+            raise pa.errors.SchemaError(self.schema, df, f"{self.model.__name__} failed validation: "
+                                                         + '; '.join(failures))
+
+    def validate(self, df, level, projected=False):
+        self._raise_on_structure(df, projected)
+        if level != 'schema':
+            positions = self._checked_positions(df, level)
+            rows = df if positions is None else df.iloc[positions]
+            if not self.supported:
+                self._pandera_schema(rows).validate(rows)
+            else:
+                failures = self.value_failures(rows)
+                if failures:
+                    raise pa.errors.SchemaError(self.schema, df, f"{self.model.__name__} failed validation: "
+                                                                 + '; '.join(failures))
+        return df
+
+    def split(self, df, level, projected=False):
+        # (clean rows, failing rows with their reasons in REASON_COLUMN); structural failures still raise
+        self._raise_on_structure(df, projected)
+        if level == 'schema':
+            return df, df.iloc[:0]
+        positions = self._checked_positions(df, level)
+        reasons = self.row_failures(df if positions is None else df.iloc[positions])
+        if reasons.empty:
+            return df, df.iloc[:0]
+        failed_positions = reasons.index.to_numpy() if positions is None else positions[reasons.index.to_numpy()]
+        failed = np.zeros(len(df), dtype=bool)
+        failed[failed_positions] = True
+        rejected = df.iloc[failed_positions].reset_index(drop=True)
+        rejected[REASON_COLUMN] = reasons.to_numpy()
+        return df[~failed].reset_index(drop=True), rejected
+
+
+@lru_cache(maxsize=None)
+def compile_model(model):
+    return CompiledSchema(model)
+
+
+def frame_digest(df):
+    digest = hashlib.sha256()
+    digest.update(repr([(name, str(dtype)) for name, dtype in df.dtypes.items()]).encode())
+    for name in df.columns:
+        series = df[name]
+        if isinstance(series.dtype, pd.StringDtype):
+            # Digesting one joined buffer is several times faster than hashing strings row by row
+            joined = '\x00'.join(series.to_numpy(dtype=object, na_value='\x01'))
+            digest.update(joined.encode('utf-8', 'surrogatepass'))
+        else:
+            digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def validation_key(model, df, level, projected=False):
+    # The model source (and its base classes from the same module) is part of the key, so editing a
+    # constraint invalidates earlier results
+    model_code = code_digest(*[cls for cls in model.__mro__ if cls.__module__ == model.__module__])
+    sampling = (SAMPLE_FRACTION, SAMPLE_SEED) if level == 'sampled' else None
+    return combine_digests(model.__name__, model_code, level, sampling, projected, frame_digest(df))
+
+
+@instrumented('validate')
+def validate(model, df, level=None, use_cache=None, logger=None, failures=None):
+    # In quarantine mode, returns the rows that passed and hands the rest to quarantine.collect
+    if logger is None:
+        logger = logging.getLogger()
+    level = level or VALIDATION_LEVEL
+    if level not in VALIDATION_LEVELS:
+        raise ValueError(f"Unknown validation level: {level}")
+    failures = failures or FAILURE_MODE
+    if failures not in FAILURE_MODES:
+        raise ValueError(f"Unknown validation failure mode: {failures}")
+    compiled = compile_model(model)
+    if use_cache is None:
+        use_cache = not compiled.supported if VALIDATION_CACHE == 'auto' else VALIDATION_CACHE != '0'
+
+    # Schema-only validation is cheaper than hashing the frame, so it is never cached
+    key = validation_key(model, df, level, _projected) if use_cache and level != 'schema' else None
+    if key and (VALIDATION_CACHE_DIR / key).exists():
+        logger.info(f"Reusing validation of {model.__name__} ({key[:12]})")
+        return df
+
+    if failures == 'raise':
+        compiled.validate(df, level, _projected)
+    else:
+        df, rejected = compiled.split(df, level, _projected)
+        if len(rejected):
+            logger.warning(f"{model.__name__}: quarantined {len(rejected)} of {len(df) + len(rejected)} rows "
+                           f"({rejected[REASON_COLUMN].value_counts().head(3).to_dict()})")
+            quarantine.collect(rejected)
+            # Only frames that passed as a whole are marked, so the next run validates this one again
+            key = None
+    if key:
+        VALIDATION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (VALIDATION_CACHE_DIR / key).touch()
+    return df
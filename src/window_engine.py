@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.indexers import BaseIndexer
+
+
+# Group boundaries of an array that is already sorted by group: every window function below
+# works from these offsets instead of calling back into Python once per group
+class SortedGroups:
+    def __init__(self, sorted_keys):
+        sorted_keys = np.asarray(sorted_keys)
+        self.size = len(sorted_keys)
+        is_start = np.ones(self.size, dtype=bool)
+        if self.size:
+            is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        self.starts = np.flatnonzero(is_start)
+        self.lengths = np.diff(np.append(self.starts, self.size))
+        self.ends = self.starts + self.lengths - 1
+        # For every row: where its group starts and its 0-based position inside the group
+        self.row_starts = np.repeat(self.starts, self.lengths)
+        self.positions = np.arange(self.size) - self.row_starts
+
+    def broadcast(self, per_group):
+        return np.repeat(per_group, self.lengths)
+
+
+def sort_codes(values):
+    # Integer codes ordered like the values themselves (missing values last), so rows can be sorted on
+    # them without comparing strings. Only the distinct values are sorted, by pyarrow, which compares
+    # strings in C rather than as Python objects.
+    codes, uniques = pd.factorize(values)
+    ranks = np.empty(len(uniques) + 1, dtype=np.intp)
+    ranks[pc.sort_indices(pa.array(uniques)).to_numpy()] = np.arange(len(uniques))
+    ranks[-1] = len(uniques)
+    return ranks[codes]
+
+
+def sorted_order(*keys):
+    # Stable row order by keys[0], then keys[1], ... (same order as DataFrame.sort_values on those columns)
+    keys = [key.view(np.int64) if np.issubdtype(key.dtype, np.datetime64) else key for key in map(np.asarray, keys)]
+    return np.lexsort(keys[::-1])
+
+
+# Window bounds for pandas' rolling kernels that never cross a group boundary: the trailing window_size
+# rows of the row's group, or the whole group when window_size is None. The kernel restarts its running
+# sum at every group start, so one pass over all rows matches a separate rolling call per group exactly.
+class GroupWindowIndexer(BaseIndexer):
+    def __init__(self, groups, window_size=None):
+        super().__init__(window_size=window_size or 0)
+        self.groups = groups
+        self.trailing = window_size
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        if self.trailing is None:
+            start = self.groups.row_starts
+            end = self.groups.broadcast(self.groups.ends + 1)
+        else:
+            end = np.arange(1, num_values + 1)
+            start = end - 1 - np.minimum(self.groups.positions, self.trailing - 1)
+        return start.astype(np.int64), end.astype(np.int64)
+
+
+def rolling_means(values, groups, window_sizes):
+    # Trailing means (min_periods=1) for several window sizes over one sorted column
+    values = pd.Series(np.asarray(values, dtype=float))
+    return [
+        values.rolling(GroupWindowIndexer(groups, window_size), min_periods=1).mean().to_numpy()
+        for window_size in window_sizes
+    ]
+
+
+def grouped_mean(values, groups):
+    values = pd.Series(np.asarray(values, dtype=float))
+    return values.rolling(GroupWindowIndexer(groups), min_periods=1).mean().to_numpy()
+
+
+def grouped_cumsum(values, groups, initial=None, return_compensation=False):
+    # Adds the previous row into every row one position at a time, so each group is summed front to back
+    # with the same Kahan compensation as pandas' groupby cumsum; the loop runs once per position of the
+    # longest group, not once per group. initial = (sums, compensations) per group continues running sums of
+    # earlier rows exactly as if those rows came first; return_compensation also returns each row's compensation.
+    values = np.asarray(values, dtype=float)
+    result = values.copy()
+    compensation = np.zeros(groups.size)
+    if not groups.size:
+        return (result, compensation) if return_compensation else result
+    if initial is not None:
+        sums, compensations = (np.asarray(part, dtype=float) for part in initial)
+        adjusted = values[groups.starts] - compensations
+        result[groups.starts] = sums + adjusted
+        compensation[groups.starts] = result[groups.starts] - sums - adjusted
+    by_length = np.argsort(-groups.lengths, kind='stable')
+    starts, lengths = groups.starts[by_length], groups.lengths[by_length]
+    for position in range(1, lengths[0]):
+        rows = starts[:np.searchsorted(-lengths, -position, side='left')] + position
+        previous = result[rows - 1]
+        adjusted = values[rows] - compensation[rows - 1]
+        result[rows] = previous + adjusted
+        compensation[rows] = result[rows] - previous - adjusted
+    return (result, compensation) if return_compensation else result
+
+
+def grouped_total(values, groups, cumulative=None):
+    if cumulative is None:
+        cumulative = grouped_cumsum(values, groups)
+    return groups.broadcast(cumulative[groups.ends])
+
+
+def grouped_dense_rank(values, groups, ascending=True):
+    # Dense rank inside each group: sort by (group, value) once and count value changes from the group start
+    values = np.asarray(values, dtype=float)
+    if not groups.size:
+        return values.copy()
+    group_ids = np.repeat(np.arange(len(groups.starts)), groups.lengths)
+    order = np.lexsort((values if ascending else -values, group_ids))
+    sorted_values = values[order]
+
+    is_new = np.ones(groups.size, dtype=bool)
+    is_new[1:] = sorted_values[1:] != sorted_values[:-1]
+    # Rows keep their group slots after the sort, so group starts are the same offsets as before
+    is_new[groups.starts] = True
+    running = np.cumsum(is_new)
+    ranks = np.empty(groups.size, dtype=float)
+    ranks[order] = running - groups.broadcast(running[groups.starts]) + 1
+    return ranks
@@ -0,0 +1,154 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# benchmarks/ for the synthetic Olist generator only; the helpers the tests share are below
+sys.path[:0] = [str(ROOT), str(ROOT / 'benchmarks')]
+
+# The pipeline's paths are relative to src/ (../data/...), so the tests run from src/ of a scratch tree
+WORK_DIR = Path(tempfile.mkdtemp(prefix='olist_tests_'))
+# Small enough for the whole ETL to run in seconds
+SCALE = 0.02
+CWD = pytest.StashKey[str]()
+# The pipeline writes its run manifest next to the first log file of its logger's handlers; pytest's root logger
+# has one on /dev/null, so the tests log through a logger without handlers of its own (records still reach caplog)
+LOGGER = logging.getLogger('olist_tests')
+
+
+def pytest_configure(config):
+    (WORK_DIR / 'src').mkdir(exist_ok=True)
+    os.environ.setdefault('OLIST_DUCKDB_TEMP_DIR', str(WORK_DIR / 'duckdb'))
+    config.stash[CWD] = os.getcwd()
+    os.chdir(WORK_DIR / 'src')
+
+
+def pytest_unconfigure(config):
+    os.chdir(config.stash[CWD])
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def processed_dfs():
+    # The processed frames of one ETL run over generated Olist files; tests that change them work on copies
+    from generate_olist import generate
+    from src.etl_processing import run_etl
+
+    generate(WORK_DIR / 'data' / 'raw', SCALE, seed=0)
+    return run_etl(LOGGER, force=True, use_cache=False)
+
+
+@pytest.fixture
+def pipeline_dir(tmp_path, monkeypatch):
+    # A scratch tree of its own (raw files, outputs, stage cache, key registry) for tests that run the ETL with
+    # the cache or change what is on disk; the test runs from its src/
+    from generate_olist import generate
+
+    generate(tmp_path / 'data' / 'raw', SCALE, seed=0)
+    for directory in ['data/processed', 'src']:
+        (tmp_path / directory).mkdir()
+    monkeypatch.chdir(tmp_path / 'src')
+    return tmp_path
+
+
+def log_messages(caplog, prefix):
+    return [record.getMessage() for record in caplog.records if record.getMessage().startswith(prefix)]
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    # Connection string of an empty SQLite warehouse
+    return f"sqlite:///{tmp_path / 'warehouse.db'}"
+
+
+@pytest.fixture
+def repriced():
+    # Copy of processed frames with the prices (and the totals derived from them) of the selected order items
+    # multiplied by factor
+    def reprice(processed_dfs, selected, factor=2.0):
+        items = processed_dfs['olist_order_items_dataset.csv'].copy()
+        items.loc[selected, 'price'] *= factor
+        items['total_price'] = items['price'] + items['freight_value']
+        items['profit_margin'] = items['price'] - items['freight_value']
+        return {**processed_dfs, 'olist_order_items_dataset.csv': items}
+    return reprice
+
+
+def hex_ids(count, rng):
+    return pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, count)], dtype='string')
+
+
+def make_frames(n_orders=2_000, n_products=300, categories=20, seed=0):
+    # Orders / order items / customers / products shaped like the processed outputs, with their surrogate keys.
+    # About one customer_unique_id in 25 has several orders.
+    rng = np.random.default_rng(seed)
+    n_items = int(n_orders * 1.13)
+    purchase = pd.Timestamp('2016-09-01') + pd.to_timedelta(rng.integers(0, 2 * 365 * 86_400, n_orders), unit='s')
+    delivered = purchase + pd.to_timedelta(rng.integers(-86_400, 40 * 86_400, n_orders), unit='s')
+    order_ids = hex_ids(n_orders, rng)
+    customer_ids = hex_ids(n_orders, rng)
+    orders = pd.DataFrame({
+        'order_key': np.arange(1, n_orders + 1),
+        'order_id': order_ids,
+        'customer_key': np.arange(1, n_orders + 1),
+        'customer_id': customer_ids,
+        'order_purchase_timestamp': purchase,
+        'order_delivered_customer_date': delivered.where(rng.random(n_orders) > 0.03)
+    })
+    n_unique = int(n_orders * 0.96)
+    customers = pd.DataFrame({
+        'customer_key': np.arange(1, n_orders + 1),
+        'customer_id': customer_ids,
+        'customer_unique_key': rng.integers(1, n_unique + 1, n_orders)
+    })
+    customers['customer_unique_id'] = hex_ids(n_unique, rng).to_numpy()[customers['customer_unique_key'] - 1]
+    products = pd.DataFrame({
+        'product_key': np.arange(1, n_products + 1),
+        'product_id': hex_ids(n_products, rng),
+        'product_category_name': pd.Series([f"category_{i}" for i in rng.integers(0, categories, n_products)],
+                                           dtype='string')
+    })
+    order_keys = rng.integers(1, n_orders + 1, n_items)
+    product_keys = rng.integers(1, n_products + 1, n_items)
+    items = pd.DataFrame({
+        'order_key': order_keys,
+        'order_id': order_ids.to_numpy()[order_keys - 1],
+        'product_key': product_keys,
+        'product_id': products['product_id'].to_numpy()[product_keys - 1],
+        'shipping_limit_date': purchase[order_keys - 1] + pd.Timedelta(days=3),
+        'price': rng.uniform(5, 500, n_items).round(2)
+    })
+    return orders, items, customers, products
+
+
+def make_payments(orders, seed=0):
+    # One to three payments for most orders, none for the rest
+    rng = np.random.default_rng(seed)
+    paid = orders['order_key'].to_numpy()[rng.random(len(orders)) > 0.02]
+    order_key = np.repeat(paid, rng.integers(1, 4, len(paid)))
+    return pd.DataFrame({
+        'order_key': order_key,
+        'payment_installments': pd.array(rng.integers(1, 11, len(order_key)), dtype='Int64')
+    })
+
+
+def assert_parity(actual, expected, rounded=()):
+    # Equal up to float summation order; the rounded columns (2 decimals) can land on the neighbouring hundredth
+    actual, expected = actual.reset_index(drop=True), expected.reset_index(drop=True)
+    rounded = [col for col in rounded if col in expected.columns]
+    pd.testing.assert_frame_equal(actual.drop(columns=rounded), expected.drop(columns=rounded),
+                                  check_exact=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(actual[rounded], expected[rounded], check_exact=False, rtol=0, atol=0.0100001)
+
+
+def assert_same_report(actual, expected):
+    # Summary and fact-table answers agree up to float summation order
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_exact=False, rtol=1e-9)
@@ -0,0 +1,25 @@
+import warnings
+
+import pandas as pd
+
+from src.aggregates import fold_delta, state_orders
+
+
+def test_state_orders_leave_out_states_without_customers():
+    # customer_state is categorical: states no customer lives in have no row, instead of a row of zero counts
+    customers = pd.DataFrame({
+        'customer_key': [1, 2, 3],
+        'customer_state': pd.Categorical(['SP', 'RJ', 'SP'], categories=['MG', 'RJ', 'SP'])
+    })
+    rows = pd.DataFrame({'customer_key': [1, 1, 2, 3], 'order_key': [10, 10, 11, 12]})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        states = state_orders(rows, rows, customers)
+        folded = fold_delta('agg_state_orders', states, states)
+
+    assert states.set_index('customer_state')[['order_count', 'customer_count']].to_dict('index') == {
+        'RJ': {'order_count': 1, 'customer_count': 1},
+        'SP': {'order_count': 2, 'customer_count': 2}
+    }
+    assert list(folded['customer_state']) == ['RJ', 'SP']
+    assert list(folded['order_count']) == [2, 4]
@@ -0,0 +1,65 @@
+import inspect
+import logging
+
+import pandas as pd
+
+from conftest import LOGGER, log_messages
+
+from src import chunked, geo_index
+from src.etl_processing import assign_cache_keys, build_stages, run_etl
+
+OUTPUTS = ['datasets']
+
+
+def _run(caplog):
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        return run_etl(LOGGER, outputs=OUTPUTS)
+
+
+def test_unchanged_stages_are_restored_from_the_cache(pipeline_dir, caplog):
+    first = _run(caplog)
+    assert not log_messages(caplog, 'Reusing cached')
+
+    second = _run(caplog)
+    assert len(log_messages(caplog, 'Reusing cached')) == len(build_stages(outputs=OUTPUTS))
+    assert not log_messages(caplog, 'Processing')
+    assert set(second) == set(first)
+    for name, df in first.items():
+        pd.testing.assert_frame_equal(second[name], df.reset_index(drop=True))
+
+
+def test_a_changed_input_reruns_its_stage_and_the_stages_after_it(pipeline_dir, caplog):
+    _run(caplog)
+    # Drop the last order: its items, payments and review still refer to it
+    orders_file = pipeline_dir / 'data' / 'raw' / 'olist_orders_dataset.csv'
+    lines = orders_file.read_text().splitlines(keepends=True)
+    orders_file.write_text(''.join(lines[:-1]))
+
+    processed_dfs = _run(caplog)
+    assert sorted(log_messages(caplog, 'Processing')) == [
+        'Processing olist_orders_dataset.csv...', 'Processing order_items...'
+    ]
+    assert len(processed_dfs['olist_orders_dataset.csv']) == len(lines) - 2
+    assert processed_dfs['olist_order_items_dataset.csv']['order_purchase_timestamp'].isna().any()
+
+
+def _stage_keys():
+    stages = build_stages(outputs=OUTPUTS)
+    assign_cache_keys(stages, LOGGER)
+    return {stage.name: stage.cache_key for stage in stages}
+
+
+def test_editing_a_helper_module_changes_the_keys_of_the_stages_using_it(pipeline_dir, monkeypatch):
+    before = _stage_keys()
+    getsource = inspect.getsource
+    edited = {geo_index}
+    monkeypatch.setattr(inspect, 'getsource', lambda obj: getsource(obj) + ('# edited' if obj in edited else ''))
+    after = _stage_keys()
+    assert [name for name in before if after[name] != before[name]] == ['olist_geolocation_dataset.csv']
+
+    # Every base stage can stream through chunked, and the order_items stage builds on two of them; only the
+    # validation of order_items reads its file whole
+    edited.add(chunked)
+    after = _stage_keys()
+    assert {name for name in before if after[name] != before[name]} == set(before) - {'order_items_validated'}
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.chunked import RowFingerprintSet, concat_chunks, process_in_chunks
+from src.storage import FrameWriter, read_frame
+
+
+def _points(rows=5_000, seed=0):
+    # Geolocation-like rows drawn from few distinct values, so duplicates fall in the same and in different chunks
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'geolocation_zip_code_prefix': rng.integers(1000, 1100, rows),
+        'geolocation_lat': rng.integers(0, 4, rows) / 10,
+        'geolocation_city': rng.choice(['sao paulo', 'rio de janeiro', 'curitiba'], rows)
+    })
+
+
+def _chunks(df, size):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+
+def test_fingerprints_keep_the_first_occurrence_across_chunks():
+    df = _points()
+    fingerprints = RowFingerprintSet()
+    kept = pd.concat([chunk[fingerprints.mark_new(chunk)] for chunk in _chunks(df, 128)])
+
+    pd.testing.assert_frame_equal(kept, df.drop_duplicates(keep='first'))
+    assert len(fingerprints) == len(kept)
+    # Runs are merged as they grow, so there are only a few of them however many chunks were seen
+    assert len(fingerprints.runs) <= np.log2(len(df))
+
+
+def test_streamed_output_matches_the_whole_frame(tmp_path):
+    df = _points()
+
+    def process(chunk):
+        return chunk.assign(geolocation_city=chunk['geolocation_city'].str.title())
+
+    path = tmp_path / 'points.parquet'
+    rows = process_in_chunks(_chunks(df, 300), process, FrameWriter(path, 'parquet'), dedupe_rows=True)
+
+    expected = process(df.drop_duplicates()).reset_index(drop=True)
+    assert rows == len(expected)
+    pd.testing.assert_frame_equal(read_frame(path, fmt='parquet'), expected)
+
+
+def test_streaming_no_rows_is_an_error(tmp_path):
+    with pytest.raises(ValueError, match='No rows read'):
+        process_in_chunks(iter([]), lambda chunk: chunk, FrameWriter(tmp_path / 'empty.parquet', 'parquet'))
+
+
+def test_concatenated_chunks_keep_their_categories():
+    chunks = [pd.DataFrame({'state': pd.Categorical(states)}) for states in [['SP', 'RJ'], ['MG', 'SP']]]
+    df = concat_chunks(chunks)
+    assert isinstance(df['state'].dtype, pd.CategoricalDtype)
+    assert df['state'].tolist() == ['SP', 'RJ', 'MG', 'SP']
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from src.date_keys import build_calendar, date_keys, easter_sunday
+from src.load_data import create_date_dimension
+
+ORDERS = 'olist_orders_dataset.csv'
+
+
+def _timestamps(rows=5_000, seed=0):
+    # Times of day over a century around the epoch (leap days, month and year ends), with some missing
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(-50 * 365 * 86_400, 50 * 365 * 86_400, rows)
+    timestamps = pd.Series(pd.to_datetime(seconds, unit='s'))
+    timestamps[rng.random(rows) < 0.05] = pd.NaT
+    edges = pd.Series(pd.to_datetime(['1969-12-31 23:59:59', '2016-02-29 00:00:00', '2000-12-31 12:00:00']))
+    return pd.concat([timestamps, edges], ignore_index=True)
+
+
+def test_date_keys_match_strftime():
+    timestamps = _timestamps()
+    keys = pd.Series(date_keys(timestamps), index=timestamps.index)
+
+    assert keys.dtype == 'Int64'
+    assert keys.isna().equals(timestamps.isna())
+    expected = timestamps.dropna().dt.strftime('%Y%m%d').astype(np.int64)
+    assert keys.dropna().astype(np.int64).equals(expected)
+
+
+def test_the_calendar_has_one_row_per_day():
+    calendar = build_calendar('2016-09-04 21:15:19', '2018-10-17 17:30:18')
+    dates = calendar['date']
+
+    assert dates.iloc[0] == pd.Timestamp('2016-09-04') and dates.iloc[-1] == pd.Timestamp('2018-10-17')
+    assert (dates.diff().dropna() == pd.Timedelta(days=1)).all()
+    assert calendar['date_id'].equals(dates.dt.strftime('%Y%m%d').astype(np.int64))
+    assert calendar['is_weekend'].tolist() == (dates.dt.day_name().isin(['Saturday', 'Sunday'])).astype(int).tolist()
+    assert calendar['week'].tolist() == dates.dt.isocalendar().week.astype(int).tolist()
+    assert calendar['month_name'].equals(dates.dt.month_name())
+
+
+def test_holidays_include_the_fixed_dates_and_good_friday():
+    assert [easter_sunday(year).strftime('%Y-%m-%d') for year in (2016, 2017, 2018)] == [
+        '2016-03-27', '2017-04-16', '2018-04-01']
+    calendar = build_calendar('2018-01-01', '2018-12-31').set_index('date_id')
+    holidays = calendar.index[calendar['is_holiday'] == 1].tolist()
+    assert holidays == [20180101, 20180330, 20180421, 20180501, 20180907, 20181012, 20181102, 20181115, 20181225]
+
+
+def test_every_order_date_key_has_a_calendar_row(processed_dfs):
+    orders = processed_dfs[ORDERS]
+    calendar = create_date_dimension(orders)
+    for column in ('order_purchase_timestamp', 'order_delivered_customer_date'):
+        keys = pd.Series(date_keys(orders[column])).dropna()
+        assert keys.isin(calendar['date_id']).all()
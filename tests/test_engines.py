@@ -0,0 +1,32 @@
+from conftest import assert_parity, make_frames, make_payments
+
+from src import duckdb_engine
+from src.etl_processing import ROLLING_WINDOWS, create_window_functions, enrich_order_items
+
+# The DuckDB engine must give the pandas engine's frames: same columns, row order and dtypes, values equal up
+# to float summation order. These columns are rounded to 2 decimals after the window is computed.
+ROUNDED = ['percent_of_total', 'category_mean', *(f'rolling_avg_{window_size}d' for window_size in ROLLING_WINDOWS)]
+
+
+def test_order_items_enrichment_matches_pandas():
+    orders, items, _, _ = make_frames()
+    payments = make_payments(orders)
+    expected = enrich_order_items(items, orders, payments)
+    assert_parity(duckdb_engine.enrich_order_items(items, orders, payments), expected)
+
+
+def test_window_functions_match_pandas():
+    orders, items, customers, products = make_frames()
+    expected = create_window_functions(orders, items, customers, products)
+    actual = duckdb_engine.create_window_functions(orders, items, customers, products, ROLLING_WINDOWS)
+    assert set(actual) == set(expected)
+    for name in expected:
+        assert_parity(actual[name], expected[name], ROUNDED)
+
+
+def test_engines_agree_on_processed_order_items(processed_dfs):
+    frames = [processed_dfs[f"olist_{name}_dataset.csv"] for name in ['orders', 'order_items', 'customers', 'products']]
+    expected = create_window_functions(*frames)
+    actual = duckdb_engine.create_window_functions(*frames, ROLLING_WINDOWS)
+    for name in expected:
+        assert_parity(actual[name], expected[name], ROUNDED)
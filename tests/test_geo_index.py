@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from src.geo_index import PREFIX_SPACE, ZipCentroidAccumulator, ZipCentroidIndex
+
+PREFIX = 'geolocation_zip_code_prefix'
+
+
+def _points(rows=5_000, seed=0):
+    # Geolocation rows over a few hundred prefixes, with some coordinates missing
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        PREFIX: rng.integers(1000, 1300, rows),
+        'geolocation_lat': rng.normal(-23.5, 1, rows),
+        'geolocation_lng': rng.normal(-46.6, 1, rows)
+    })
+    df.loc[rng.random(rows) < 0.05, 'geolocation_lat'] = np.nan
+    df.loc[rng.random(rows) < 0.05, 'geolocation_lng'] = np.nan
+    return df
+
+
+def _index(known):
+    # An index where each known prefix sits at latitude == prefix, so a lookup shows which prefix it resolved to
+    lat = np.full(PREFIX_SPACE, np.nan)
+    points = np.zeros(PREFIX_SPACE, dtype=np.int64)
+    lat[known] = known
+    points[known] = 1
+    return ZipCentroidIndex(lat, -lat, points)
+
+
+def test_centroids_match_a_groupby_mean():
+    df = _points()
+    index = ZipCentroidIndex.from_geolocation(df)
+    grouped = df.groupby(PREFIX)
+    means = grouped[['geolocation_lat', 'geolocation_lng']].mean()
+
+    np.testing.assert_allclose(index.lat[means.index], means['geolocation_lat'], rtol=1e-12)
+    np.testing.assert_allclose(index.lng[means.index], means['geolocation_lng'], rtol=1e-12)
+    np.testing.assert_array_equal(index.points[means.index], grouped.size())
+    # Prefixes without points have no centroid
+    assert index.points.sum() == len(df)
+    assert np.isnan(np.delete(index.lat, means.index)).all()
+
+
+def test_chunks_accumulate_to_the_whole_frame_index():
+    df = _points()
+    accumulator = ZipCentroidAccumulator()
+    for start in range(0, len(df), 700):
+        accumulator.add(df.iloc[start:start + 700])
+    chunked, whole = accumulator.index(), ZipCentroidIndex.from_geolocation(df)
+
+    np.testing.assert_allclose(chunked.lat, whole.lat, rtol=1e-12)
+    np.testing.assert_allclose(chunked.lng, whole.lng, rtol=1e-12)
+    np.testing.assert_array_equal(chunked.points, whole.points)
+
+
+def test_a_saved_index_loads_unchanged(tmp_path):
+    index = ZipCentroidIndex.from_geolocation(_points())
+    path = tmp_path / 'geo_index.npz'
+    index.save(path)
+    loaded = ZipCentroidIndex.load(path)
+
+    assert path.exists()
+    for name in ('lat', 'lng', 'points'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+
+
+def test_lookup_falls_back_to_the_nearest_prefix_of_the_sector():
+    index = _index(np.array([1203, 1207, 1250, 1305]))
+    prefixes = pd.Series([1203, 1205, 1206, 1299, 1300, 1100, None, -1, PREFIX_SPACE], dtype='Int64')
+
+    lat, lng = index.lookup(prefixes, fallback=False)
+    np.testing.assert_array_equal(lat, [1203] + [np.nan] * 8)
+    np.testing.assert_array_equal(lng, -lat)
+
+    # Ties go to the lower prefix, and an empty sector or an invalid prefix stays missing
+    lat, _ = index.lookup(prefixes, fallback=True)
+    np.testing.assert_array_equal(lat, [1203, 1203, 1207, 1250, 1305] + [np.nan] * 4)
+
+
+def test_enrich_adds_the_coordinates_to_a_copy():
+    index = _index(np.array([1203]))
+    sellers = pd.DataFrame({'seller_id': ['a', 'b'], 'seller_zip_code_prefix': [1203, 1204]})
+    enriched = index.enrich(sellers, 'seller_zip_code_prefix', fallback=True)
+
+    assert list(sellers.columns) == ['seller_id', 'seller_zip_code_prefix']
+    assert enriched['geolocation_lat'].tolist() == [1203, 1203]
+    assert enriched['geolocation_lng'].tolist() == [-1203, -1203]
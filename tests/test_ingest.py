@@ -0,0 +1,46 @@
+import pandas as pd
+
+from conftest import LOGGER
+
+from src.chunked import concat_chunks
+from src.etl_processing import run_etl
+from src.ingest import iter_csv, read_csv
+from src.models.data_schemas import SCHEMAS
+
+ORDERS = SCHEMAS['olist_orders_dataset.csv']
+HEADER = ('order_id,customer_id,order_status,order_purchase_timestamp,order_approved_at,'
+          'order_delivered_carrier_date,order_delivered_customer_date,order_estimated_delivery_date\n')
+ROWS = [
+    'a,c1,delivered,2017-10-02 10:56:33,2017-10-02 11:07:15,2017-10-04 19:55:00,2017-10-10 21:25:13,'
+    '2017-10-18 00:00:00',
+    # A date without its time, as in a hand-edited export
+    'b,c2,delivered,2017-10-03 09:00:00,2017-10-02,,,2017-10-20 00:00:00',
+    'c,c3,shipped,2017-10-04 08:00:00,,,,2017-10-21 00:00:00'
+]
+
+
+def test_malformed_timestamps_are_read_as_missing(tmp_path, caplog):
+    path = tmp_path / 'orders.csv'
+    path.write_text(HEADER + '\n'.join(ROWS) + '\n')
+
+    df = read_csv(path, ORDERS)
+    assert df['order_id'].tolist() == ['a', 'b', 'c']
+    assert df['order_purchase_timestamp'].dtype == 'datetime64[ns]'
+    assert df['order_approved_at'].tolist()[0] == pd.Timestamp('2017-10-02 11:07:15')
+    assert df['order_approved_at'].isna().tolist() == [False, True, True]
+    assert "1 values of order_approved_at don't match" in caplog.text
+
+    # Streamed: only the chunk holding the malformed value takes the slow path
+    pd.testing.assert_frame_equal(concat_chunks(list(iter_csv(path, ORDERS, chunksize=1))), df)
+
+
+def test_a_malformed_timestamp_does_not_fail_its_dataset(pipeline_dir):
+    orders_file = pipeline_dir / 'data' / 'raw' / 'olist_orders_dataset.csv'
+    orders = pd.read_csv(orders_file, dtype=str)
+    orders.loc[0, 'order_approved_at'] = orders.loc[0, 'order_approved_at'][:10]
+    orders.to_csv(orders_file, index=False)
+
+    processed_dfs = run_etl(LOGGER, outputs=['datasets'], targets=['olist_orders_dataset.csv'])
+    df = processed_dfs['olist_orders_dataset.csv']
+    assert len(df) == len(orders)
+    assert df['order_approved_at'].isna().iloc[0]
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from conftest import LOGGER
+
+from src.etl_processing import EXTRACT_STAGES, run_etl
+from src.key_registry import REGISTRY_DIR, KeyRegistry, attach_surrogate_keys
+from src.processed import load_processed
+
+ORDERS = 'olist_orders_dataset.csv'
+ITEMS = 'olist_order_items_dataset.csv'
+REVIEWS = 'olist_order_reviews_dataset.csv'
+
+
+def test_surrogates_are_stable_across_saves(tmp_path):
+    registry = KeyRegistry(tmp_path)
+    assert list(registry.encode('order_id', ['b', 'a', 'b'])) == [1, 2, 1]
+    registry.save()
+
+    reloaded = KeyRegistry(tmp_path)
+    surrogates = reloaded.encode('order_id', pd.Series(['a', None, 'c'], dtype='string'))
+    assert surrogates.tolist() == [2, pd.NA, 3]
+    assert list(reloaded.decode('order_id', [3, 1])) == ['c', 'b']
+    assert reloaded.generation() == registry.generation()
+    assert KeyRegistry(tmp_path / 'other').generation() != registry.generation()
+
+
+def _order_keys_match(processed_dfs):
+    orders = processed_dfs[ORDERS].set_index('order_id')['order_key']
+    items = processed_dfs[ITEMS]
+    return (items['order_id'].map(orders) == items['order_key']).all()
+
+
+def test_a_new_registry_invalidates_the_cached_outputs(pipeline_dir):
+    assert _order_keys_match(run_etl(LOGGER, outputs=['datasets']))
+
+    # A rebuilt registry hands out keys in another order: here the order_ids of the reviews come first
+    for path in REGISTRY_DIR.iterdir():
+        path.unlink()
+    reviews_file = pipeline_dir / 'data' / 'raw' / REVIEWS
+    header, *rows = reviews_file.read_text().splitlines(keepends=True)
+    reviews_file.write_text(header + ''.join(pd.Series(rows).sample(frac=1, random_state=0)))
+    run_etl(LOGGER, outputs=['datasets'], targets=[EXTRACT_STAGES[REVIEWS]])
+
+    processed_dfs = run_etl(LOGGER, outputs=['datasets'])
+    assert _order_keys_match(processed_dfs)
+    assert _order_keys_match(attach_surrogate_keys(load_processed()))
+
+
+def test_loading_outputs_of_another_registry_fails(pipeline_dir):
+    run_etl(LOGGER, outputs=['datasets'])
+    for path in REGISTRY_DIR.iterdir():
+        path.unlink()
+    # Every order_key of the new registry is one off
+    registry = KeyRegistry()
+    registry.encode('order_id', ['0' * 32])
+    registry.save()
+
+    with pytest.raises(ValueError, match='order_key.* of another key registry'):
+        attach_surrogate_keys(load_processed())
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import inspect, text
+
+from conftest import LOGGER, assert_same_report
+
+from src.load_data import create_warehouse_engine, load_to_sql_server, read_ddl, read_load_version
+from src.reports import REPORTS, ReportService
+
+ITEMS = 'olist_order_items_dataset.csv'
+
+
+def _load(processed_dfs, warehouse, **kwargs):
+    # load_to_sql_server logs a failed load instead of raising; it returns the load stats only on success
+    stats = load_to_sql_server(processed_dfs, warehouse, LOGGER, **kwargs)
+    assert stats is not None, "the load failed"
+    return stats
+
+
+def _fact_price_total(warehouse):
+    engine = create_warehouse_engine(warehouse)
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT SUM(price) FROM dw.fact_order_items")).scalar()
+    finally:
+        engine.dispose()
+
+
+def _assert_summaries_match_fact(warehouse):
+    # The summary tables maintained by the load answer the reports like the fact table
+    service = ReportService(warehouse)
+    try:
+        for name in REPORTS:
+            assert_same_report(service.run(name), service.run(name, summary=False))
+    finally:
+        service.close()
+
+
+def test_replace_load_swaps_in_tables_with_their_ddl_keys_and_indexes(processed_dfs, warehouse):
+    # The second load swaps over tables that already exist and reference each other
+    for _ in range(2):
+        stats = _load(processed_dfs, warehouse)
+        assert stats['fact_order_items']['inserted'] == len(processed_dfs[ITEMS])
+
+    tables, indexes = read_ddl()
+    engine = create_warehouse_engine(warehouse)
+    try:
+        with engine.connect() as conn:
+            inspector = inspect(conn)
+            loaded = inspector.get_table_names(schema='dw')
+            assert not [table for table in loaded if table.startswith('stg_')]
+            assert conn.execute(text("SELECT COUNT(*) FROM dw.fact_order_items")).scalar() == len(processed_dfs[ITEMS])
+            for table_name, table_indexes in indexes.items():
+                assert {name for name, _ in table_indexes} <= {
+                    index['name'] for index in inspector.get_indexes(table_name, schema='dw')
+                }
+            referenced = {key['referred_table'] for key in inspector.get_foreign_keys('fact_order_items', schema='dw')}
+            assert referenced == {'dim_products', 'dim_sellers', 'dim_customers', 'dim_date'}
+            assert inspector.get_pk_constraint('fact_order_items', schema='dw')['constrained_columns'] == [
+                'order_key', 'order_item_id'
+            ]
+            assert read_load_version(conn) == 2
+    finally:
+        engine.dispose()
+    assert set(tables) - {'etl_error_log', 'etl_watermark', 'etl_load_version'} <= set(loaded)
+    _assert_summaries_match_fact(warehouse)
+
+
+def test_incremental_load_merges_changed_items(processed_dfs, warehouse, repriced):
+    _load(processed_dfs, warehouse)
+    # Items of the last week's orders, inside the incremental lookback from the watermark
+    purchased = processed_dfs[ITEMS]['order_purchase_timestamp']
+    changed = repriced(processed_dfs, (purchased > purchased.max() - pd.Timedelta(days=7)).to_numpy())
+
+    stats = _load(changed, warehouse, mode='incremental')
+    assert stats['fact_order_items']['updated'] > 0
+    assert _fact_price_total(warehouse) == pytest.approx(changed[ITEMS]['price'].sum(), rel=1e-9)
+    _assert_summaries_match_fact(warehouse)
+
+
+def test_partitions_load_replaces_only_the_given_months(processed_dfs, warehouse, repriced):
+    _load(processed_dfs, warehouse)
+    purchased = processed_dfs[ITEMS]['order_purchase_timestamp']
+    item_months = (purchased.dt.year * 100 + purchased.dt.month).to_numpy()
+    month = int(np.median(item_months))
+    changed = repriced(processed_dfs, item_months == month)
+
+    stats = _load(changed, warehouse, mode='partitions', months=[month])
+    assert stats['fact_order_items']['inserted'] == (item_months == month).sum()
+    # Every other month kept the rows of the first load, which had the same prices
+    assert _fact_price_total(warehouse) == pytest.approx(changed[ITEMS]['price'].sum(), rel=1e-9)
+    _assert_summaries_match_fact(warehouse)
@@ -0,0 +1,58 @@
+import logging
+
+import pandas as pd
+
+from conftest import LOGGER, log_messages
+
+from src.etl_processing import run_etl
+from src.partitions import PARTITIONED, partition_months, partition_path, read_partitions
+
+ORDER_ITEMS = 'olist_order_items_dataset.csv'
+SORT_KEYS = {
+    'olist_orders_dataset.csv': ['order_id'],
+    'olist_order_items_dataset.csv': ['order_id', 'order_item_id'],
+    'olist_order_payments_dataset.csv': ['order_id', 'payment_sequential'],
+    'olist_order_reviews_dataset.csv': ['review_id']
+}
+
+
+def _run(caplog, **kwargs):
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        return run_etl(LOGGER, **kwargs)
+
+
+def _sorted(df, filename):
+    return df.sort_values(SORT_KEYS[filename]).reset_index(drop=True)
+
+
+def test_months_built_apart_match_the_full_history(pipeline_dir, caplog):
+    processed_dfs = _run(caplog, outputs=['datasets', 'partitions'])
+    assert len(log_messages(caplog, 'Processing purchase_month=')) == len(partition_months(ORDER_ITEMS))
+    for filename in PARTITIONED:
+        pd.testing.assert_frame_equal(_sorted(read_partitions(filename), filename),
+                                      _sorted(processed_dfs[filename], filename), check_like=True)
+
+
+def test_a_changed_month_is_rebuilt_alone(pipeline_dir, caplog):
+    _run(caplog, outputs=['partitions'])
+    months = [month for month in partition_months(ORDER_ITEMS) if month]
+    month = months[len(months) // 2]
+    untouched = {m: partition_path(ORDER_ITEMS, m).stat().st_mtime_ns for m in months if m != month}
+
+    # Reprice one item of that month in the raw file
+    item = read_partitions(ORDER_ITEMS, month, month).iloc[0]
+    items_file = pipeline_dir / 'data' / 'raw' / ORDER_ITEMS
+    items = pd.read_csv(items_file, dtype=str)
+    row = (items['order_id'] == item['order_id']) & (items['order_item_id'] == str(item['order_item_id']))
+    items.loc[row, 'price'] = str(item['price'] + 1)
+    items.to_csv(items_file, index=False)
+
+    # A backfill of that month, and a full run after it, process only that month
+    _run(caplog, outputs=['partitions'], months=[month])
+    assert log_messages(caplog, 'Processing purchase_month=') == [f"Processing purchase_month={month}..."]
+    rebuilt = read_partitions(ORDER_ITEMS, month, month).set_index(['order_id', 'order_item_id'])
+    assert rebuilt.loc[(item['order_id'], item['order_item_id']), 'price'] == item['price'] + 1
+    _run(caplog, outputs=['partitions'])
+    assert not log_messages(caplog, 'Processing purchase_month=')
+    assert {m: partition_path(ORDER_ITEMS, m).stat().st_mtime_ns for m in untouched} == untouched
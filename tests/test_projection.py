@@ -0,0 +1,30 @@
+import pandas as pd
+
+from conftest import LOGGER
+
+from src.etl_processing import run_etl
+from src.processed import OUTPUT_DIR, load_clean_output, load_processed, output_name
+from src.storage import frame_path
+
+ORDERS = 'olist_orders_dataset.csv'
+ORDER_ITEMS = 'olist_order_items_dataset.csv'
+
+
+def test_a_projected_run_leaves_the_clean_outputs_alone(pipeline_dir):
+    full = run_etl(LOGGER, outputs=['datasets'])
+    written_by_full_run = load_processed([ORDERS, ORDER_ITEMS])
+    projected = run_etl(LOGGER, outputs=['fact'])
+    assert set(projected[ORDER_ITEMS].columns) < set(full[ORDER_ITEMS].columns)
+
+    # The partial frames are written under their own names (without the surrogate keys assigned afterwards),
+    # and cache hits read them back from there
+    for filename in (ORDERS, ORDER_ITEMS):
+        assert frame_path(OUTPUT_DIR, output_name(filename, projected=True)).exists()
+        written = load_clean_output(filename, projected=True)
+        pd.testing.assert_frame_equal(written, projected[filename][written.columns], check_categorical=False)
+    assert frame_path(OUTPUT_DIR, output_name(ORDER_ITEMS, 'validated', projected=True)).exists()
+
+    # What a load reads is still the full run's output
+    loaded = load_processed([ORDERS, ORDER_ITEMS])
+    for filename in (ORDERS, ORDER_ITEMS):
+        pd.testing.assert_frame_equal(loaded[filename], written_by_full_run[filename])
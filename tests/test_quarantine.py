@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from conftest import LOGGER
+
+from src import validation
+from src.etl_processing import run_etl
+from src.load_data import create_warehouse_engine, load_to_sql_server
+from src.quarantine import REASON_COLUMN, read_quarantine
+
+REVIEWS = 'olist_order_reviews_dataset.csv'
+
+
+def _break_reviews(pipeline_dir, count=2):
+    # Scores out of range for the first reviews whose id isn't duplicated; returns their ids
+    reviews_file = pipeline_dir / 'data' / 'raw' / REVIEWS
+    reviews = pd.read_csv(reviews_file, dtype=str, keep_default_na=False)
+    broken = reviews.index[~reviews['review_id'].duplicated(keep=False)][:count]
+    reviews.loc[broken, 'review_score'] = '9'
+    reviews.to_csv(reviews_file, index=False)
+    return set(reviews.loc[broken, 'review_id'])
+
+
+def test_failing_rows_are_quarantined_and_logged_once(pipeline_dir, warehouse):
+    broken = _break_reviews(pipeline_dir)
+    processed_dfs = run_etl(LOGGER, outputs=['datasets'])
+
+    assert not broken & set(processed_dfs[REVIEWS]['review_id'])
+    quarantined = read_quarantine()[REVIEWS]
+    assert set(quarantined['review_id']) == broken
+    assert quarantined[REASON_COLUMN].str.startswith('review_score failed less_than_or_equal_to').all()
+
+    # The second load of the same run finds the rows already in the error log
+    for _ in range(2):
+        assert load_to_sql_server(processed_dfs, warehouse, LOGGER) is not None
+    engine = create_warehouse_engine(warehouse)
+    try:
+        with engine.connect() as conn:
+            logged = conn.execute(text("SELECT table_name, error_message FROM dw.etl_error_log")).fetchall()
+    finally:
+        engine.dispose()
+    assert len(logged) == len(broken)
+    assert {table_name for table_name, _ in logged} == {REVIEWS}
+    assert all(any(review_id in message for review_id in broken) for _, message in logged)
+
+
+# The worker's SchemaError is pickled back to the main process
+@pytest.mark.filterwarnings('ignore:Pickling SchemaError')
+def test_raise_mode_fails_only_the_dataset(pipeline_dir, monkeypatch):
+    _break_reviews(pipeline_dir)
+    monkeypatch.setattr(validation, 'FAILURE_MODE', 'raise')
+
+    processed_dfs = run_etl(LOGGER, outputs=['datasets'], use_cache=False)
+    assert REVIEWS not in processed_dfs
+    assert 'olist_orders_dataset.csv' in processed_dfs
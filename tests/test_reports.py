@@ -0,0 +1,27 @@
+import numpy as np
+
+from conftest import LOGGER, assert_same_report
+
+from src.load_data import load_to_sql_server
+from src.reports import ReportService
+
+
+def test_reload_invalidates_cached_reports(processed_dfs, warehouse, repriced):
+    load_to_sql_server(processed_dfs, warehouse, LOGGER)
+    service = ReportService(warehouse)
+    try:
+        before = service.run('category_sales')
+        assert_same_report(service.run('category_sales'), before)
+        assert (service.cache.hits, service.cache.misses) == (1, 1)
+
+        # The reload bumps the load version: the next call misses, sees the new prices and drops the old entry
+        items = processed_dfs['olist_order_items_dataset.csv']
+        repriced_dfs = repriced(processed_dfs, np.ones(len(items), dtype=bool))
+        assert load_to_sql_server(repriced_dfs, warehouse, LOGGER) is not None
+        after = service.run('category_sales')
+        assert service.cache.misses == 2
+        assert not np.allclose(before['total_sales'], after['total_sales'])
+        assert_same_report(after, service.run('category_sales', summary=False))
+        assert {key[0] for key in service.cache.entries} == {service.version}
+    finally:
+        service.close()
@@ -0,0 +1,55 @@
+import logging
+
+import pandas as pd
+
+from conftest import LOGGER, log_messages
+
+from src import running_totals
+from src.etl_processing import run_etl
+from src.processed import OUTPUT_DIR
+from src.running_totals import read_customer_sales
+from src.storage import frame_path
+
+OUTPUTS = ['window_functions']
+NEW_ORDERS = 0.03
+
+
+def _run(caplog):
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        run_etl(LOGGER, outputs=OUTPUTS)
+    return read_customer_sales()
+
+
+def test_incremental_and_full_runs_give_the_same_customer_sales(pipeline_dir, caplog, monkeypatch):
+    # The first run sees all but the latest orders (in every file); the second continues the state with them
+    raw_dir = pipeline_dir / 'data' / 'raw'
+    files = {path: pd.read_csv(path, dtype=str) for path in raw_dir.glob('*.csv')}
+    files = {path: df for path, df in files.items() if 'order_id' in df.columns}
+    orders = files[raw_dir / 'olist_orders_dataset.csv']
+    latest = orders.sort_values('order_purchase_timestamp')['order_id'].iloc[-int(len(orders) * NEW_ORDERS):]
+    for path, df in files.items():
+        df[~df['order_id'].isin(latest)].to_csv(path, index=False)
+    _run(caplog)
+    for path, df in files.items():
+        df.to_csv(path, index=False)
+
+    incremental = _run(caplog)
+    assert log_messages(caplog, 'Updated customer_sales for')
+    assert len(pd.read_parquet(frame_path(OUTPUT_DIR, 'window_customer_sales_delta')))
+    # The base alone is out of date, so it isn't named as the result
+    assert not frame_path(OUTPUT_DIR, 'window_customer_sales').exists()
+
+    # A full recompute over the same inputs is not a cache hit of the incremental run
+    monkeypatch.setattr(running_totals, 'INCREMENTAL', False)
+    full = _run(caplog)
+    assert not log_messages(caplog, 'Reusing cached window functions')
+    assert not frame_path(OUTPUT_DIR, 'window_customer_sales_base').exists()
+    pd.testing.assert_frame_equal(incremental, full)
+
+    # Back to the incremental mode: its cached outputs are restored, and the full table of the other mode removed
+    monkeypatch.setattr(running_totals, 'INCREMENTAL', True)
+    restored = _run(caplog)
+    assert log_messages(caplog, 'Reusing cached window functions')
+    assert not frame_path(OUTPUT_DIR, 'window_customer_sales').exists()
+    pd.testing.assert_frame_equal(restored, full)
@@ -0,0 +1,36 @@
+import logging
+
+from src.scheduler import Stage, run_stages
+
+
+def _value(value):
+    return value
+
+
+def _add(left, right):
+    return left + right
+
+
+def _fail():
+    raise ValueError("bad input")
+
+
+def test_failures_are_isolated_to_the_stage_and_its_dependents():
+    stages = [
+        Stage('a', _value, args=(1,)),
+        Stage('b', _value, args=(2,)),
+        Stage('failing', _fail),
+        Stage('sum', _add, deps=['a', 'b']),
+        Stage('after_failing', _add, deps=['failing', 'a']),
+        Stage('rejected', _value, args=(3,)),
+        Stage('after_rejected', _add, deps=['rejected', 'a'])
+    ]
+
+    def on_result(stage, result):
+        # Like the key registry refusing a result: the callback raises in the parent process
+        if stage.name == 'rejected':
+            raise ValueError("cannot assign keys")
+        return result * 10
+
+    results = run_stages(stages, max_workers=2, logger=logging.getLogger(), on_result=on_result)
+    assert results == {'a': 10, 'b': 20, 'sum': 300}
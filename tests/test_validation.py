@@ -0,0 +1,114 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+import pytest
+from pandera.typing import Series
+
+from src import validation
+from src.models.olist_model import OlistOrderItemsModel, OlistOrderReviewsModel
+from src.validation import CompiledSchema, compile_model, validate
+
+
+def make_reviews(rows=500, seed=0):
+    # Frame with the dtypes process_order_reviews hands to validation
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 700 * 86_400, rows), unit='s')
+    return pd.DataFrame({
+        'review_id': pd.Series([f"{i:032x}" for i in range(rows)], dtype='string'),
+        'order_id': pd.Series([f"{i:032x}" for i in rng.integers(0, 2 ** 62, rows)], dtype='string'),
+        'review_score': pd.Series(rng.integers(1, 6, rows), dtype='Int64'),
+        'review_comment_title': pd.Series([''] * rows, dtype='string'),
+        'review_comment_message': pd.Series([''] * rows, dtype='string'),
+        'review_creation_date': timestamps,
+        'review_answer_timestamp': timestamps
+    })
+
+
+def break_rows(df):
+    df.loc[[1, 5], 'review_score'] = 9
+    df.loc[5, 'review_creation_date'] = pd.NaT
+    df.loc[7, 'review_id'] = df.loc[3, 'review_id']
+    return df
+
+
+class EvenScoreModel(pa.DataFrameModel):
+    score: Series[int] = pa.Field(ge=0)
+
+    @pa.check('score')
+    def even(cls, series):
+        return series % 2 == 0
+
+
+def test_compiled_checks_flag_the_broken_rows_like_pandera():
+    df = break_rows(make_reviews())
+    compiled = CompiledSchema(OlistOrderReviewsModel)
+    assert compiled.supported
+    fallback = CompiledSchema(OlistOrderReviewsModel)
+    fallback.supported = False
+
+    assert sorted(compiled.row_failures(df).index) == [1, 5, 7]
+    # Pandera also flags the first of the duplicated review_ids; the compiled check keeps it, like drop_duplicates
+    assert sorted(fallback.row_failures(df).index) == [1, 3, 5, 7]
+    with pytest.raises(pa.errors.SchemaError, match='review_score'):
+        compiled.validate(df, 'full')
+    with pytest.raises(pa.errors.SchemaError):
+        OlistOrderReviewsModel.validate(df)
+    # Schema-only validation looks at names and dtypes, not values
+    assert compiled.validate(df, 'schema') is df
+
+
+def test_structural_failures_raise_at_every_level():
+    df = make_reviews().drop(columns=['review_score'])
+    for level in validation.VALIDATION_LEVELS:
+        with pytest.raises(pa.errors.SchemaError, match="column 'review_score' not in dataframe"):
+            validate(OlistOrderReviewsModel, df, level=level, use_cache=False, failures='quarantine')
+    # Except for the columns a projected read left out
+    with validation.projected():
+        validate(OlistOrderReviewsModel, df, use_cache=False, failures='raise')
+
+
+def test_sampled_level_checks_only_the_sampled_rows():
+    df = make_reviews()
+    sampled = compile_model(OlistOrderReviewsModel)._checked_positions(df, 'sampled')
+    assert len(sampled) == round(len(df) * validation.SAMPLE_FRACTION)
+    outside = np.setdiff1d(np.arange(len(df)), sampled)
+
+    df.loc[outside[0], 'review_score'] = 9
+    validate(OlistOrderReviewsModel, df, level='sampled', use_cache=False, failures='raise')
+    df.loc[sampled[0], 'review_score'] = 9
+    with pytest.raises(pa.errors.SchemaError):
+        validate(OlistOrderReviewsModel, df, level='sampled', use_cache=False, failures='raise')
+
+
+def test_the_cache_is_used_by_default_only_for_models_pandera_validates(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(validation, 'VALIDATION_CACHE_DIR', tmp_path)
+    caplog.set_level(logging.INFO)
+
+    # Every model in the repo is compiled; for those a cache hit costs more than the checks
+    items = pd.DataFrame({
+        'order_id': pd.Series(['a', 'b'], dtype='string'),
+        'order_item_id': pd.Series([1, 1], dtype='Int64'),
+        'product_id': pd.Series(['p', 'q'], dtype='string'),
+        'seller_id': pd.Series(['s', 's'], dtype='string'),
+        'shipping_limit_date': pd.to_datetime(['2017-10-02', '2017-10-03']),
+        'price': [10.0, 20.0],
+        'freight_value': [1.0, 2.0]
+    })
+    validate(OlistOrderItemsModel, items, failures='raise')
+    assert not list(tmp_path.iterdir())
+    validate(OlistOrderItemsModel, items, use_cache=True, failures='raise')
+    assert len(list(tmp_path.iterdir())) == 1
+
+    scores = pd.DataFrame({'score': [2, 4, 6]})
+    assert not compile_model(EvenScoreModel).supported
+    validate(EvenScoreModel, scores, failures='raise')
+    assert len(list(tmp_path.iterdir())) == 2
+    validate(EvenScoreModel, scores, failures='raise')
+    assert "Reusing validation of EvenScoreModel" in caplog.text
+
+    # A frame that fails isn't marked, so it is checked again next time
+    with pytest.raises(pa.errors.SchemaError):
+        validate(EvenScoreModel, pd.DataFrame({'score': [1]}), failures='raise')
+    assert len(list(tmp_path.iterdir())) == 2
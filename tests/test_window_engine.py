@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from conftest import assert_parity, make_frames
+
+from src.etl_processing import ROLLING_WINDOWS, create_window_functions
+from src.window_engine import (SortedGroups, grouped_cumsum, grouped_dense_rank, grouped_mean, grouped_total,
+                               rolling_means, sort_codes, sorted_order)
+
+ROUNDED = ['percent_of_total', 'category_mean', *(f'rolling_avg_{size}d' for size in ROLLING_WINDOWS)]
+
+
+def reference_window_functions(orders_df, order_items_df, customers_df, products_df):
+    # The groupby / transform(lambda) version create_window_functions replaced, joining on the ids as it did
+    customer_orders = (
+        order_items_df
+        .merge(orders_df[['order_id', 'customer_id']], on='order_id')
+        .merge(customers_df[['customer_id', 'customer_unique_id']], on='customer_id')
+        .sort_values(['customer_unique_id', 'shipping_limit_date'])
+    )
+    by_customer = customer_orders.groupby('customer_unique_id')['price']
+    customer_orders['cumulative_sales'] = by_customer.cumsum()
+    customer_orders['total_customer_sales'] = by_customer.transform('sum')
+    customer_orders['percent_of_total'] = (
+            customer_orders['cumulative_sales'] / customer_orders['total_customer_sales'] * 100).round(2)
+    customer_orders['price_rank'] = by_customer.rank(method='dense', ascending=False)
+
+    orders = orders_df.dropna(subset=['order_delivered_customer_date', 'order_purchase_timestamp']).copy()
+    orders['delivery_time_days'] = (
+            (orders['order_delivered_customer_date'] - orders['order_purchase_timestamp']).dt.total_seconds() / 86_400)
+    category_delivery = (
+        order_items_df[['order_id', 'product_id']]
+        .merge(products_df[['product_id', 'product_category_name']], on='product_id')
+        .merge(orders.loc[orders['delivery_time_days'] > 0, ['order_id', 'delivery_time_days']], on='order_id')
+        .sort_values(['product_category_name', 'delivery_time_days'])
+    )
+    by_category = category_delivery.groupby('product_category_name')['delivery_time_days']
+    for window_size in ROLLING_WINDOWS:
+        category_delivery[f'rolling_avg_{window_size}d'] = by_category.transform(
+            lambda x: x.rolling(window=window_size, min_periods=1).mean().round(2))
+    category_delivery['category_mean'] = by_category.transform('mean').round(2)
+    return {
+        'customer_sales': customer_orders[['customer_unique_id', 'order_id', 'price', 'cumulative_sales',
+                                           'total_customer_sales', 'percent_of_total', 'price_rank']],
+        'category_delivery_time': category_delivery
+    }
+
+
+def _groups(rows=3_000, seed=0):
+    # Sorted group keys with groups of one row up to a few hundred, and values with ties inside groups
+    rng = np.random.default_rng(seed)
+    keys = np.sort(rng.integers(0, 40, rows) ** 2)
+    values = rng.integers(0, 50, rows) / 4
+    return keys, values, SortedGroups(keys)
+
+
+def test_window_functions_match_the_groupby_version():
+    orders, items, customers, products = make_frames()
+    expected = reference_window_functions(orders, items, customers, products)
+    actual = create_window_functions(orders, items, customers, products)
+    for name, df in expected.items():
+        assert_parity(actual[name], df, rounded=ROUNDED)
+
+
+def test_grouped_windows_match_pandas_groupby():
+    keys, values, groups = _groups()
+    by_key = pd.Series(values).groupby(keys)
+
+    for window_size, means in zip(ROLLING_WINDOWS, rolling_means(values, groups, ROLLING_WINDOWS)):
+        expected = by_key.transform(lambda x: x.rolling(window_size, min_periods=1).mean())
+        np.testing.assert_allclose(means, expected, rtol=1e-12)
+    np.testing.assert_allclose(grouped_mean(values, groups), by_key.transform('mean'), rtol=1e-12)
+    np.testing.assert_array_equal(grouped_cumsum(values, groups), by_key.cumsum())
+    np.testing.assert_array_equal(grouped_total(values, groups), by_key.transform('sum'))
+    for ascending in (True, False):
+        np.testing.assert_array_equal(grouped_dense_rank(values, groups, ascending=ascending),
+                                      by_key.rank(method='dense', ascending=ascending))
+
+
+def test_a_continued_cumsum_matches_one_over_all_rows():
+    keys, values, groups = _groups()
+    split = groups.starts + groups.lengths // 2
+    first = np.concatenate([np.arange(start, end) for start, end in zip(groups.starts, split)])
+    rest = np.setdiff1d(np.arange(len(keys)), first)
+    head = SortedGroups(keys[first])
+    sums, compensations = grouped_cumsum(values[first], head, return_compensation=True)
+
+    tail = SortedGroups(keys[rest])
+    known = np.isin(keys[rest][tail.starts], keys[first][head.starts])
+    initial = np.zeros(len(tail.starts)), np.zeros(len(tail.starts))
+    initial[0][known], initial[1][known] = sums[head.ends], compensations[head.ends]
+    np.testing.assert_array_equal(grouped_cumsum(values[rest], tail, initial=initial),
+                                  grouped_cumsum(values, groups)[rest])
+
+
+def test_sort_codes_order_like_the_values():
+    values = pd.Series(['b', 'a', None, 'c', 'a', 'B'], dtype='string')
+    ordered = values.iloc[np.argsort(sort_codes(values), kind='stable')]
+    # Missing values last
+    assert ordered.tolist()[:-1] == ['B', 'a', 'a', 'b', 'c'] and ordered.isna().iloc[-1]
+
+    dates = pd.Series(pd.to_datetime(['2018-01-02', '2018-01-01', '2018-01-01', '2017-12-31']))
+    order = sorted_order(sort_codes(pd.Series(['x', 'y', 'x', 'y'])), dates.to_numpy())
+    assert order.tolist() == [2, 0, 3, 1]